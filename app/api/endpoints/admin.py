@@ -1,24 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from typing import List, Optional
 from datetime import datetime, timedelta
 from ...db.mongodb import MongoDB
+from ...db.indexes import already_taken
+from ...db.events import ALL_EVENTS, backfill_event_ids, event_scope
 from ...db.models.user import UserInDB
 from ...db.models.discount import DiscountCreate, Discount
+from ...db.models.booking import BookingStatus
+from ...db.models.cancellation import CancellationSelector, CancellationJob
+from ...db.query_stats import query_stats, explain_shape
+from ...core.startup import startup_profile
+from ...core.priority import load_monitor
+from ...services.cache_service import invalidation_bus
+from ...services.booking_service import backfill_pass_rules
+from ...services.sales_summary_service import get_staff_totals, backfill
+from ...services.import_service import start_import, JOBS_COLLECTION
+from ...services.lifecycle_service import lifecycle_scheduler
+from ...services.scan_log_service import scan_log, SCAN_EVENTS_COLLECTION
+from ...services.mass_cancel_service import mass_cancellation, JOBS_COLLECTION as CANCELLATION_JOBS
+from ...services.phone_lookup_service import phone_lookup_service
+from ...services.timeseries_service import timeseries_service, GRANULARITIES, GROUP_BY, MAX_BUCKETS
 from ..endpoints.auth import get_current_user
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
+def get_analytics_db(response: Response):
+    """
+    Serve reporting reads from secondaries and tell the client how stale they may be
+    """
+    response.headers["X-Read-Preference"] = "secondaryPreferred"
+    response.headers["X-Data-Staleness-Seconds"] = f"{MongoDB.replication_lag():.1f}"
+    return MongoDB.get_analytics_db()
+
 @router.get("/users", response_model=List[UserInDB])
 async def list_users(
     current_user: UserInDB = Depends(get_current_user),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    db = Depends(get_analytics_db)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db = MongoDB.get_db()
     users = await db["users"].find().skip(skip).limit(limit).to_list(None)
     return users
 
@@ -26,60 +51,34 @@ async def list_users(
 async def get_staff_sales_report(
     current_user: UserInDB = Depends(get_current_user),
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None,
+    db = Depends(get_analytics_db)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db = MongoDB.get_db()
-    
-    # Build query
-    query = {}
-    if start_date or end_date:
-        query["sale_time"] = {}
-        if start_date:
-            query["sale_time"]["$gte"] = start_date
-        if end_date:
-            query["sale_time"]["$lte"] = end_date
-    
-    # Aggregate sales by staff
-    pipeline = [
-        {"$match": query},
-        {
-            "$group": {
-                "_id": "$staff_id",
-                "total_sales": {"$sum": 1},
-                "total_amount": {"$sum": "$amount_paid"},
-                "total_discount": {
-                    "$sum": {
-                        "$multiply": ["$amount_paid", "$discount_applied"]
-                    }
-                }
-            }
-        },
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "_id",
-                "foreignField": "_id",
-                "as": "staff_info"
-            }
-        }
-    ]
+    # Read per-staff totals from the materialized daily summaries
+    return await get_staff_totals(db, start_date, end_date)
+
+@router.post("/staff-sales/backfill")
+async def backfill_staff_sales(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    staff_sales = await db["staff_sales"].aggregate(pipeline).to_list(None)
-    return staff_sales
+    db = MongoDB.get_db()
+    summaries = await backfill(db)
+    return {"success": True, "summaries": summaries}
 
 @router.get("/stats")
 async def get_stats(
     current_user: UserInDB = Depends(get_current_user),
-    period: str = "today"  # today, week, month, all
+    period: str = "today",  # today, week, month, all
+    event_id: Optional[str] = None,
+    db = Depends(get_analytics_db)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db = MongoDB.get_db()
-    
     # Calculate date range
     end_date = datetime.utcnow()
     if period == "today":
@@ -95,6 +94,7 @@ async def get_stats(
     pipeline = [
         {
             "$match": {
+                **event_scope(event_id),
                 "created_at": {
                     "$gte": start_date,
                     "$lte": end_date
@@ -146,6 +146,44 @@ async def get_stats(
         "offline_bookings": 0
     }
 
+@router.get("/stats/timeseries")
+async def get_stats_timeseries(
+    current_user: UserInDB = Depends(get_current_user),
+    granularity: str = "hour",  # hour, day
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    group_by: Optional[str] = None,  # pass_type, sold_by
+    event_id: Optional[str] = None,
+    db = Depends(get_analytics_db)
+):
+    """
+    Sales, revenue and entries per bucket, optionally split by pass type or
+    seller. Settled buckets are served from memory.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Granularity must be hour or day")
+    if group_by is not None and group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail="group_by must be pass_type or sold_by")
+    
+    end = end or datetime.now()
+    start = start or end - GRANULARITIES[granularity] * (24 if granularity == "hour" else 30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    if (end - start) / GRANULARITIES[granularity] > MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BUCKETS} buckets per request")
+    
+    buckets = await timeseries_service.series(db, granularity, start, end, group_by, event_id)
+    return {
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "group_by": group_by,
+        "buckets": buckets
+    }
+
 @router.post("/discounts", response_model=Discount)
 async def create_discount(
     discount: DiscountCreate,
@@ -156,13 +194,6 @@ async def create_discount(
     
     db = MongoDB.get_db()
     
-    # Check if discount code already exists
-    if await db["discounts"].find_one({"code": discount.code}):
-        raise HTTPException(
-            status_code=400,
-            detail="Discount code already exists"
-        )
-    
     # If assigned to staff, verify staff exists
     if discount.assigned_to:
         staff = await db["users"].find_one({
@@ -178,22 +209,271 @@ async def create_discount(
     discount_dict = discount.dict()
     discount_dict["_id"] = ObjectId()
     
-    await db["discounts"].insert_one(discount_dict)
+    # The unique code index rejects duplicates; checked explicitly only
+    # while old duplicates keep that index from being built
+    if await already_taken(db, "discounts", "code", discount.code):
+        raise HTTPException(
+            status_code=400,
+            detail="Discount code already exists"
+        )
+    try:
+        await db["discounts"].insert_one(discount_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="Discount code already exists"
+        )
+    if discount.assigned_to:
+        await invalidation_bus.publish("discounts", discount.assigned_to)
     return Discount(**discount_dict)
 
 @router.get("/group-bookings")
 async def get_group_bookings(
     current_user: UserInDB = Depends(get_current_user),
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    event_id: Optional[str] = None,
+    db = Depends(get_analytics_db)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db = MongoDB.get_db()
-    query = {"is_group": True}
+    query = {**event_scope(event_id), "is_group": True}
     
     if status:
         query["status"] = status
     
     group_bookings = await db["bookings"].find(query).to_list(None)
     return group_bookings
+
+@router.post("/events/backfill")
+async def backfill_events(
+    event_id: str,
+    start: datetime,
+    end: datetime,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Tag passes, bookings and sales written before events existed with
+    event_id, for those dated within [start, end). Run once per past event.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if event_id == ALL_EVENTS:
+        raise HTTPException(status_code=400, detail="Pick a single event")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    db = MongoDB.get_db()
+    tagged = await backfill_event_ids(db, event_id, start, end)
+    await invalidation_bus.publish("passes")
+    await invalidation_bus.publish("catalog")
+    return {"event_id": event_id, "start": start, "end": end, "tagged": tagged}
+
+@router.post("/phones/backfill")
+async def backfill_phones(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Derive the phone lookup keys for users and group bookings created
+    before gate lookup by phone existed
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    updated = await phone_lookup_service.backfill(db)
+    return {"success": True, "updated": updated}
+
+@router.post("/bookings/pass-rules/backfill")
+async def backfill_booking_rules(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Copy entry rules (type, max_entries, validity window) from passes onto
+    bookings sold before they were denormalized
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    updated = await backfill_pass_rules(db)
+    return {"success": True, "updated": updated}
+
+@router.get("/scan-events")
+async def get_scan_events(
+    current_user: UserInDB = Depends(get_current_user),
+    booking_id: Optional[str] = None,
+    gate: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+):
+    """
+    Scan history, newest first, for settling entry disputes
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    query = {}
+    if booking_id:
+        query["booking_id"] = booking_id
+    if gate:
+        query["gate"] = gate
+    
+    db = MongoDB.get_db()
+    return await db[SCAN_EVENTS_COLLECTION].find(
+        query, {"_id": 0}
+    ).sort("scanned_at", -1).skip(skip).limit(limit).to_list(None)
+
+@router.get("/query-stats")
+async def get_query_stats(
+    current_user: UserInDB = Depends(get_current_user),
+    limit: int = 20,
+    explain: bool = False
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    shapes = []
+    for stats in query_stats.top_shapes(limit):
+        entry = stats.to_dict()
+        if explain:
+            entry["explain"] = await explain_shape(db, stats)
+        shapes.append(entry)
+    
+    return {
+        "slow_threshold_ms": query_stats.slow_threshold_ms,
+        "top_shapes": shapes,
+        "slow_queries": query_stats.slow_queries(limit)
+    }
+
+@router.get("/load")
+async def get_load(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Load signals and per-lane admission counts of the worker serving the request
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return {**load_monitor.stats(), "scan_log": scan_log.stats()}
+
+@router.get("/startup-report")
+async def get_startup_report(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return startup_profile.report()
+
+IMPORT_KINDS = ("users", "passes", "bookings")
+
+@router.post("/import/{kind}", status_code=status.HTTP_202_ACCEPTED)
+async def import_records(
+    kind: str,
+    request: Request,
+    format: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Bulk import a CSV or NDJSON request body (one record per row/line).
+    The upload is spooled and processed in the background; poll the job id.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown import type")
+    
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    
+    db = MongoDB.get_db()
+    job_id = await start_import(db, kind, format, request.stream(), str(current_user.id))
+    return {"job_id": str(job_id), "status": "pending"}
+
+@router.get("/import/jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    job = await db[JOBS_COLLECTION].find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    job["_id"] = str(job["_id"])
+    return job
+
+@router.post("/cancellations", status_code=status.HTTP_202_ACCEPTED)
+async def create_mass_cancellation(
+    selector: CancellationSelector,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Cancel, refund and notify every booking matching the selector, e.g. all
+    bookings for a night called off by rain. Poll the returned job for
+    progress.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if not selector.pass_id and not selector.night:
+        raise HTTPException(status_code=400, detail="Select bookings by pass_id, night or both")
+    if selector.pass_id and not ObjectId.is_valid(selector.pass_id):
+        raise HTTPException(status_code=400, detail="Invalid pass_id")
+    if not selector.statuses or BookingStatus.CANCELLED in selector.statuses:
+        raise HTTPException(status_code=400, detail="Statuses must be active and/or used")
+    
+    job_id = await mass_cancellation.create(
+        {
+            "pass_id": selector.pass_id,
+            "night": selector.night.isoformat() if selector.night else None,
+            "statuses": [booking_status.value for booking_status in selector.statuses],
+            "reason": selector.reason,
+        },
+        str(current_user.id)
+    )
+    return {"job_id": str(job_id), "status": "pending"}
+
+@router.get("/cancellations/{job_id}", response_model=CancellationJob)
+async def get_mass_cancellation(
+    job_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    job = await db[CANCELLATION_JOBS].find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Cancellation job not found")
+    return job
+
+@router.post("/cancellations/{job_id}/retry-refunds")
+async def retry_mass_cancellation_refunds(
+    job_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    job = await db[CANCELLATION_JOBS].find_one({"_id": ObjectId(job_id)}, {"status": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Cancellation job not found")
+    if job["status"] not in ("completed", "completed_with_errors"):
+        raise HTTPException(status_code=409, detail="Job is still running")
+    
+    requeued = await mass_cancellation.retry_refunds(job["_id"])
+    return {"job_id": job_id, "refunds_requeued": requeued}
+
+@router.post("/lifecycle/run")
+async def run_lifecycle(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Expire unpaid bookings and archive past seasons now, without waiting for
+    the scheduler
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return await lifecycle_scheduler.run_once(MongoDB.get_db())
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Form, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from typing import Optional
-from datetime import timedelta
-from ...core.security import verify_password, get_password_hash, create_access_token
+from typing import List, Optional
+from datetime import datetime, timedelta
+from ...core.security import verify_password, get_password_hash, create_access_token, verify_token
 from ...core.config import get_settings
 from ...db.mongodb import MongoDB
-from ...db.models.user import UserCreate, UserInDB, User
+from ...db.indexes import already_taken
+from ...db.models.user import UserCreate, UserInDB, User, UserRole
+from ...db.models.device_session import DeviceSession, RefreshTokenRequest
+from ...services.cache_service import get_cached_principal, get_cached_session
+from ...services.device_session_service import (
+    SESSIONS_COLLECTION, open_session, rotate_session, revoke_session
+)
+from ...services.phone_lookup_service import phone_keys
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 settings = get_settings()
@@ -27,7 +36,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     if user_id is None:
         raise credentials_exception
     
-    user = await MongoDB.get_db()["users"].find_one({"_id": ObjectId(user_id)})
+    db = MongoDB.get_db()
+    # Device tokens are bound to a revocable session
+    session_id = payload.get("sid")
+    if session_id is not None:
+        session = await get_cached_session(db, session_id)
+        if session is None or session["revoked"]:
+            raise credentials_exception
+    
+    user = await get_cached_principal(db, user_id)
     if user is None:
         raise credentials_exception
     
@@ -37,8 +54,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
 async def register(user: UserCreate):
     db = MongoDB.get_db()
     
-    # Check if user already exists
-    if await db["users"].find_one({"email": user.email}):
+    # The unique email index rejects duplicates; checked explicitly only
+    # while old duplicates keep that index from being built
+    if await already_taken(db, "users", "email", user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -46,10 +64,21 @@ async def register(user: UserCreate):
     
     # Create new user
     user_dict = user.dict()
-    user_dict["password_hash"] = get_password_hash(user_dict.pop("password"))
+    user_dict["password_hash"] = await run_in_threadpool(
+        get_password_hash, user_dict.pop("password")
+    )
     user_dict["_id"] = ObjectId()
+    user_dict["role"] = UserRole.USER.value
+    user_dict["created_at"] = datetime.utcnow()
+    user_dict.update(phone_keys(user_dict["phone"]))
     
-    await db["users"].insert_one(user_dict)
+    try:
+        await db["users"].insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     return User(**user_dict)
 
 @router.post("/login")
@@ -57,7 +86,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     db = MongoDB.get_db()
     user = await db["users"].find_one({"email": form_data.username})
     
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+    if not user or not await run_in_threadpool(
+        verify_password, form_data.password, user["password_hash"]
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -71,6 +102,70 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     return {"access_token": access_token, "token_type": "bearer"}
 
+@router.post("/device/login")
+async def device_login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    device_id: str = Form(...)
+):
+    """
+    Sign a scanner device in once; it then renews with /device/refresh
+    instead of repeating the password check
+    """
+    db = MongoDB.get_db()
+    user = await db["users"].find_one({"email": form_data.username})
+    
+    if not user or not await run_in_threadpool(
+        verify_password, form_data.password, user["password_hash"]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if user.get("role") not in ("staff", "admin"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return await open_session(db, str(user["_id"]), device_id)
+
+@router.post("/device/refresh")
+async def device_refresh(request: RefreshTokenRequest):
+    db = MongoDB.get_db()
+    tokens = await rotate_session(db, request.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+@router.get("/device/sessions", response_model=List[DeviceSession])
+async def list_device_sessions(
+    user_id: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if user_id is not None and user_id != str(current_user.id) and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    sessions = await db[SESSIONS_COLLECTION].find(
+        {"user_id": user_id or str(current_user.id)},
+        {"token_hash": 0, "previous_token_hash": 0, "superseded_token_hash": 0}
+    ).to_list(None)
+    return sessions
+
+@router.delete("/device/sessions/{session_id}")
+async def revoke_device_session(
+    session_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    db = MongoDB.get_db()
+    owner = None if current_user.role == "admin" else str(current_user.id)
+    if not await revoke_session(db, session_id, owner):
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {"message": "Session revoked"}
+
 @router.post("/verify-otp")
 async def verify_otp(phone: str, otp: str):
     # Implement OTP verification logic here
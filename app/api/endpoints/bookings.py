@@ -1,26 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status
+from typing import List, Optional
 from ...db.mongodb import MongoDB
-from ...db.models.booking import BookingCreate, BookingInDB, Booking, BookingUpdate
+from ...db.events import event_scope
+from ...core.config import get_settings
+from ...db.models.booking import BookingCreate, BookingInDB, Booking, BookingUpdate, WalletBooking
 from ...db.models.user import UserInDB
 from ..endpoints.auth import get_current_user
-from ...services.qr_service import generate_qr_code
+from ...core.etag import document_etag, etag_matches, not_modified
+from ...services.booking_service import build_booking, reserve_inventory, release_inventory
+from ...services.qr_service import (
+    negotiate_format, render_png, render_svg, render_matrix,
+    MEDIA_TYPES, MIN_BOX_SIZE, MAX_BOX_SIZE
+)
+from ...services.idempotency_service import idempotency_service
+from ...services.cache_service import get_cached_pass, get_cached_passes
+from ...services.lifecycle_service import BOOKINGS_ARCHIVE
+from ...services.timeseries_service import timeseries_service
 from bson import ObjectId
-import qrcode
-import base64
-from io import BytesIO
+from pymongo import ReturnDocument
+import json
 
 router = APIRouter()
+settings = get_settings()
 
 @router.post("/", response_model=Booking)
 async def create_booking(
     booking: BookingCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
+    return await idempotency_service.run(
+        "bookings.create",
+        str(current_user.id),
+        idempotency_key,
+        booking,
+        lambda: _create_booking(booking, current_user)
+    )
+
+async def _create_booking(booking: BookingCreate, current_user: UserInDB) -> Booking:
     db = MongoDB.get_db()
     
     # Verify pass exists and is active
-    pass_ = await db["passes"].find_one({"_id": ObjectId(booking.pass_id)})
+    pass_ = await get_cached_pass(db, booking.pass_id)
     if not pass_ or not pass_["is_active"]:
         raise HTTPException(status_code=404, detail="Pass not found or inactive")
     
@@ -29,35 +50,44 @@ async def create_booking(
     if booking.discount_applied:
         amount = amount * (1 - booking.discount_applied/100)
     
-    # Generate QR code
-    booking_dict = booking.dict()
-    booking_dict["_id"] = ObjectId()
-    qr_data = f"{booking_dict['_id']}"
+    # Build the booking with its QR code and the pass's entry rules before
+    # taking a unit, so a failed render cannot leak one
+    booking_dict = build_booking(booking, pass_, amount)
     
-    # Generate QR code image
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    qr_image = qr.make_image(fill_color="black", back_color="white")
+    if not await reserve_inventory(db, pass_):
+        raise HTTPException(status_code=400, detail="Pass sold out")
     
-    # Convert QR code to base64
-    buffered = BytesIO()
-    qr_image.save(buffered, format="PNG")
-    booking_dict["qr_code"] = base64.b64encode(buffered.getvalue()).decode()
-    
-    # Add amount paid
-    booking_dict["amount_paid"] = amount
-    
-    await db["bookings"].insert_one(booking_dict)
+    try:
+        await db["bookings"].insert_one(booking_dict)
+    except Exception:
+        await release_inventory(db, {str(pass_["_id"]): 1})
+        raise
     return Booking(**booking_dict)
 
 @router.get("/{booking_id}", response_model=Booking)
 async def get_booking(
     booking_id: str,
+    response: Response,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
     current_user: UserInDB = Depends(get_current_user)
 ):
     db = MongoDB.get_db()
+    
+    # Revalidation reads only the owner and revision; a match answers 304
+    # without loading or serializing the booking and its QR image
+    if if_none_match:
+        version = await db["bookings"].find_one(
+            {"_id": ObjectId(booking_id)}, {"user_id": 1, "revision": 1}
+        )
+        if (version and etag_matches(if_none_match, document_etag(version)) and
+                (str(version["user_id"]) == str(current_user.id) or
+                 current_user.role in ["staff", "admin"])):
+            return not_modified(document_etag(version))
+    
     booking = await db["bookings"].find_one({"_id": ObjectId(booking_id)})
+    if not booking and include_archived:
+        booking = await db[BOOKINGS_ARCHIVE].find_one({"_id": ObjectId(booking_id)})
     
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
@@ -67,51 +97,140 @@ async def get_booking(
         current_user.role not in ["staff", "admin"]):
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    response.headers["ETag"] = document_etag(booking)
     return Booking(**booking)
 
-@router.post("/{booking_id}/cancel", response_model=Booking)
-async def cancel_booking(
+@router.get("/{booking_id}/qr")
+async def get_booking_qr(
     booking_id: str,
+    format: Optional[str] = None,  # png, svg, matrix
+    size: Optional[int] = None,  # pixels per module
+    accept: Optional[str] = Header(None),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    db = MongoDB.get_db()
-    booking = await db["bookings"].find_one({"_id": ObjectId(booking_id)})
+    variant = negotiate_format(format, accept)
+    if variant is None:
+        raise HTTPException(status_code=400, detail="Unsupported QR format")
+    if size is not None and not MIN_BOX_SIZE <= size <= MAX_BOX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Size must be between {MIN_BOX_SIZE} and {MAX_BOX_SIZE}"
+        )
     
+    db = MongoDB.get_db()
+    booking = await db["bookings"].find_one(
+        {"_id": ObjectId(booking_id)}, {"user_id": 1}
+    )
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    # Check if user owns the booking or is admin
     if (str(booking["user_id"]) != str(current_user.id) and 
-        current_user.role != "admin"):
+        current_user.role not in ["staff", "admin"]):
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Check if booking can be cancelled
-    if booking["status"] != "active":
+    # Rendered variants are cached per (booking, format, size) in the QR service
+    if variant == "png":
+        content = render_png(booking_id, size or settings.QR_DEFAULT_BOX_SIZE)
+    elif variant == "svg":
+        content = render_svg(booking_id, size or 0)
+    else:
+        content = json.dumps(render_matrix(booking_id)).encode()
+    
+    # The QR payload never changes for a booking
+    return Response(
+        content=content,
+        media_type=MEDIA_TYPES[variant],
+        headers={"Cache-Control": "private, max-age=86400", "Vary": "Accept"}
+    )
+
+@router.post("/{booking_id}/cancel", response_model=Booking)
+async def cancel_booking(
+    booking_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    db = MongoDB.get_db()
+    
+    # Ownership and status are preconditions of the update itself, so a
+    # concurrent cancel or gate scan cannot slip in between check and write
+    conditions = {"_id": ObjectId(booking_id), "status": "active"}
+    if current_user.role != "admin":
+        conditions["user_id"] = str(current_user.id)
+    booking = await db["bookings"].find_one_and_update(
+        conditions,
+        {"$set": {"status": "cancelled"}, "$inc": {"revision": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not booking:
+        # Only the failure path pays for a read, to explain the rejection
+        booking = await db["bookings"].find_one(
+            {"_id": ObjectId(booking_id)}, {"user_id": 1}
+        )
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        if (str(booking["user_id"]) != str(current_user.id) and 
+            current_user.role != "admin"):
+            raise HTTPException(status_code=403, detail="Not authorized")
         raise HTTPException(
             status_code=400,
             detail="Only active bookings can be cancelled"
         )
     
-    result = await db["bookings"].update_one(
-        {"_id": ObjectId(booking_id)},
-        {"$set": {"status": "cancelled"}}
-    )
-    
-    booking["status"] = "cancelled"
+    await release_inventory(db, {booking["pass_id"]: 1})
+    await timeseries_service.invalidate(booking["created_at"])
     return Booking(**booking)
 
 @router.get("/user/{user_id}", response_model=List[Booking])
 async def get_user_bookings(
     user_id: str,
+    include_archived: bool = False,
+    event_id: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user)
 ):
+    """
+    Bookings for the current event, another event, or every event
+    with event_id=all
+    """
     # Check if user is requesting their own bookings or is staff/admin
     if user_id != str(current_user.id) and current_user.role not in ["staff", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     db = MongoDB.get_db()
+    query = {**event_scope(event_id), "user_id": user_id}
+    bookings = await db["bookings"].find(query).to_list(None)
+    if include_archived:
+        bookings += await db[BOOKINGS_ARCHIVE].find(query).to_list(None)
+    
+    return bookings
+
+@router.get("/user/{user_id}/wallet", response_model=List[WalletBooking])
+async def get_user_wallet(
+    user_id: str,
+    skip: int = 0,
+    limit: int = 20,
+    include_qr: bool = False,
+    event_id: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    The user's bookings for the current event (or event_id), newest first,
+    each with a summary of its pass.
+    QR images are left out unless asked for; the app loads them from
+    /bookings/{id}/qr when a pass is opened.
+    """
+    if user_id != str(current_user.id) and current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    projection = {"group_qr_codes": 0, "payment_id": 0, "discount_applied": 0}
+    if not include_qr:
+        projection["qr_code"] = 0
     bookings = await db["bookings"].find(
-        {"user_id": user_id}
-    ).to_list(None)
+        {**event_scope(event_id), "user_id": user_id}, projection
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(None)
+    
+    passes = await get_cached_passes(db, [booking["pass_id"] for booking in bookings])
+    for booking in bookings:
+        booking["pass_details"] = passes.get(booking["pass_id"])
     
     return bookings
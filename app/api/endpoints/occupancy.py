@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from ...db.mongodb import MongoDB
+from ...db.models.user import UserInDB
+from ..endpoints.auth import get_current_user
+from ...services.occupancy_service import occupancy_service
+
+router = APIRouter()
+
+@router.get("/")
+async def get_occupancy(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return occupancy_service.view()
+
+@router.get("/stream")
+async def stream_occupancy(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return StreamingResponse(
+        occupancy_service.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/exit")
+async def record_exit(
+    gate: str = "main",
+    count: int = 1,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if count < 1:
+        raise HTTPException(status_code=400, detail="Count must be at least 1")
+    
+    await occupancy_service.record(MongoDB.get_db(), gate, -count)
+    return {"success": True, "estimated_total": occupancy_service.estimated_total()}
@@ -1,25 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status
+from typing import List, Optional
+from datetime import datetime
 from ...db.mongodb import MongoDB
+from ...db.events import ALL_EVENTS, current_event_id, event_scope
 from ...db.models.passes import PassCreate, PassInDB, Pass, PassUpdate
 from ...db.models.user import UserInDB
 from ..endpoints.auth import get_current_user
+from ...core.etag import document_etag, collection_etag, etag_matches, not_modified
+from ...services.cache_service import get_cached_pass, catalog_cache, invalidation_bus
+from ...services.booking_service import LEGACY_RULES, pass_rules_for
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Pass])
-async def list_passes():
-    db = MongoDB.get_db()
-    passes = await db["passes"].find({"is_active": True}).to_list(None)
+async def list_passes(
+    response: Response,
+    event_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    # The catalog and its ETag are cached per worker and event, and dropped
+    # over the invalidation bus whenever a pass is created, edited or sold
+    scope = event_scope(event_id)
+    key = f"active:{scope.get('event_id', ALL_EVENTS)}"
+    catalog = catalog_cache.get(key)
+    if catalog is None:
+        db = MongoDB.get_db()
+        passes = await db["passes"].find(
+            {**scope, "is_active": True}
+        ).sort("_id", 1).to_list(None)
+        catalog = (collection_etag(passes), passes)
+        catalog_cache.set(key, catalog)
+    
+    etag, passes = catalog
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return passes
 
 @router.get("/{pass_id}", response_model=Pass)
-async def get_pass(pass_id: str):
+async def get_pass(
+    pass_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None)
+):
     db = MongoDB.get_db()
-    pass_ = await db["passes"].find_one({"_id": ObjectId(pass_id)})
+    pass_ = await get_cached_pass(db, pass_id)
     if not pass_:
         raise HTTPException(status_code=404, detail="Pass not found")
+    
+    etag = document_etag(pass_)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return pass_
 
 @router.post("/", response_model=Pass)
@@ -33,8 +67,13 @@ async def create_pass(
     db = MongoDB.get_db()
     pass_dict = pass_.dict()
     pass_dict["_id"] = ObjectId()
+    pass_dict["is_active"] = True
+    pass_dict["created_at"] = datetime.now()
+    pass_dict["revision"] = 1
+    pass_dict["event_id"] = pass_dict["event_id"] or current_event_id()
     
     await db["passes"].insert_one(pass_dict)
+    await invalidation_bus.publish("catalog")
     return Pass(**pass_dict)
 
 @router.post("/group", response_model=Pass)
@@ -55,8 +94,13 @@ async def create_group_pass(
     db = MongoDB.get_db()
     pass_dict = pass_.dict()
     pass_dict["_id"] = ObjectId()
+    pass_dict["is_active"] = True
+    pass_dict["created_at"] = datetime.now()
+    pass_dict["revision"] = 1
+    pass_dict["event_id"] = pass_dict["event_id"] or current_event_id()
     
     await db["passes"].insert_one(pass_dict)
+    await invalidation_bus.publish("catalog")
     return Pass(**pass_dict)
 
 @router.put("/{pass_id}", response_model=Pass)
@@ -74,13 +118,32 @@ async def update_pass(
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db["passes"].update_one(
+    updated_pass = await db["passes"].find_one_and_update(
         {"_id": ObjectId(pass_id)},
-        {"$set": update_data}
+        {"$set": update_data, "$inc": {"revision": 1}},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if updated_pass is None:
         raise HTTPException(status_code=404, detail="Pass not found")
     
-    updated_pass = await db["passes"].find_one({"_id": ObjectId(pass_id)})
+    await invalidation_bus.publish("passes", pass_id)
+    await invalidation_bus.publish("catalog")
+    
+    # Keep the entry rules denormalized onto bookings in step with the pass
+    rules_update = {
+        f"pass_rules.{field}": update_data[field]
+        for field in ("max_entries", "validity_end")
+        if field in update_data
+    }
+    if rules_update:
+        await db["bookings"].update_many(
+            {"pass_id": pass_id, "pass_rules.type": {"$exists": True}},
+            {"$set": rules_update, "$inc": {"revision": 1}}
+        )
+        # Bookings without rules yet get the whole set, never a partial copy
+        await db["bookings"].update_many(
+            {"pass_id": pass_id, **LEGACY_RULES},
+            {"$set": {"pass_rules": pass_rules_for(updated_pass)}, "$inc": {"revision": 1}}
+        )
     return Pass(**updated_pass)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Request
+from ...db.mongodb import MongoDB
+from ...services.payment_reconciler import payment_reconciler
+
+router = APIRouter()
+
+@router.post("/webhook")
+async def payment_webhook(request: Request):
+    """
+    Gateway webhook: store the raw delivery and acknowledge at once.
+    Signatures are checked and bookings updated by the reconciler.
+    """
+    body = await request.body()
+    await payment_reconciler.ingest(
+        MongoDB.get_db(),
+        body,
+        request.headers.get("x-razorpay-signature"),
+        request.headers.get("x-razorpay-event-id")
+    )
+    return {"status": "accepted"}
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header, status
+from typing import List, Optional
 from ...db.mongodb import MongoDB
+from ...db.events import event_scope
 from ...db.models.user import UserInDB
-from ...db.models.staff_sale import StaffSaleCreate, StaffSale
-from ...db.models.booking import BookingCreate, Booking
+from ...db.models.staff_sale import StaffSaleCreate, StaffSale, StaffSalesDaily, PaymentMode
+from ...db.models.booking import BookingCreate, Booking, PaymentStatus
 from ..endpoints.auth import get_current_user
+from ...services.idempotency_service import idempotency_service
+from ...services.cache_service import get_cached_pass, get_cached_staff_discounts
+from ...services.sales_summary_service import record_sale, get_staff_daily
+from ...services.booking_service import build_booking, reserve_inventory, release_inventory
+from ...services.lifecycle_service import STAFF_SALES_ARCHIVE
 from bson import ObjectId
 from datetime import datetime
 
@@ -13,20 +19,25 @@ router = APIRouter()
 @router.post("/sell", response_model=Booking)
 async def staff_sell_pass(
     booking: BookingCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if current_user.role != "staff":
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    return await idempotency_service.run(
+        "staff.sell",
+        str(current_user.id),
+        idempotency_key,
+        booking,
+        lambda: _staff_sell_pass(booking, current_user)
+    )
+
+async def _staff_sell_pass(booking: BookingCreate, current_user: UserInDB) -> Booking:
     db = MongoDB.get_db()
     
-    # Create booking
-    booking_dict = booking.dict()
-    booking_dict["sold_by"] = str(current_user.id)
-    booking_dict["_id"] = ObjectId()
-    
     # Get pass details
-    pass_ = await db["passes"].find_one({"_id": ObjectId(booking.pass_id)})
+    pass_ = await get_cached_pass(db, booking.pass_id)
     if not pass_:
         raise HTTPException(status_code=404, detail="Pass not found")
     
@@ -34,11 +45,8 @@ async def staff_sell_pass(
     amount = pass_["price"]
     if booking.discount_applied:
         # Verify staff's discount permission
-        discount = await db["discounts"].find_one({
-            "assigned_to": str(current_user.id),
-            "is_active": True,
-            "expiry": {"$gt": datetime.utcnow()}
-        })
+        discounts = await get_cached_staff_discounts(db, str(current_user.id))
+        discount = max(discounts, key=lambda d: d["percentage"], default=None)
         if not discount or discount["percentage"] < booking.discount_applied:
             raise HTTPException(
                 status_code=403,
@@ -46,43 +54,107 @@ async def staff_sell_pass(
             )
         amount = amount * (1 - booking.discount_applied/100)
     
-    booking_dict["amount_paid"] = amount
+    # Create booking; rendered before a unit is taken, so a failed render
+    # cannot leak one
+    booking_dict = build_booking(booking, pass_, amount)
+    booking_dict["sold_by"] = str(current_user.id)
+    
+    if not await reserve_inventory(db, pass_):
+        raise HTTPException(status_code=400, detail="Pass sold out")
     
     # Create staff sale record
     staff_sale = StaffSaleCreate(
         staff_id=str(current_user.id),
         booking_id=str(booking_dict["_id"]),
         discount_applied=booking.discount_applied or 0,
-        payment_mode=booking.payment_status
+        payment_mode=(
+            PaymentMode.CASH if booking.payment_status == PaymentStatus.CASH
+            else PaymentMode.UPI
+        )
     )
+    staff_sale_dict = staff_sale.dict()
+    staff_sale_dict["_id"] = ObjectId()
+    staff_sale_dict["sale_time"] = datetime.now()
+    staff_sale_dict["gross_amount"] = pass_["price"]
+    staff_sale_dict["amount_paid"] = amount
+    staff_sale_dict["event_id"] = booking_dict["event_id"]
+    # Cleared once the daily summary counts the sale; the lifecycle
+    # reconcile folds in any sale whose request stopped before that
+    staff_sale_dict["summarized"] = False
+    
+    # The unit goes back on sale if the booking cannot be stored
+    try:
+        await db["bookings"].insert_one(booking_dict)
+    except Exception:
+        await release_inventory(db, {str(pass_["_id"]): 1})
+        raise
     
-    await db["staff_sales"].insert_one(staff_sale.dict())
-    await db["bookings"].insert_one(booking_dict)
+    # A booking without its sale record would be a pass nobody is accounted
+    # for; undo it, so a retry with the same Idempotency-Key starts clean
+    try:
+        await db["staff_sales"].insert_one(staff_sale_dict)
+    except Exception:
+        await db["bookings"].delete_one({"_id": booking_dict["_id"]})
+        await release_inventory(db, {str(pass_["_id"]): 1})
+        raise
+    
+    # The sale stands either way; the lifecycle reconcile retries the summary
+    try:
+        await record_sale(
+            db,
+            staff_sale_dict["_id"],
+            staff_sale.staff_id,
+            staff_sale_dict["sale_time"],
+            gross=pass_["price"],
+            net=amount
+        )
+    except Exception as e:
+        print(f"Sales summary update failed: {str(e)}")
     
     return Booking(**booking_dict)
 
 @router.get("/sales", response_model=List[StaffSale])
-async def get_staff_sales(current_user: UserInDB = Depends(get_current_user)):
+async def get_staff_sales(
+    current_user: UserInDB = Depends(get_current_user),
+    skip: int = 0,
+    limit: int = 100,
+    include_archived: bool = False,
+    event_id: Optional[str] = None
+):
     if current_user.role != "staff":
         raise HTTPException(status_code=403, detail="Not authorized")
     
     db = MongoDB.get_db()
-    sales = await db["staff_sales"].find(
-        {"staff_id": str(current_user.id)}
-    ).to_list(None)
+    query = {**event_scope(event_id), "staff_id": str(current_user.id)}
+    sales = await db["staff_sales"].find(query).sort(
+        "sale_time", -1
+    ).skip(skip).limit(limit).to_list(None)
+    
+    # Archived sales are older than every live one, so they continue the page
+    if include_archived and len(sales) < limit:
+        live = await db["staff_sales"].count_documents(query)
+        sales += await db[STAFF_SALES_ARCHIVE].find(query).sort(
+            "sale_time", -1
+        ).skip(max(skip - live, 0)).limit(limit - len(sales)).to_list(None)
     
     return sales
 
+@router.get("/sales/summary", response_model=List[StaffSalesDaily])
+async def get_staff_sales_summary(
+    current_user: UserInDB = Depends(get_current_user),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    if current_user.role != "staff":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db = MongoDB.get_db()
+    return await get_staff_daily(db, str(current_user.id), start_date, end_date)
+
 @router.get("/active-discounts")
 async def get_staff_discounts(current_user: UserInDB = Depends(get_current_user)):
     if current_user.role != "staff":
         raise HTTPException(status_code=403, detail="Not authorized")
     
     db = MongoDB.get_db()
-    discounts = await db["discounts"].find({
-        "assigned_to": str(current_user.id),
-        "is_active": True,
-        "expiry": {"$gt": datetime.utcnow()}
-    }).to_list(None)
-    
-    return discounts
+    return await get_cached_staff_discounts(db, str(current_user.id))
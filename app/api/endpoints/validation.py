@@ -1,31 +1,101 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional, Tuple
 from ...db.mongodb import MongoDB
 from ...db.models.user import UserInDB
-from ...db.models.booking import BookingStatus
+from ...db.models.booking import BookingStatus, GroupAdmission
 from ..endpoints.auth import get_current_user
+from ...services.occupancy_service import occupancy_service
+from ...services.scan_guard import scan_guard
+from ...services.scan_log_service import scan_log, ADMITTED, REJECTED, GROUP_LOOKUP
+from ...services.phone_lookup_service import phone_lookup_service, MODES, PREFIX
+from ...services.entry_service import (
+    admit_individual, admit_group, entries_remaining, group_rejection, window_error
+)
 from bson import ObjectId
+from datetime import datetime
 
 router = APIRouter()
 
+# Group rejections that no later scan can change
+FINAL_GROUP_REJECTIONS = {"All members have already entered"}
+
 @router.post("/validate-qr")
 async def validate_qr_code(
     qr_code: str,
+    gate: str = "main",
     current_user: UserInDB = Depends(get_current_user)
 ):
     if current_user.role not in ["staff", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    try:
+        response, pass_type = await _validate_qr_code(qr_code)
+    except HTTPException as e:
+        scan_log.record(qr_code, gate, str(current_user.id), REJECTED, message=e.detail)
+        raise
+    
+    if not response["valid"]:
+        scan_log.record(
+            qr_code, gate, str(current_user.id), REJECTED, message=response["message"]
+        )
+    elif response["is_group"]:
+        scan_log.record(qr_code, gate, str(current_user.id), GROUP_LOOKUP)
+    else:
+        # The log's flush also counts the entry towards occupancy
+        scan_log.record(
+            qr_code, gate, str(current_user.id), ADMITTED, entries=1, pass_type=pass_type
+        )
+    return response
+
+async def _validate_qr_code(qr_code: str) -> Tuple[dict, Optional[str]]:
+    """
+    Gate response for a scan, with the pass type of an admitted individual pass
+    """
+    # Re-scans of a pass that is finished for good never reach Mongo
+    rejection = scan_guard.check(qr_code)
+    if rejection:
+        return {
+            "valid": False,
+            "message": rejection
+        }, None
+    
     db = MongoDB.get_db()
+    now = datetime.utcnow()
+    
+    # Individual passes are admitted with one conditional update that enforces
+    # status, validity window and entry count; groups and rejections fall
+    # through to a read
+    if not occupancy_service.at_capacity():
+        admitted = await admit_individual(db, qr_code, now)
+        if admitted:
+            if admitted["status"] != BookingStatus.ACTIVE.value:
+                scan_guard.consume(qr_code, f"Pass is {admitted['status']}")
+            return {
+                "valid": True,
+                "is_group": False,
+                "message": "Entry validated successfully",
+                "entries_remaining": entries_remaining(admitted)
+            }, (admitted.get("pass_rules") or {}).get("type")
+    
     booking = await db["bookings"].find_one({"_id": ObjectId(qr_code)})
     
     if not booking:
         raise HTTPException(status_code=404, detail="Invalid QR code")
     
     if booking["status"] != "active":
+        scan_guard.consume(qr_code, f"Pass is {booking['status']}")
         return {
             "valid": False,
             "message": f"Pass is {booking['status']}"
-        }
+        }, None
+    
+    error = window_error(booking, now)
+    if error:
+        # Not guarded: an admin may still move the validity window
+        return {
+            "valid": False,
+            "message": error
+        }, None
     
     # For group passes
     if booking["is_group"]:
@@ -34,10 +104,11 @@ async def validate_qr_code(
             if not member["entry_status"]
         )
         if available_entries == 0:
+            scan_guard.consume(qr_code, "All members have already entered")
             return {
                 "valid": False,
                 "message": "All members have already entered"
-            }
+            }, None
         
         # Return group details
         return {
@@ -52,76 +123,174 @@ async def validate_qr_code(
                 }
                 for member in booking["group_members"]
             ]
-        }
+        }, None
     
-    # For individual passes
-    # Mark the booking as used
-    await db["bookings"].update_one(
-        {"_id": ObjectId(qr_code)},
-        {"$set": {"status": "used"}}
-    )
+    # For individual passes the conditional update did not match
+    if occupancy_service.at_capacity():
+        return {
+            "valid": False,
+            "message": "Venue is at capacity"
+        }, None
     
+    scan_guard.consume(qr_code, "All entries have been used")
     return {
-        "valid": True,
-        "is_group": False,
-        "message": "Entry validated successfully"
-    }
+        "valid": False,
+        "message": "All entries have been used"
+    }, None
+
+@router.get("/lookup")
+async def lookup_by_phone(
+    phone: str,
+    mode: str = PREFIX,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Tonight's active bookings for an attendee without their QR code, by the
+    holder's or a group member's phone: the number or its start (prefix),
+    or its last four digits (last4)
+    """
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if mode not in MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid mode; use one of: {', '.join(MODES)}"
+        )
+    
+    db = MongoDB.get_db()
+    try:
+        bookings = await phone_lookup_service.lookup(db, phone, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"count": len(bookings), "bookings": bookings}
 
 @router.post("/validate-group-entry/{booking_id}/{member_index}")
 async def validate_group_member_entry(
     booking_id: str,
     member_index: int,
+    gate: str = "main",
     current_user: UserInDB = Depends(get_current_user)
 ):
     if current_user.role not in ["staff", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db = MongoDB.get_db()
-    booking = await db["bookings"].find_one({"_id": ObjectId(booking_id)})
-    
-    if not booking or not booking["is_group"]:
-        raise HTTPException(status_code=404, detail="Invalid booking")
-    
-    if booking["status"] != "active":
-        raise HTTPException(
-            status_code=400,
-            detail=f"Booking is {booking['status']}"
-        )
+    result = await _admit_group_members(
+        booking_id, gate, str(current_user.id), indexes=[member_index]
+    )
+    return {
+        "success": True,
+        "message": "Entry validated successfully",
+        "all_entered": result["all_entered"]
+    }
+
+@router.post("/validate-group-entry/{booking_id}")
+async def validate_group_entry(
+    booking_id: str,
+    admission: GroupAdmission = GroupAdmission(),
+    gate: str = "main",
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Admit all waiting members (empty body), the first `count` waiting
+    members, or the members listed in `member_indexes`
+    """
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    if member_index >= len(booking["group_members"]):
+    if admission.count is not None and admission.member_indexes is not None:
         raise HTTPException(
             status_code=400,
-            detail="Invalid member index"
+            detail="Provide either count or member_indexes, not both"
         )
+    if admission.count is not None and admission.count < 1:
+        raise HTTPException(status_code=400, detail="Count must be at least 1")
     
-    if booking["group_members"][member_index]["entry_status"]:
-        raise HTTPException(
-            status_code=400,
-            detail="Member has already entered"
+    result = await _admit_group_members(
+        booking_id, gate, str(current_user.id),
+        count=admission.count, indexes=admission.member_indexes
+    )
+    return {
+        "success": True,
+        "message": "Entry validated successfully",
+        **result
+    }
+
+async def _admit_group_members(
+    booking_id: str,
+    gate: str,
+    scanned_by: str,
+    count: Optional[int] = None,
+    indexes: Optional[List[int]] = None
+) -> dict:
+    try:
+        result, pass_type = await _admit_group(booking_id, count=count, indexes=indexes)
+    except HTTPException as e:
+        scan_log.record(
+            booking_id, gate, scanned_by, REJECTED, message=e.detail, member_indexes=indexes
         )
+        raise
     
-    # Mark the member as entered
-    update_path = f"group_members.{member_index}.entry_status"
-    await db["bookings"].update_one(
-        {"_id": ObjectId(booking_id)},
-        {"$set": {update_path: True}}
+    scan_log.record(
+        booking_id, gate, scanned_by, ADMITTED,
+        entries=result["admitted_count"],
+        pass_type=pass_type,
+        member_indexes=result["admitted"]
     )
+    return result
+
+async def _admit_group(
+    booking_id: str,
+    count: Optional[int] = None,
+    indexes: Optional[List[int]] = None
+) -> Tuple[dict, Optional[str]]:
+    if indexes is not None and (not indexes or min(indexes) < 0):
+        raise HTTPException(status_code=400, detail="Invalid member index")
     
-    # Check if all members have entered
-    booking["group_members"][member_index]["entry_status"] = True
-    all_entered = all(
-        member["entry_status"]
-        for member in booking["group_members"]
-    )
+    rejection = scan_guard.check(booking_id)
+    if rejection:
+        raise HTTPException(status_code=400, detail=rejection)
     
-    if all_entered:
-        await db["bookings"].update_one(
-            {"_id": ObjectId(booking_id)},
-            {"$set": {"status": "used"}}
+    db = MongoDB.get_db()
+    if count is not None or indexes is not None:
+        entries = count or len(set(indexes))
+    elif occupancy_service.capacity:
+        # Admitting everyone takes each member still outside. Members only
+        # ever go in, so the number waiting now bounds what the update admits
+        booking = await db["bookings"].find_one(
+            {"_id": ObjectId(booking_id)}, {"group_members.entry_status": 1}
         )
+        entries = sum(
+            1 for member in (booking or {}).get("group_members") or []
+            if not member.get("entry_status")
+        )
+    else:
+        entries = 0
+    # Nobody waiting falls through to the booking's own rejection
+    if entries and occupancy_service.at_capacity(entries):
+        raise HTTPException(status_code=409, detail="Venue is at capacity")
+    
+    now = datetime.utcnow()
+    admitted = await admit_group(db, booking_id, now, count=count, indexes=indexes)
+    
+    if admitted is None:
+        booking = await db["bookings"].find_one({"_id": ObjectId(booking_id)})
+        status_code, detail = group_rejection(booking, now, count=count, indexes=indexes)
+        if detail in FINAL_GROUP_REJECTIONS or detail.startswith("Booking is "):
+            scan_guard.consume(booking_id, detail)
+        raise HTTPException(status_code=status_code, detail=detail)
+    
+    before, admitted_indexes = admitted
     
+    remaining = sum(
+        1 for index, member in enumerate(before["group_members"])
+        if not member["entry_status"] and index not in admitted_indexes
+    )
+    if remaining == 0:
+        scan_guard.consume(booking_id, "All members have already entered")
     return {
-        "success": True,
-        "message": "Entry validated successfully",
-        "all_entered": all_entered
-    }
+        "admitted": admitted_indexes,
+        "admitted_count": len(admitted_indexes),
+        "remaining": remaining,
+        "all_entered": remaining == 0
+    }, (before.get("pass_rules") or {}).get("type")
@@ -9,12 +9,113 @@ class Settings(BaseSettings):
     # MongoDB settings
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     DB_NAME: str = os.getenv("DB_NAME", "navratri_pass_db")
+    ANALYTICS_MAX_STALENESS_SECONDS: int = int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "90"))
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+    
+    # Server settings
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = int(os.getenv("PORT", "8001"))
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    GRACEFUL_SHUTDOWN_SECONDS: int = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+    
+    # Worker-local cache settings
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+    CACHE_MAX_SIZE: int = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+    CACHE_BUS_MODE: str = os.getenv("CACHE_BUS_MODE", "capped")  # capped, change_stream
+    CACHE_BUS_SIZE_BYTES: int = int(os.getenv("CACHE_BUS_SIZE_BYTES", "1048576"))
+    
+    # Venue occupancy settings (VENUE_CAPACITY 0 means unlimited)
+    VENUE_CAPACITY: int = int(os.getenv("VENUE_CAPACITY", "0"))
+    OCCUPANCY_SHARDS: int = int(os.getenv("OCCUPANCY_SHARDS", "8"))
+    OCCUPANCY_BUCKET_MINUTES: int = int(os.getenv("OCCUPANCY_BUCKET_MINUTES", "15"))
+    OCCUPANCY_REFRESH_SECONDS: float = float(os.getenv("OCCUPANCY_REFRESH_SECONDS", "1"))
+    OCCUPANCY_NIGHT_ROLLOVER_HOUR: int = int(os.getenv("OCCUPANCY_NIGHT_ROLLOVER_HOUR", "6"))
+    
+    # Gate re-scan guard settings
+    SCAN_GUARD_WINDOW_SECONDS: float = float(os.getenv("SCAN_GUARD_WINDOW_SECONDS", "600"))
+    SCAN_GUARD_MAX_SIZE: int = int(os.getenv("SCAN_GUARD_MAX_SIZE", "50000"))
+    SCAN_GUARD_SHARE_SECONDS: float = float(os.getenv("SCAN_GUARD_SHARE_SECONDS", "1"))
+    
+    # Scan event log settings
+    SCAN_LOG_FLUSH_MS: float = float(os.getenv("SCAN_LOG_FLUSH_MS", "10"))
+    SCAN_LOG_BATCH_SIZE: int = int(os.getenv("SCAN_LOG_BATCH_SIZE", "500"))
+    SCAN_LOG_MAX_BUFFER: int = int(os.getenv("SCAN_LOG_MAX_BUFFER", "20000"))
+    
+    # QR code settings
+    QR_DEFAULT_BOX_SIZE: int = int(os.getenv("QR_DEFAULT_BOX_SIZE", "4"))
+    QR_CACHE_SIZE: int = int(os.getenv("QR_CACHE_SIZE", "1024"))
+    
+    # Startup settings
+    STARTUP_BUDGET_MS: float = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+    
+    # Idempotency settings
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    IDEMPOTENCY_CLAIM_SECONDS: float = float(os.getenv("IDEMPOTENCY_CLAIM_SECONDS", "30"))
+    
+    # Bulk import settings
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+    IMPORT_WORKERS: int = int(os.getenv("IMPORT_WORKERS", "4"))
+    
+    # Payment reconciliation settings
+    PAYMENT_WEBHOOK_SECRET: str = os.getenv("PAYMENT_WEBHOOK_SECRET", "your-webhook-secret-here")
+    PAYMENT_RECONCILE_BATCH: int = int(os.getenv("PAYMENT_RECONCILE_BATCH", "200"))
+    PAYMENT_RECONCILE_SECONDS: float = float(os.getenv("PAYMENT_RECONCILE_SECONDS", "2"))
+    PAYMENT_SWEEP_SECONDS: float = float(os.getenv("PAYMENT_SWEEP_SECONDS", "300"))
+    PAYMENT_STALE_MINUTES: int = int(os.getenv("PAYMENT_STALE_MINUTES", "15"))
+    # Gateway client for the pending-payment sweep; empty disables the sweep
+    PAYMENT_GATEWAY: str = os.getenv("PAYMENT_GATEWAY", "")
+    
+    # Pass expiry reminder settings
+    REMINDER_INTERVAL_SECONDS: float = float(os.getenv("REMINDER_INTERVAL_SECONDS", "900"))
+    REMINDER_WINDOW_HOURS: float = float(os.getenv("REMINDER_WINDOW_HOURS", "24"))
+    REMINDER_CHUNK_SIZE: int = int(os.getenv("REMINDER_CHUNK_SIZE", "500"))
+    REMINDER_CONCURRENCY: int = int(os.getenv("REMINDER_CONCURRENCY", "16"))
+    
+    # Booking lifecycle settings
+    PENDING_BOOKING_TTL_MINUTES: int = int(os.getenv("PENDING_BOOKING_TTL_MINUTES", "30"))
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+    LIFECYCLE_INTERVAL_SECONDS: float = float(os.getenv("LIFECYCLE_INTERVAL_SECONDS", "300"))
+    LIFECYCLE_BATCH_SIZE: int = int(os.getenv("LIFECYCLE_BATCH_SIZE", "500"))
+    
+    # Mass cancellation settings
+    MASS_CANCEL_CHUNK_SIZE: int = int(os.getenv("MASS_CANCEL_CHUNK_SIZE", "500"))
+    MASS_CANCEL_LEASE_SECONDS: float = float(os.getenv("MASS_CANCEL_LEASE_SECONDS", "120"))
+    REFUND_CONCURRENCY: int = int(os.getenv("REFUND_CONCURRENCY", "32"))
+    REFUND_MAX_ATTEMPTS: int = int(os.getenv("REFUND_MAX_ATTEMPTS", "4"))
+    
+    # Priority lane settings (lane concurrency 0 means unlimited, pool size 0
+    # means the lane shares the default client)
+    LOOP_LAG_THRESHOLD_MS: float = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "50"))
+    POOL_WAIT_THRESHOLD_MS: float = float(os.getenv("POOL_WAIT_THRESHOLD_MS", "25"))
+    SHED_RETRY_AFTER_SECONDS: int = int(os.getenv("SHED_RETRY_AFTER_SECONDS", "2"))
+    LANE_CONCURRENCY_GATE: int = int(os.getenv("LANE_CONCURRENCY_GATE", "0"))
+    LANE_CONCURRENCY_STAFF: int = int(os.getenv("LANE_CONCURRENCY_STAFF", "64"))
+    LANE_CONCURRENCY_CUSTOMER: int = int(os.getenv("LANE_CONCURRENCY_CUSTOMER", "128"))
+    LANE_CONCURRENCY_ANALYTICS: int = int(os.getenv("LANE_CONCURRENCY_ANALYTICS", "8"))
+    MONGO_POOL_GATE: int = int(os.getenv("MONGO_POOL_GATE", "40"))
+    MONGO_POOL_STAFF: int = int(os.getenv("MONGO_POOL_STAFF", "20"))
+    MONGO_POOL_ANALYTICS: int = int(os.getenv("MONGO_POOL_ANALYTICS", "10"))
+    
+    # Event settings (the event reads default to)
+    CURRENT_EVENT_ID: str = os.getenv("CURRENT_EVENT_ID", "navratri-2026")
+    
+    # Phone lookup settings (finding a booking at the gate without its QR code)
+    PHONE_LOOKUP_MIN_PREFIX: int = int(os.getenv("PHONE_LOOKUP_MIN_PREFIX", "6"))
+    PHONE_LOOKUP_LIMIT: int = int(os.getenv("PHONE_LOOKUP_LIMIT", "20"))
     
     # JWT settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Device session settings (gate scanners)
+    DEVICE_ACCESS_TOKEN_MINUTES: int = int(os.getenv("DEVICE_ACCESS_TOKEN_MINUTES", "60"))
+    DEVICE_TOKEN_JITTER: float = float(os.getenv("DEVICE_TOKEN_JITTER", "0.2"))
+    DEVICE_SESSION_DAYS: int = int(os.getenv("DEVICE_SESSION_DAYS", "30"))
+    DEVICE_REFRESH_GRACE_SECONDS: int = int(os.getenv("DEVICE_REFRESH_GRACE_SECONDS", "30"))
+    
     # Email settings (SMTP)
     SMTP_SERVER: str = os.getenv("SMTP_SERVER", "smtp.gmail.com")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
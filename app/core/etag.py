@@ -0,0 +1,34 @@
+import hashlib
+from typing import Iterable, Optional
+from starlette.responses import Response
+
+# Every write to a pass or booking increments its "revision" field, so
+# (id, revision) identifies a representation without hashing the body
+
+# Pipeline-update expression for the same increment
+NEXT_REVISION = {"$add": [{"$ifNull": ["$revision", 0]}, 1]}
+
+
+def document_etag(document: dict) -> str:
+    return f'W/"{document["_id"]}.{document.get("revision", 0)}"'
+
+
+def collection_etag(documents: Iterable[dict]) -> str:
+    digest = hashlib.sha1()
+    for document in documents:
+        digest.update(f'{document["_id"]}.{document.get("revision", 0)};'.encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
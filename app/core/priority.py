@@ -0,0 +1,318 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from pymongo import monitoring
+from starlette.responses import JSONResponse
+from .config import get_settings
+from .request_context import current_lane
+
+settings = get_settings()
+
+# Lanes in priority order, highest first
+LANES = ("gate", "staff", "customer", "analytics")
+
+# First matching path prefix decides the lane; anything else is customer traffic
+LANE_PREFIXES = (
+    ("/validate", "gate"),
+    # Only the token refresh that keeps gate devices scanning; device login
+    # hashes a password and sessions are admin pages
+    ("/auth/device/refresh", "gate"),
+    ("/auth/device", "staff"),
+    ("/staff", "staff"),
+    ("/occupancy", "staff"),
+    ("/admin", "analytics"),
+)
+
+# Long-lived streams (SSE) would hold a concurrency slot until the client
+# disconnects; they are counted separately and only shed under pressure
+STREAMING_PATHS = ("/occupancy/stream",)
+
+# Load pressure (1.0 = at threshold) from which a lane is shed; gate
+# validation is never shed
+SHED_AT = {"gate": None, "staff": 4.0, "customer": 2.0, "analytics": 1.0}
+
+LANE_CONCURRENCY = {
+    "gate": settings.LANE_CONCURRENCY_GATE,
+    "staff": settings.LANE_CONCURRENCY_STAFF,
+    "customer": settings.LANE_CONCURRENCY_CUSTOMER,
+    "analytics": settings.LANE_CONCURRENCY_ANALYTICS,
+}
+
+# Lanes with a dedicated Mongo connection pool; the rest share the default client
+LANE_POOL_SIZES = {
+    "gate": settings.MONGO_POOL_GATE,
+    "staff": settings.MONGO_POOL_STAFF,
+    "analytics": settings.MONGO_POOL_ANALYTICS,
+}
+
+SAMPLE_SECONDS = 0.05
+HALF_LIFE_SECONDS = 1.0
+
+
+def classify(path: str) -> str:
+    for prefix, lane in LANE_PREFIXES:
+        if path.startswith(prefix):
+            return lane
+    return "customer"
+
+
+class DecayingPeak:
+    """
+    Latest peak of a latency signal, halving every HALF_LIFE_SECONDS so a
+    spike sheds load promptly and recovery follows within seconds
+    """
+
+    def __init__(self):
+        self._value = 0.0
+        self._at = time.monotonic()
+
+    def value(self) -> float:
+        return self._value * 0.5 ** ((time.monotonic() - self._at) / HALF_LIFE_SECONDS)
+
+    def observe(self, sample: float):
+        current = self.value()
+        self._value = max(sample, current)
+        self._at = time.monotonic()
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """
+    Time requests spend waiting for a connection from one client's pool.
+    Checkout start and finish are published on the same thread.
+    """
+
+    def __init__(self, peak: DecayingPeak):
+        self.peak = peak
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.monotonic()
+
+    def connection_checked_out(self, event):
+        self._observe()
+
+    def connection_check_out_failed(self, event):
+        self._observe()
+
+    def _observe(self):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            self.peak.observe((time.monotonic() - started) * 1000)
+            self._local.started = None
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class LoadMonitor:
+    """
+    Worker-local load signals behind the shedding decisions: event-loop lag,
+    sampled by a timer task, and connection wait per Mongo pool
+    """
+
+    def __init__(self):
+        self.loop_lag_ms = DecayingPeak()
+        self.pool_wait_ms: Dict[str, DecayingPeak] = {
+            lane: DecayingPeak() for lane in LANES
+        }
+        self.in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.streams: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.shed: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._task: Optional[asyncio.Task] = None
+
+    def pool_listener(self, lane: str) -> PoolWaitListener:
+        return PoolWaitListener(self.pool_wait_ms[lane])
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sample_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sample_loop(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(SAMPLE_SECONDS)
+            lag = time.monotonic() - started - SAMPLE_SECONDS
+            self.loop_lag_ms.observe(max(lag, 0.0) * 1000)
+
+    def pressure(self, lane: str) -> float:
+        """
+        Worst of loop lag, the gate pool's wait and the lane's own pool wait,
+        relative to their thresholds
+        """
+        return max(
+            self.loop_lag_ms.value() / settings.LOOP_LAG_THRESHOLD_MS,
+            self.pool_wait_ms["gate"].value() / settings.POOL_WAIT_THRESHOLD_MS,
+            self.pool_wait_ms[lane].value() / settings.POOL_WAIT_THRESHOLD_MS,
+        )
+
+    def admit(self, lane: str, streaming: bool = False) -> bool:
+        shed_at = SHED_AT[lane]
+        limit = LANE_CONCURRENCY[lane]
+        if (limit and not streaming and self.in_flight[lane] >= limit) or (
+            shed_at is not None and self.pressure(lane) >= shed_at
+        ):
+            self.shed[lane] += 1
+            return False
+        if streaming:
+            self.streams[lane] += 1
+        else:
+            self.in_flight[lane] += 1
+        self.admitted[lane] += 1
+        return True
+
+    def release(self, lane: str, streaming: bool = False):
+        if streaming:
+            self.streams[lane] -= 1
+        else:
+            self.in_flight[lane] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.loop_lag_ms.value(), 1),
+            "lanes": {
+                lane: {
+                    "pressure": round(self.pressure(lane), 2),
+                    "pool_wait_ms": round(self.pool_wait_ms[lane].value(), 1),
+                    "in_flight": self.in_flight[lane],
+                    "streams": self.streams[lane],
+                    "admitted": self.admitted[lane],
+                    "shed": self.shed[lane],
+                }
+                for lane in LANES
+            },
+        }
+
+
+load_monitor = LoadMonitor()
+
+
+class PriorityLaneMiddleware:
+    """
+    Pure ASGI middleware that puts each request in a priority lane, enforces
+    the lane's concurrency budget (streams excepted) and answers 503 with Retry-After when the
+    worker is too loaded for the lane. The lane is published for
+    MongoDB.get_db() to pick the lane's connection pool.
+    """
+
+    def __init__(self, app, monitor: LoadMonitor = load_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        lane = classify(scope["path"])
+        streaming = scope["path"] in STREAMING_PATHS
+        if not self.monitor.admit(lane, streaming):
+            response = JSONResponse(
+                {"detail": "Server busy, retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(settings.SHED_RETRY_AFTER_SECONDS)},
+            )
+            return await response(scope, receive, send)
+
+        token = current_lane.set(lane)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_lane.reset(token)
+            self.monitor.release(lane, streaming)
+
+
+if __name__ == "__main__":
+    # Gate latency under mixed load, with and without lanes:
+    # python -m app.core.priority
+    import random
+    import statistics
+
+    async def toy_app(scope, receive, send):
+        if scope["path"].startswith("/admin"):
+            # A heavy report: serialization holding the loop between awaits
+            for _ in range(4):
+                time.sleep(0.02)
+                await asyncio.sleep(0.005)
+        else:
+            await asyncio.sleep(0.003)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def request(app, path: str) -> tuple:
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        started = time.monotonic()
+        await app({"type": "http", "path": path, "method": "GET"}, receive, send)
+        return sent[0]["status"], (time.monotonic() - started) * 1000
+
+    async def run(with_lanes: bool, seconds: float = 4.0, seed: int = 3) -> dict:
+        rng = random.Random(seed)
+        monitor = LoadMonitor()
+        await monitor.start()
+        app = PriorityLaneMiddleware(toy_app, monitor) if with_lanes else toy_app
+        gate_ms, tasks, statuses = [], [], {"gate": [], "analytics": []}
+        # Open-loop arrivals: ~200 gate scans/s alongside ~20 report
+        # requests/s, which alone need more CPU than the loop has
+        started = time.monotonic()
+        at = 0.0
+        while at < seconds:
+            at += rng.expovariate(220)
+            lane = "analytics" if rng.random() < 0.09 else "gate"
+            path = "/admin/stats" if lane == "analytics" else "/validate/qr"
+            await asyncio.sleep(max(started + at - time.monotonic(), 0))
+            task = asyncio.create_task(request(app, path))
+            task.lane = lane
+            tasks.append(task)
+        for task in tasks:
+            status, elapsed = await task
+            statuses[task.lane].append(status)
+            if task.lane == "gate":
+                gate_ms.append(elapsed)
+        await monitor.stop()
+        gate_ms.sort()
+        return {
+            "gate_p50_ms": round(statistics.median(gate_ms), 1),
+            "gate_p99_ms": round(gate_ms[int(len(gate_ms) * 0.99)], 1),
+            "gate_rejected": sum(status != 200 for status in statuses["gate"]),
+            "reports_served": sum(status == 200 for status in statuses["analytics"]),
+            "reports_shed": sum(status == 503 for status in statuses["analytics"]),
+        }
+
+    print(f"shared loop: {asyncio.run(run(False))}")
+    print(f"with lanes:  {asyncio.run(run(True))}")
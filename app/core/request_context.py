@@ -0,0 +1,42 @@
+from contextvars import ContextVar
+from typing import Optional
+from starlette.routing import Match
+
+# Route template ("GET /bookings/{booking_id}") of the request being served.
+# Motor copies the context into its executor threads, so pymongo command
+# listeners can read it too.
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+# Priority lane of the request being served; None outside requests
+# (schedulers and other background work)
+current_lane: ContextVar[Optional[str]] = ContextVar("current_lane", default=None)
+
+
+def resolve_route(app, scope) -> str:
+    """
+    Return the route template matching the scope, falling back to the raw path
+    """
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return f"{scope['method']} {scope['path']}"
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware that publishes the matched route for the current request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = current_route.set(resolve_route(scope["app"], scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
@@ -1,19 +1,26 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from .config import get_settings
 
+# passlib/argon2 and jose are imported on first use (or by the startup
+# warm-up task) to keep them off the cold-start path
+
 settings = get_settings()
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+@lru_cache()
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["argon2"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -24,6 +31,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
@@ -0,0 +1,117 @@
+import asyncio
+import importlib
+import json
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+from .config import get_settings
+
+settings = get_settings()
+
+# Dependencies kept off the import path and loaded by the warm-up task instead
+WARM_UP_MODULES = (
+    "qrcode",
+    "PIL.Image",
+    "PIL.PngImagePlugin",
+    "jose.jwt",
+    "passlib.context",
+    "smtplib",
+    "email.mime.multipart",
+    "email.mime.text",
+)
+
+
+class StartupProfile:
+    """
+    Collects per-module import times and lifespan phase timings
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.phases: Dict[str, float] = {}
+        self.ready_ms = None
+
+    def import_module(self, name: str):
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports[name] = (time.perf_counter() - start) * 1000
+        return module
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - start) * 1000
+
+    def mark_ready(self):
+        self.ready_ms = (time.perf_counter() - self.started_at) * 1000
+
+    def report(self) -> dict:
+        return {
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "budget_ms": settings.STARTUP_BUDGET_MS,
+            "imports_ms": {name: round(ms, 1) for name, ms in self.imports.items()},
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "heavy_modules_loaded": [
+                name for name in WARM_UP_MODULES if name in sys.modules
+            ],
+        }
+
+
+def _import_heavy_modules():
+    for name in WARM_UP_MODULES:
+        importlib.import_module(name)
+
+    from .security import get_pwd_context
+    get_pwd_context().handler().get_backend()
+
+
+async def warm_up(profile: StartupProfile):
+    """
+    Load heavy dependencies off the request path after the app is serving
+    """
+    start = time.perf_counter()
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, _import_heavy_modules)
+    except Exception as e:
+        print(f"Warm-up failed: {str(e)}")
+    profile.phases["warm_up"] = (time.perf_counter() - start) * 1000
+
+
+def measure_cold_import(module: str = "main") -> dict:
+    """
+    Import the app in a fresh interpreter and report the wall time in ms
+    together with any warm-up module that got imported eagerly
+    """
+    code = (
+        "import json, sys, time; start = time.perf_counter(); "
+        f"import {module}; "
+        "elapsed = (time.perf_counter() - start) * 1000; "
+        f"print(json.dumps({{'ms': elapsed, 'eager': [m for m in {WARM_UP_MODULES!r} if m in sys.modules]}}))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+startup_profile = StartupProfile()
+
+
+if __name__ == "__main__":
+    # Cold-start regression check: python -m app.core.startup [runs]
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    results = [measure_cold_import() for _ in range(runs)]
+    timings: List[float] = sorted(result["ms"] for result in results)
+    median = timings[len(timings) // 2]
+    eager = sorted({name for result in results for name in result["eager"]})
+    print(f"cold import of main: median {median:.1f}ms over {runs} runs "
+          f"(budget {settings.STARTUP_BUDGET_MS}ms)")
+    if eager:
+        print(f"eagerly imported heavy modules: {', '.join(eager)}")
+    sys.exit(0 if median <= settings.STARTUP_BUDGET_MS and not eager else 1)
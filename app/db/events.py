@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Pass as event_id to read across every event
+ALL_EVENTS = "all"
+
+# Collections whose documents carry event_id
+EVENT_COLLECTIONS = (
+    "passes", "bookings", "staff_sales", "bookings_archive", "staff_sales_archive"
+)
+
+# Date placing an untagged document in an event's date range, and the one
+# used when a document lacks it
+EVENT_DATE_FIELDS: Dict[str, Tuple[str, Optional[str]]] = {
+    "passes": ("validity_start", "created_at"),
+    "bookings": ("pass_rules.validity_start", "created_at"),
+    "staff_sales": ("sale_time", None),
+    "bookings_archive": ("pass_rules.validity_start", "created_at"),
+    "staff_sales_archive": ("sale_time", None),
+}
+
+
+def current_event_id() -> str:
+    return settings.CURRENT_EVENT_ID
+
+
+def event_scope(event_id: Optional[str] = None) -> dict:
+    """
+    Query fragment limiting a read to one event: the current one by default,
+    every event for "all"
+    """
+    if event_id == ALL_EVENTS:
+        return {}
+    return {"event_id": event_id or current_event_id()}
+
+
+def dated_between(collection: str, start: datetime, end: datetime) -> dict:
+    field, fallback = EVENT_DATE_FIELDS[collection]
+    window = {"$gte": start, "$lt": end}
+    if fallback is None:
+        return {field: window}
+    return {"$or": [{field: window}, {field: None, fallback: window}]}
+
+
+async def backfill_event_ids(
+    db, event_id: str, start: datetime, end: datetime
+) -> Dict[str, int]:
+    """
+    One-time migration tagging documents written before events existed
+    with the event whose dates [start, end) they fall in; returns the
+    number tagged per collection. Run once per past event (admin route or
+    python -m app.db.events); documents outside every range stay untagged.
+    """
+    tagged = {}
+    for collection in EVENT_COLLECTIONS:
+        result = await db[collection].update_many(
+            {"event_id": None, **dated_between(collection, start, end)},
+            {"$set": {"event_id": event_id}}
+        )
+        tagged[collection] = result.modified_count
+    return tagged
+
+
+if __name__ == "__main__":
+    # python -m app.db.events navratri-2025 2025-09-01 2025-11-01
+    import asyncio
+    import sys
+    import motor.motor_asyncio
+
+    async def main(event_id: str, start: str, end: str):
+        client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URL)
+        tagged = await backfill_event_ids(
+            client[settings.DB_NAME], event_id,
+            datetime.fromisoformat(start), datetime.fromisoformat(end)
+        )
+        print(f"{event_id}: {tagged}")
+        client.close()
+
+    if len(sys.argv) != 4:
+        sys.exit("usage: python -m app.db.events EVENT_ID START END")
+    asyncio.run(main(*sys.argv[1:]))
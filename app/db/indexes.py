@@ -0,0 +1,184 @@
+from typing import List, Set, Tuple
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from ..core.config import get_settings
+
+settings = get_settings()
+
+
+# Duplicate values reported when a unique index cannot be built
+MAX_REPORTED_DUPLICATES = 20
+
+# (collection, field) pairs whose unique index could not be built on this
+# worker; writers check them explicitly until a restart builds the index
+UNIQUE_FALLBACKS: Set[Tuple[str, str]] = set()
+
+
+async def find_duplicates(db, collection: str, field: str) -> List[dict]:
+    """
+    Values of field held by more than one document, with their ids
+    """
+    return await db[collection].aggregate([
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}, "ids": {"$push": "$_id"}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": MAX_REPORTED_DUPLICATES},
+    ]).to_list(None)
+
+
+async def ensure_unique(db, collection: str, field: str) -> bool:
+    """
+    Unique index on field. Rows written before the index existed may
+    already collide; startup then goes on without it, reports the
+    duplicates to clean up and falls back to already_taken() checks until
+    the next start builds it.
+    """
+    try:
+        await db[collection].create_index([(field, ASCENDING)], unique=True)
+        UNIQUE_FALLBACKS.discard((collection, field))
+        return True
+    except OperationFailure as e:
+        if e.code not in (11000, 11001):
+            raise
+    UNIQUE_FALLBACKS.add((collection, field))
+    duplicates = await find_duplicates(db, collection, field)
+    print(f"Unique index on {collection}.{field} not built, duplicate values:")
+    for row in duplicates:
+        print(f"  {row['_id']!r}: {row['count']} documents {[str(_id) for _id in row['ids']]}")
+    return False
+
+
+async def already_taken(db, collection: str, field: str, value) -> bool:
+    """
+    Explicit duplicate check for a unique field whose index is missing;
+    always False while the index enforces uniqueness itself
+    """
+    if (collection, field) not in UNIQUE_FALLBACKS:
+        return False
+    return await db[collection].find_one({field: value}, {"_id": 1}) is not None
+
+
+async def ensure_indexes(db):
+    """
+    Create the indexes the API relies on. create_index is a no-op when the
+    index already exists, so this is safe to run on every startup.
+    """
+    await db["idempotency_keys"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    )
+    await db["occupancy_counters"].create_index([("night", ASCENDING)])
+    await db["staff_sales"].create_index(
+        [("staff_id", ASCENDING), ("sale_time", DESCENDING)]
+    )
+    await db["staff_sales_daily"].create_index(
+        [("staff_id", ASCENDING), ("day", ASCENDING)]
+    )
+    await db["staff_sales_daily"].create_index([("day", ASCENDING)])
+    await db["bookings"].create_index([("pass_id", ASCENDING)])
+    await db["device_sessions"].create_index(
+        [("expires_at", ASCENDING)], expireAfterSeconds=0
+    )
+    await db["device_sessions"].create_index([("token_hash", ASCENDING)], unique=True)
+    await db["device_sessions"].create_index([("previous_token_hash", ASCENDING)])
+    await db["device_sessions"].create_index([("superseded_token_hash", ASCENDING)])
+    await db["device_sessions"].create_index(
+        [("user_id", ASCENDING), ("device_id", ASCENDING)], unique=True
+    )
+    await db["payment_events"].create_index(
+        [("event_id", ASCENDING)], unique=True, sparse=True
+    )
+    await db["payment_events"].create_index(
+        [("status", ASCENDING), ("received_at", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("payment_status", ASCENDING), ("created_at", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("status", ASCENDING), ("pass_rules.validity_end", ASCENDING)]
+    )
+    await db["staff_sales"].create_index([("booking_id", ASCENDING)])
+    # Only sales the daily summary has not counted yet, for the reconcile
+    await db["staff_sales"].create_index(
+        [("sale_time", ASCENDING)],
+        partialFilterExpression={"summarized": False}
+    )
+    await db["bookings_archive"].create_index([("user_id", ASCENDING)])
+    await db["staff_sales_archive"].create_index(
+        [("staff_id", ASCENDING), ("sale_time", DESCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("user_id", ASCENDING), ("created_at", DESCENDING)]
+    )
+    await db["occupancy_counters"].create_index([("at", ASCENDING)])
+    await ensure_unique(db, "users", "email")
+    await ensure_unique(db, "discounts", "code")
+    await db["scan_events"].create_index(
+        [("booking_id", ASCENDING), ("scanned_at", ASCENDING)]
+    )
+    await db["scan_events"].create_index([("scanned_at", ASCENDING)])
+    await db["scan_events"].create_index(
+        [("gate", ASCENDING), ("scanned_at", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("cancel_job", ASCENDING), ("refund_status", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("cancel_job", ASCENDING), ("cancellation_notice", ASCENDING), ("user_id", ASCENDING)]
+    )
+    await db["bookings"].create_index([("refund_status", ASCENDING), ("status", ASCENDING)])
+    await db["cancellation_jobs"].create_index(
+        [("status", ASCENDING), ("heartbeat_at", ASCENDING)]
+    )
+    # Event-prefixed indexes: reads scoped to the current event only walk
+    # that event's key range, however many past events the collections hold
+    await db["passes"].create_index([("event_id", ASCENDING), ("is_active", ASCENDING)])
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("user_id", ASCENDING), ("created_at", DESCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("payment_status", ASCENDING), ("created_at", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("created_at", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("is_group", ASCENDING), ("status", ASCENDING)]
+    )
+    await db["bookings"].create_index([("event_id", ASCENDING), ("pass_id", ASCENDING)])
+    await db["staff_sales"].create_index(
+        [("event_id", ASCENDING), ("staff_id", ASCENDING), ("sale_time", DESCENDING)]
+    )
+    await db["bookings_archive"].create_index(
+        [("event_id", ASCENDING), ("user_id", ASCENDING)]
+    )
+    await db["staff_sales_archive"].create_index(
+        [("event_id", ASCENDING), ("staff_id", ASCENDING), ("sale_time", DESCENDING)]
+    )
+    # Phone lookup at the gate: normalized number for prefix search, last
+    # four digits for suffix search
+    await db["users"].create_index([("phone_normalized", ASCENDING)])
+    await db["users"].create_index([("phone_last4", ASCENDING)])
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("group_members.phone_normalized", ASCENDING), ("status", ASCENDING)]
+    )
+    await db["bookings"].create_index(
+        [("event_id", ASCENDING), ("group_members.phone_last4", ASCENDING), ("status", ASCENDING)]
+    )
+
+
+if __name__ == "__main__":
+    # Report values that block the unique indexes: python -m app.db.indexes
+    import asyncio
+    import motor.motor_asyncio
+
+    async def main():
+        client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.DB_NAME]
+        for collection, field in (("users", "email"), ("discounts", "code")):
+            duplicates = await find_duplicates(db, collection, field)
+            print(f"{collection}.{field}: {len(duplicates)} duplicated values")
+            for row in duplicates:
+                print(f"  {row['_id']!r}: {[str(_id) for _id in row['ids']]}")
+        client.close()
+
+    asyncio.run(main())
@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from .passes import PassType, PassSummary
+from .common import ObjectIdStr
 
 class PaymentStatus(str, Enum):
     PENDING = "pending"
@@ -19,6 +21,14 @@ class GroupMember(BaseModel):
     phone: str
     entry_status: bool = False
 
+class PassRules(BaseModel):
+    """Entry rules copied from the pass at booking time so the gate can
+    enforce them without reading the pass"""
+    type: Optional[PassType] = None
+    max_entries: int = 1
+    validity_start: Optional[datetime] = None
+    validity_end: Optional[datetime] = None
+
 class BookingBase(BaseModel):
     user_id: str
     pass_id: str
@@ -27,18 +37,21 @@ class BookingBase(BaseModel):
     payment_status: PaymentStatus = PaymentStatus.PENDING
     discount_applied: Optional[float] = None
     sold_by: Optional[str] = None  # staff_id or "online"
+    event_id: Optional[str] = None  # copied from the pass
 
 class BookingCreate(BookingBase):
     pass
 
 class BookingInDB(BookingBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     qr_code: str 
     group_qr_codes: Optional[List[str]] = None 
     status: BookingStatus = BookingStatus.ACTIVE
     created_at: datetime = Field(default_factory=datetime.now)
     payment_id: Optional[str] = None
     amount_paid: float = 0
+    pass_rules: Optional[PassRules] = None
+    entries_used: int = 0
 
 class BookingUpdate(BaseModel):
     payment_status: Optional[PaymentStatus] = None
@@ -46,12 +59,34 @@ class BookingUpdate(BaseModel):
     group_members: Optional[List[GroupMember]] = None
 
 class Booking(BookingBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     qr_code: str
     status: BookingStatus
     created_at: datetime
     payment_id: Optional[str]
     amount_paid: float
+    pass_rules: Optional[PassRules] = None
+    entries_used: int = 0
+
+class WalletBooking(BaseModel):
+    """Booking as shown in the app's wallet, with its pass embedded"""
+    id: ObjectIdStr = Field(..., alias="_id")
+    pass_id: str
+    event_id: Optional[str] = None
+    is_group: bool = False
+    group_members: Optional[List[GroupMember]] = None
+    payment_status: PaymentStatus
+    status: BookingStatus
+    created_at: datetime
+    amount_paid: float = 0
+    entries_used: int = 0
+    pass_rules: Optional[PassRules] = None
+    qr_code: Optional[str] = None
+    pass_details: Optional[PassSummary] = None
+
+class GroupAdmission(BaseModel):
+    count: Optional[int] = None
+    member_indexes: Optional[List[int]] = None
 
 class QRValidationResponse(BaseModel):
     valid: bool
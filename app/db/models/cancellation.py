@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import date, datetime
+from .booking import BookingStatus
+from .common import ObjectIdStr
+
+class CancellationSelector(BaseModel):
+    """Bookings a mass cancellation applies to. `night` matches passes whose
+    validity lies within that event night, so season passes are only
+    cancelled when selected by pass_id."""
+    pass_id: Optional[str] = None
+    night: Optional[date] = None
+    statuses: List[BookingStatus] = [BookingStatus.ACTIVE]
+    reason: str = "event_cancelled"
+
+class CancellationJob(BaseModel):
+    id: ObjectIdStr = Field(..., alias="_id")
+    selector: CancellationSelector
+    status: str
+    created_by: str
+    created_at: datetime
+    cutoff: datetime
+    matched: int = 0
+    cancelled: int = 0
+    refunded: int = 0
+    refunds_failed: int = 0
+    notified: int = 0
+    phase: Optional[str] = None
+    failure: Optional[str] = None
+    finished_at: Optional[datetime] = None
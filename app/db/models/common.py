@@ -0,0 +1,5 @@
+from typing import Annotated
+from pydantic import BeforeValidator
+
+# Mongo hands back ObjectId values for _id; the API exposes them as strings
+ObjectIdStr = Annotated[str, BeforeValidator(str)]
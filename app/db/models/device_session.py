@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from .common import ObjectIdStr
+
+class DeviceSession(BaseModel):
+    id: ObjectIdStr = Field(..., alias="_id")
+    user_id: str
+    device_id: str
+    created_at: datetime
+    last_refreshed_at: Optional[datetime] = None
+    expires_at: datetime
+    revoked: bool = False
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from .passes import PassType
+from .common import ObjectIdStr
 
 class DiscountBase(BaseModel):
     code: str
@@ -14,7 +15,7 @@ class DiscountCreate(DiscountBase):
     pass
 
 class DiscountInDB(DiscountBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_at: datetime = Field(default_factory=datetime.now)
     is_active: bool = True
     times_used: int = 0
@@ -29,7 +30,7 @@ class DiscountUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 class Discount(DiscountBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_at: datetime
     is_active: bool
     times_used: int
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from .common import ObjectIdStr
 
 class PassType(str, Enum):
     DAILY = "daily"
@@ -24,7 +25,7 @@ class PassCreate(PassBase):
     created_by: str
 
 class PassInDB(PassBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_by: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
@@ -37,7 +38,7 @@ class PassUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 class Pass(PassBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_by: str
     created_at: datetime
     is_active: bool
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from .common import ObjectIdStr
 
 class PassType(str, Enum):
     DAILY = "daily"
@@ -21,12 +22,13 @@ class PassBase(BaseModel):
     description: Optional[str] = None
     early_bird_end: Optional[datetime] = None
     available_quantity: Optional[int] = None
+    event_id: Optional[str] = None  # defaults to the current event
 
 class PassCreate(PassBase):
     created_by: str
 
 class PassInDB(PassBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_by: str
     created_at: datetime = Field(default_factory=datetime.now)
     is_active: bool = True
@@ -39,7 +41,15 @@ class PassUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 class Pass(PassBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     created_by: str
     created_at: datetime
     is_active: bool
+
+class PassSummary(BaseModel):
+    id: ObjectIdStr = Field(..., alias="_id")
+    name: str
+    type: PassType
+    validity_start: datetime
+    validity_end: datetime
+    description: Optional[str] = None
@@ -3,6 +3,7 @@ from typing import Optional
 from datetime import datetime
 from enum import Enum
 from .passes import PassType
+from .common import ObjectIdStr
 
 class PaymentMode(str, Enum):
     CASH = "cash"
@@ -13,17 +14,30 @@ class StaffSaleBase(BaseModel):
     booking_id: str
     discount_applied: float = 0
     payment_mode: PaymentMode
+    event_id: Optional[str] = None
 
 class StaffSaleCreate(StaffSaleBase):
     pass
 
 class StaffSaleInDB(StaffSaleBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     sale_time: datetime = Field(default_factory=datetime.now)
+    gross_amount: Optional[float] = None
+    amount_paid: Optional[float] = None
     commission: Optional[float] = None
     booking_type: Optional[PassType] = None
 
 class StaffSale(StaffSaleBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     sale_time: datetime
+    gross_amount: Optional[float] = None
+    amount_paid: Optional[float] = None
     commission: Optional[float]
+
+class StaffSalesDaily(BaseModel):
+    staff_id: str
+    day: str
+    count: int
+    gross: float
+    discount: float
+    net: float
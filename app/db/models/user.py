@@ -2,6 +2,7 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from .common import ObjectIdStr
 
 class UserRole(str, Enum):
     USER = "user"
@@ -17,7 +18,7 @@ class UserCreate(UserBase):
     password: str
 
 class UserInDB(UserBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     role: UserRole = UserRole.USER
     password_hash: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -30,6 +31,6 @@ class UserUpdate(BaseModel):
     phone: Optional[str] = None
 
 class User(UserBase):
-    id: str = Field(..., alias="_id")
+    id: ObjectIdStr = Field(..., alias="_id")
     role: UserRole
     created_at: datetime
@@ -1,26 +1,117 @@
+import os
 import motor.motor_asyncio
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.server_type import SERVER_TYPE
 from ..core.config import get_settings
+from ..core.priority import load_monitor, LANE_POOL_SIZES
+from ..core.request_context import current_lane
+from .query_stats import query_stats
+from .indexes import ensure_indexes
 
 settings = get_settings()
 motorClient = motor.motor_asyncio.AsyncIOMotorClient
 
+# pymongo rejects maxStalenessSeconds below 90
+MIN_MAX_STALENESS_SECONDS = 90
+
 class MongoDB:
     client: motorClient = None
     db = None
+    analytics_db = None
+    pid = None
+    # Priority lane -> (client, database) with a dedicated connection pool
+    lane_clients = {}
+    lane_dbs = {}
 
     @classmethod
     async def connect_to_database(cls):
+        # A client inherited across fork shares sockets with the parent, so
+        # every worker process builds its own
+        if cls.client is not None and cls.pid != os.getpid():
+            cls.client = None
+            cls.db = None
+            cls.analytics_db = None
+            cls.lane_clients = {}
+            cls.lane_dbs = {}
         if cls.client is None:
-            cls.client = motorClient(settings.MONGODB_URL)
+            cls.pid = os.getpid()
+            # Lanes without a pool of their own share this client with
+            # background jobs
+            cls.client = motorClient(
+                settings.MONGODB_URL,
+                event_listeners=[query_stats, load_monitor.pool_listener("customer")]
+            )
             cls.db = cls.client[settings.DB_NAME]
+            # A heavy report or a slow lane can exhaust only its own pool,
+            # never the gate's
+            for lane, pool_size in LANE_POOL_SIZES.items():
+                if pool_size:
+                    cls.lane_clients[lane] = motorClient(
+                        settings.MONGODB_URL,
+                        maxPoolSize=pool_size,
+                        event_listeners=[query_stats, load_monitor.pool_listener(lane)]
+                    )
+                    cls.lane_dbs[lane] = cls.lane_clients[lane][settings.DB_NAME]
+            # Reporting reads may lag the primary by a bounded amount so they
+            # stay off the node taking gate validation writes
+            cls.analytics_db = cls.lane_clients.get("analytics", cls.client).get_database(
+                settings.DB_NAME,
+                read_preference=SecondaryPreferred(
+                    max_staleness=max(
+                        settings.ANALYTICS_MAX_STALENESS_SECONDS,
+                        MIN_MAX_STALENESS_SECONDS
+                    )
+                ),
+                read_concern=ReadConcern("local"),
+            )
+            await ensure_indexes(cls.db)
 
     @classmethod
     async def close_database_connection(cls):
+        for client in cls.lane_clients.values():
+            client.close()
+        cls.lane_clients = {}
+        cls.lane_dbs = {}
         if cls.client is not None:
             cls.client.close()
             cls.client = None
             cls.db = None
+            cls.analytics_db = None
 
     @classmethod
     def get_db(cls):
-        return cls.db
+        """
+        Database handle on the current request's lane pool, or the default
+        client outside requests
+        """
+        return cls.lane_dbs.get(current_lane.get(), cls.db)
+
+    @classmethod
+    def get_analytics_db(cls):
+        return cls.analytics_db
+
+    @classmethod
+    def replication_lag(cls) -> float:
+        """
+        Worst replication lag in seconds among secondaries, estimated from the
+        driver's heartbeat data; 0 on a standalone or without a known primary
+        """
+        if cls.client is None:
+            return 0.0
+        servers = cls.client.topology_description.server_descriptions().values()
+        primary = next(
+            (s for s in servers if s.server_type == SERVER_TYPE.RSPrimary), None
+        )
+        if primary is None or primary.last_write_date is None:
+            return 0.0
+        lag = 0.0
+        for server in servers:
+            if server.server_type != SERVER_TYPE.RSSecondary or server.last_write_date is None:
+                continue
+            behind = (
+                (server.last_update_time - primary.last_update_time)
+                - (server.last_write_date - primary.last_write_date).total_seconds()
+            )
+            lag = max(lag, behind)
+        return lag
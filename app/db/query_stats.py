@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pymongo import monitoring
+from ..core.config import get_settings
+from ..core.request_context import current_route
+
+settings = get_settings()
+logger = logging.getLogger("app.slow_query")
+
+# Commands that carry no query shape worth tracking
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "authenticate", "explain", "killCursors",
+    "getMore",
+}
+
+# Where each command keeps the filter/pipeline that defines its shape
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+}
+
+MAX_SHAPES = 1000
+MAX_SLOW_ENTRIES = 200
+
+
+def normalize(value: Any) -> Any:
+    """
+    Replace literal values with 1 while keeping field names and operators
+    """
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            return [normalize(item) for item in value]
+        return 1
+    return 1
+
+
+def extract_filter(command_name: str, command: dict) -> Any:
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name]) or {}
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q", {})
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q", {})
+    return None
+
+
+class ShapeStats:
+    __slots__ = (
+        "collection", "command", "shape", "sample",
+        "count", "total_ms", "max_ms", "routes",
+    )
+
+    def __init__(self, collection: str, command: str, shape: str, sample: Any):
+        self.collection = collection
+        self.command = command
+        self.shape = shape
+        self.sample = sample
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.routes = Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "collection": self.collection,
+            "command": self.command,
+            "shape": json.loads(self.shape),
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "max_ms": round(self.max_ms, 3),
+            "routes": dict(self.routes.most_common(5)),
+        }
+
+
+class QueryStatsListener(monitoring.CommandListener):
+    """
+    Records duration, collection, normalized query shape and originating route
+    of every command issued through the Motor client
+    """
+
+    def __init__(self, slow_threshold_ms: float):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._pending: Dict[int, tuple] = {}
+        self._shapes: Dict[tuple, ShapeStats] = {}
+        self._slow = deque(maxlen=MAX_SLOW_ENTRIES)
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = None
+        sample = extract_filter(event.command_name, command)
+        shape = json.dumps(normalize(sample), sort_keys=True, default=str)
+        with self._lock:
+            self._pending[event.request_id] = (
+                event.command_name, collection, shape, sample, current_route.get()
+            )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+
+        command_name, collection, shape, sample, route = pending
+        duration_ms = event.duration_micros / 1000
+        key = (collection, command_name, shape)
+        with self._lock:
+            stats = self._shapes.get(key)
+            if stats is None and len(self._shapes) < MAX_SHAPES:
+                stats = self._shapes[key] = ShapeStats(
+                    collection, command_name, shape, sample
+                )
+            # Shapes beyond MAX_SHAPES get no stats but are still logged when slow
+            if stats is not None:
+                stats.sample = sample
+                stats.count += 1
+                stats.total_ms += duration_ms
+                stats.max_ms = max(stats.max_ms, duration_ms)
+                stats.routes[route] += 1
+
+        if duration_ms >= self.slow_threshold_ms:
+            entry = {
+                "at": datetime.utcnow(),
+                "duration_ms": round(duration_ms, 3),
+                "collection": collection,
+                "command": command_name,
+                "shape": json.loads(shape),
+                "route": route,
+            }
+            self._slow.append(entry)
+            logger.warning(
+                "slow query %.1fms %s.%s shape=%s route=%s",
+                duration_ms, collection, command_name, shape, route,
+            )
+
+    def top_shapes(self, limit: int = 20) -> List[ShapeStats]:
+        with self._lock:
+            shapes = list(self._shapes.values())
+        shapes.sort(key=lambda stats: stats.total_ms, reverse=True)
+        return shapes[:limit]
+
+    def slow_queries(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            entries = list(self._slow)
+        return entries[-limit:][::-1]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+
+
+def summarize_plan(plan: dict) -> dict:
+    """
+    Flatten a winning plan into its stages and the indexes it uses
+    """
+    stages, indexes = [], []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "indexName" in node:
+            indexes.append(node["indexName"])
+        stack.extend(node.get("inputStages", []))
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        if "queryPlan" in node:
+            stack.append(node["queryPlan"])
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+    }
+
+
+async def explain_shape(db, stats: ShapeStats) -> Optional[dict]:
+    """
+    Run explain() for the last seen instance of a shape
+    """
+    if not stats.collection or stats.sample is None:
+        return None
+    if stats.command == "aggregate":
+        command = {"aggregate": stats.collection, "pipeline": stats.sample, "cursor": {}}
+    else:
+        command = {"find": stats.collection, "filter": stats.sample}
+
+    try:
+        result = await db.command("explain", command, verbosity="queryPlanner")
+    except Exception as e:
+        return {"error": str(e)}
+
+    planner = result.get("queryPlanner")
+    if planner is None:
+        # Aggregations report the planner inside the first $cursor stage
+        for stage in result.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    if planner is None:
+        return {"stages": [], "indexes": [], "collection_scan": False}
+    return summarize_plan(planner.get("winningPlan", {}))
+
+
+query_stats = QueryStatsListener(slow_threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS)
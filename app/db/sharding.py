@@ -0,0 +1,59 @@
+from typing import Dict
+from pymongo import ASCENDING
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Ranged on event first, so each event's documents form their own chunks
+# and a past event's chunks can be left on (or zoned to) colder shards
+SHARD_KEYS = {
+    "passes": [("event_id", ASCENDING), ("_id", ASCENDING)],
+    "bookings": [("event_id", ASCENDING), ("_id", ASCENDING)],
+    "staff_sales": [("event_id", ASCENDING), ("_id", ASCENDING)],
+}
+
+
+async def shard_event_collections(client, db_name: str) -> Dict[str, dict]:
+    """
+    Shard the event-scoped collections on an event-prefixed key. Needs a
+    mongos connection; run it once, after backfilling event_id, since
+    documents without one would all land in the null-event chunk.
+
+    Reads that carry event_id are routed to that event's shards only.
+    Lookups by _id alone (a QR scan, GET /bookings/{id}) are still
+    answered, but go to every shard.
+    """
+    db = client[db_name]
+    await client.admin.command("enableSharding", db_name)
+    results = {}
+    for collection, key in SHARD_KEYS.items():
+        # Existing collections need an index backing the shard key
+        await db[collection].create_index(key)
+        results[collection] = await client.admin.command(
+            "shardCollection", f"{db_name}.{collection}", key=dict(key)
+        )
+    return results
+
+
+if __name__ == "__main__":
+    # Against a local sharded test cluster (MONGODB_URL pointing at mongos):
+    # python -m app.db.sharding
+    import asyncio
+    import motor.motor_asyncio
+    from .events import current_event_id
+
+    async def main():
+        client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URL)
+        for collection, result in (await shard_event_collections(client, settings.DB_NAME)).items():
+            print(f"{collection}: {result.get('collectionsharded', result)}")
+
+        plan = await client[settings.DB_NAME].command(
+            "explain",
+            {"find": "bookings", "filter": {"event_id": current_event_id(), "user_id": "probe"}},
+            verbosity="queryPlanner",
+        )
+        shards = plan.get("queryPlanner", {}).get("winningPlan", {}).get("shards", [])
+        print(f"current-event booking query targets {len(shards) or 1} shard(s)")
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import Dict, Iterable
+from bson import ObjectId
+from pymongo import UpdateOne
+from ..db.events import current_event_id
+from ..db.models.booking import BookingCreate, BookingStatus
+from .cache_service import invalidation_bus
+from .qr_service import generate_qr_code
+from .phone_lookup_service import with_phone_keys
+
+
+def pass_rules_for(pass_: dict) -> dict:
+    """
+    Entry rules denormalized from the pass onto each booking
+    """
+    return {
+        "type": pass_.get("type"),
+        "max_entries": pass_.get("max_entries", 1),
+        "validity_start": pass_.get("validity_start"),
+        "validity_end": pass_.get("validity_end"),
+    }
+
+
+# Bookings sold before pass rules were denormalized, or given a partial
+# copy by a pass edit
+LEGACY_RULES = {"pass_rules.type": {"$exists": False}}
+
+
+async def backfill_pass_rules(db) -> Dict[str, int]:
+    """
+    One-time copy of each pass's entry rules onto its legacy bookings.
+    Individual bookings that a multi-entry pass flipped to "used" after
+    their first entry are reopened for the entries they have left; those
+    without an entry count are taken to have used one.
+    """
+    updated = {"bookings": 0, "reopened": 0}
+    for pass_id in await db["bookings"].distinct("pass_id", LEGACY_RULES):
+        if not ObjectId.is_valid(pass_id):
+            continue
+        pass_ = await db["passes"].find_one({"_id": ObjectId(pass_id)})
+        if pass_ is None:
+            continue
+        rules = pass_rules_for(pass_)
+        legacy = {"pass_id": pass_id, **LEGACY_RULES}
+        if rules["max_entries"] > 1:
+            used = {**legacy, "status": "used", "is_group": {"$ne": True}}
+            for query, update in (
+                ({**used, "entries_used": None}, {"status": "active", "entries_used": 1}),
+                ({**used, "entries_used": {"$lt": rules["max_entries"]}}, {"status": "active"}),
+            ):
+                result = await db["bookings"].update_many(query, {"$set": update})
+                updated["reopened"] += result.modified_count
+        result = await db["bookings"].update_many(
+            legacy, {"$set": {"pass_rules": rules}, "$inc": {"revision": 1}}
+        )
+        updated["bookings"] += result.modified_count
+    return updated
+
+
+def build_booking(booking: BookingCreate, pass_: dict, amount: float) -> dict:
+    """
+    Booking document ready for insert, with its QR code rendered
+    """
+    booking_dict = booking.dict()
+    booking_dict["_id"] = ObjectId()
+    booking_dict["qr_code"] = generate_qr_code(str(booking_dict["_id"]))
+    booking_dict["amount_paid"] = amount
+    booking_dict["status"] = BookingStatus.ACTIVE.value
+    booking_dict["created_at"] = datetime.now()
+    booking_dict["payment_id"] = None
+    booking_dict["pass_rules"] = pass_rules_for(pass_)
+    booking_dict["entries_used"] = 0
+    booking_dict["revision"] = 1
+    booking_dict["event_id"] = pass_.get("event_id") or current_event_id()
+    booking_dict["group_members"] = with_phone_keys(booking_dict["group_members"])
+    return booking_dict
+
+
+async def inventory_changed(pass_ids: Iterable[str]):
+    """
+    Drop cached copies of passes whose available_quantity moved, and the
+    catalogs listing them, so their ETags follow the new revision
+    """
+    pass_ids = set(pass_ids)
+    if not pass_ids:
+        return
+    for pass_id in pass_ids:
+        await invalidation_bus.publish("passes", pass_id)
+    await invalidation_bus.publish("catalog")
+
+
+async def reserve_inventory(db, pass_: dict, publish: bool = True) -> bool:
+    """
+    Take one unit of a pass with limited quantity; False when sold out.
+    Passes without available_quantity are unlimited. Batch callers pass
+    publish=False and call inventory_changed() once for the batch.
+    """
+    if pass_.get("available_quantity") is None:
+        return True
+    result = await db["passes"].update_one(
+        {"_id": pass_["_id"], "available_quantity": {"$gte": 1}},
+        {"$inc": {"available_quantity": -1, "revision": 1}}
+    )
+    if result.modified_count == 1 and publish:
+        await inventory_changed([str(pass_["_id"])])
+    return result.modified_count == 1
+
+
+async def release_inventory(db, released: Dict[str, int]):
+    """
+    Return units to their passes, keyed by pass id. Unlimited passes are
+    left untouched.
+    """
+    operations = [
+        UpdateOne(
+            {"_id": ObjectId(pass_id), "available_quantity": {"$ne": None}},
+            {"$inc": {"available_quantity": count, "revision": 1}}
+        )
+        for pass_id, count in released.items()
+        if count and ObjectId.is_valid(pass_id)
+    ]
+    if operations:
+        await db["passes"].bulk_write(operations, ordered=False)
+        await inventory_changed(
+            pass_id for pass_id, count in released.items()
+            if count and ObjectId.is_valid(pass_id)
+        )
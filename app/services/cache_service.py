@@ -0,0 +1,254 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from ..core.config import get_settings
+
+settings = get_settings()
+
+INVALIDATIONS_COLLECTION = "cache_invalidations"
+RETRY_SECONDS = 1
+
+# Identifies this worker process on the bus so it can skip its own messages
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class LocalCache:
+    """
+    Worker-local TTL + LRU cache. Values are shared between requests and must
+    be treated as read-only by callers.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_size: int):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[str] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+caches: Dict[str, LocalCache] = {
+    name: LocalCache(name, settings.CACHE_TTL_SECONDS, settings.CACHE_MAX_SIZE)
+    for name in ("passes", "principals", "discounts", "sessions", "catalog")
+}
+pass_cache = caches["passes"]
+principal_cache = caches["principals"]
+discount_cache = caches["discounts"]
+session_cache = caches["sessions"]
+catalog_cache = caches["catalog"]
+
+
+class InvalidationBus:
+    """
+    Broadcasts cache invalidations to every worker.
+
+    Messages are appended to a capped collection. Workers follow it with a
+    tailable cursor, or with a change stream when CACHE_BUS_MODE is
+    "change_stream" and the deployment is a replica set. Cache TTLs bound
+    staleness if the bus falls behind.
+
+    Other worker-local state can ride the same bus: subscribe() a handler
+    for a namespace and broadcast() payloads to it.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.db = None
+        self._task: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, Callable[[Any], None]] = {}
+
+    def subscribe(self, namespace: str, handler: Callable[[Any], None]):
+        self._handlers[namespace] = handler
+
+    async def broadcast(self, namespace: str, payload: Any):
+        """
+        Deliver a payload to the namespace's handler in every other worker
+        """
+        if self.db is None:
+            return
+        try:
+            await self.db[INVALIDATIONS_COLLECTION].insert_one({
+                "namespace": namespace,
+                "payload": payload,
+                "origin": WORKER_ID,
+                "at": datetime.utcnow(),
+            })
+        except PyMongoError as e:
+            print(f"Bus broadcast failed: {str(e)}")
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await db.create_collection(
+                INVALIDATIONS_COLLECTION, capped=True, size=settings.CACHE_BUS_SIZE_BYTES
+            )
+        except CollectionInvalid:
+            pass
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.db = None
+
+    async def publish(self, namespace: str, key: Optional[str] = None):
+        """
+        Drop the entry locally and tell the other workers to do the same
+        """
+        caches[namespace].invalidate(key)
+        if self.db is None:
+            return
+        try:
+            await self.db[INVALIDATIONS_COLLECTION].insert_one({
+                "namespace": namespace,
+                "key": key,
+                "origin": WORKER_ID,
+                "at": datetime.utcnow(),
+            })
+        except PyMongoError as e:
+            print(f"Cache invalidation publish failed: {str(e)}")
+
+    def _apply(self, message: dict):
+        if message.get("origin") == WORKER_ID:
+            return
+        handler = self._handlers.get(message.get("namespace"))
+        if handler is not None:
+            handler(message.get("payload"))
+            return
+        cache = caches.get(message.get("namespace"))
+        if cache is not None:
+            cache.invalidate(message.get("key"))
+
+    async def _follow(self):
+        while True:
+            try:
+                if self.mode == "change_stream":
+                    await self._follow_change_stream()
+                else:
+                    await self._follow_capped()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cache invalidation bus error: {str(e)}")
+            # Anything published while we were disconnected is unknown, so
+            # start over with empty caches
+            for cache in caches.values():
+                cache.invalidate()
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        async with self.db[INVALIDATIONS_COLLECTION].watch(pipeline) as stream:
+            async for change in stream:
+                self._apply(change["fullDocument"])
+
+    async def _follow_capped(self):
+        collection = self.db[INVALIDATIONS_COLLECTION]
+        # A tailable cursor on an empty capped collection dies immediately,
+        # so anchor the tail on a marker document from this worker
+        marker = ObjectId()
+        await collection.insert_one({"_id": marker, "origin": WORKER_ID})
+        cursor = collection.find(
+            {"_id": {"$gte": marker}}, cursor_type=CursorType.TAILABLE_AWAIT
+        )
+        while cursor.alive:
+            async for message in cursor:
+                self._apply(message)
+
+
+invalidation_bus = InvalidationBus(mode=settings.CACHE_BUS_MODE)
+
+
+async def get_cached_pass(db, pass_id: str) -> Optional[dict]:
+    pass_ = pass_cache.get(pass_id)
+    if pass_ is None:
+        pass_ = await db["passes"].find_one({"_id": ObjectId(pass_id)})
+        if pass_ is not None:
+            pass_cache.set(pass_id, pass_)
+    return pass_
+
+
+async def get_cached_passes(db, pass_ids: List[str]) -> Dict[str, dict]:
+    """
+    Several passes at once; cache misses are filled with a single $in query
+    """
+    passes = {}
+    missing = []
+    for pass_id in set(pass_ids):
+        pass_ = pass_cache.get(pass_id)
+        if pass_ is not None:
+            passes[pass_id] = pass_
+        elif ObjectId.is_valid(pass_id):
+            missing.append(ObjectId(pass_id))
+    if missing:
+        async for pass_ in db["passes"].find({"_id": {"$in": missing}}):
+            pass_cache.set(str(pass_["_id"]), pass_)
+            passes[str(pass_["_id"])] = pass_
+    return passes
+
+
+async def get_cached_principal(db, user_id: str) -> Optional[dict]:
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await db["users"].find_one({"_id": ObjectId(user_id)})
+        if user is not None:
+            principal_cache.set(user_id, user)
+    return user
+
+
+async def get_cached_session(db, session_id: str) -> Optional[dict]:
+    session = session_cache.get(session_id)
+    if session is None:
+        session = await db["device_sessions"].find_one(
+            {"_id": ObjectId(session_id)}, {"token_hash": 0, "previous_token_hash": 0, "superseded_token_hash": 0}
+        )
+        if session is not None:
+            session_cache.set(session_id, session)
+    return session
+
+
+async def get_cached_staff_discounts(db, staff_id: str) -> list:
+    """
+    Active discounts assigned to a staff member, filtered for expiry on read
+    """
+    discounts = discount_cache.get(staff_id)
+    if discounts is None:
+        discounts = await db["discounts"].find({
+            "assigned_to": staff_id,
+            "is_active": True
+        }).to_list(None)
+        discount_cache.set(staff_id, discounts)
+    now = datetime.utcnow()
+    return [discount for discount in discounts if discount["expiry"] > now]
@@ -0,0 +1,157 @@
+import hashlib
+import random
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from ..core.config import get_settings
+from ..core.security import create_access_token
+from .cache_service import invalidation_bus
+
+settings = get_settings()
+
+SESSIONS_COLLECTION = "device_sessions"
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    Refresh tokens are random, so a plain SHA-256 is enough to keep them
+    unusable if the collection leaks; no password hashing on refresh
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def jittered_lifetime() -> timedelta:
+    """
+    Device access token lifetime, shortened by up to DEVICE_TOKEN_JITTER so
+    scanners that signed in together renew at different times
+    """
+    factor = 1 - random.uniform(0, settings.DEVICE_TOKEN_JITTER)
+    return timedelta(minutes=settings.DEVICE_ACCESS_TOKEN_MINUTES * factor)
+
+
+def _issue(session: dict, refresh_token: str) -> dict:
+    lifetime = jittered_lifetime()
+    access_token = create_access_token(
+        data={"sub": session["user_id"], "sid": str(session["_id"])},
+        expires_delta=lifetime
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": int(lifetime.total_seconds()),
+        "refresh_token": refresh_token,
+        "session_id": str(session["_id"]),
+    }
+
+
+async def open_session(db, user_id: str, device_id: str) -> dict:
+    """
+    Start (or restart) the session for a user on a device. Signing in again
+    from the same device replaces its previous refresh token.
+    """
+    now = datetime.utcnow()
+    refresh_token = secrets.token_urlsafe(32)
+    session = await db[SESSIONS_COLLECTION].find_one_and_update(
+        {"user_id": user_id, "device_id": device_id},
+        {
+            "$set": {
+                "token_hash": hash_refresh_token(refresh_token),
+                "previous_token_hash": None,
+                "superseded_token_hash": None,
+                "grace_used": False,
+                "created_at": now,
+                "last_refreshed_at": None,
+                "expires_at": now + timedelta(days=settings.DEVICE_SESSION_DAYS),
+                "revoked": False,
+            },
+            "$setOnInsert": {"_id": ObjectId()},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await invalidation_bus.publish("sessions", str(session["_id"]))
+    return _issue(session, refresh_token)
+
+
+async def rotate_session(db, refresh_token: str) -> Optional[dict]:
+    """
+    Exchange a refresh token for a new access/refresh pair in one update.
+
+    The previous token can be exchanged once more within
+    DEVICE_REFRESH_GRACE_SECONDS of the rotation, so a scanner that lost
+    the response can retry. That retry neither moves the rotation time nor
+    the previous token, so the grace cannot be stretched by refreshing
+    again. Presenting a replaced token any other way is treated as theft
+    and revokes the session.
+    """
+    now = datetime.utcnow()
+    token_hash = hash_refresh_token(refresh_token)
+    new_token = secrets.token_urlsafe(32)
+    new_hash = hash_refresh_token(new_token)
+    grace_start = now - timedelta(seconds=settings.DEVICE_REFRESH_GRACE_SECONDS)
+    live = {"revoked": False, "expires_at": {"$gt": now}}
+
+    session = await db[SESSIONS_COLLECTION].find_one_and_update(
+        {"token_hash": token_hash, **live},
+        {"$set": {
+            "token_hash": new_hash,
+            "previous_token_hash": token_hash,
+            "superseded_token_hash": None,
+            "grace_used": False,
+            "last_refreshed_at": now,
+            "expires_at": now + timedelta(days=settings.DEVICE_SESSION_DAYS),
+        }},
+        projection={"user_id": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is None:
+        # Retry with the previous token: the token issued by the rotation is
+        # replaced, and remembered so presenting it later revokes the session
+        session = await db[SESSIONS_COLLECTION].find_one_and_update(
+            {
+                "previous_token_hash": token_hash,
+                "last_refreshed_at": {"$gte": grace_start},
+                "grace_used": {"$ne": True},
+                **live,
+            },
+            [{"$set": {
+                "superseded_token_hash": "$token_hash",
+                "token_hash": new_hash,
+                "grace_used": True,
+            }}],
+            projection={"user_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    if session is not None:
+        return _issue(session, new_token)
+
+    reused = await db[SESSIONS_COLLECTION].find_one_and_update(
+        {
+            "$or": [
+                {"previous_token_hash": token_hash},
+                {"superseded_token_hash": token_hash},
+            ],
+            "revoked": False,
+        },
+        {"$set": {"revoked": True}},
+        projection={"_id": 1}
+    )
+    if reused is not None:
+        await invalidation_bus.publish("sessions", str(reused["_id"]))
+    return None
+
+
+async def revoke_session(db, session_id: str, user_id: Optional[str] = None) -> bool:
+    """
+    Revoke a session; access tokens bound to it stop working once the
+    worker-local session cache is invalidated
+    """
+    query = {"_id": ObjectId(session_id)}
+    if user_id is not None:
+        query["user_id"] = user_id
+    result = await db[SESSIONS_COLLECTION].update_one(query, {"$set": {"revoked": True}})
+    if result.matched_count:
+        await invalidation_bus.publish("sessions", session_id)
+    return bool(result.matched_count)
@@ -0,0 +1,256 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from ..core.etag import NEXT_REVISION
+
+# Bookings created before pass rules were denormalized allow a single entry
+# and carry no validity window until backfill_pass_rules() copies them over
+DEFAULT_MAX_ENTRIES = 1
+
+
+def window_error(booking: dict, now: datetime) -> Optional[str]:
+    rules = booking.get("pass_rules") or {}
+    if rules.get("validity_start") and now < rules["validity_start"]:
+        return "Pass is not valid yet"
+    if rules.get("validity_end") and now > rules["validity_end"]:
+        return "Pass has expired"
+    return None
+
+
+def window_filter(now: datetime) -> List[dict]:
+    return [
+        {"$or": [
+            {"pass_rules.validity_start": None},
+            {"pass_rules.validity_start": {"$lte": now}},
+        ]},
+        {"$or": [
+            {"pass_rules.validity_end": None},
+            {"pass_rules.validity_end": {"$gte": now}},
+        ]},
+    ]
+
+
+def admission_filter(booking_id: str, now: datetime) -> dict:
+    """
+    Matches an individual booking that can admit one more person right now
+    """
+    return {
+        "_id": ObjectId(booking_id),
+        "status": "active",
+        "is_group": False,
+        "$and": window_filter(now),
+        "$expr": {
+            "$lt": [
+                {"$ifNull": ["$entries_used", 0]},
+                {"$ifNull": ["$pass_rules.max_entries", DEFAULT_MAX_ENTRIES]},
+            ]
+        },
+    }
+
+
+async def admit_individual(db, booking_id: str, now: datetime) -> Optional[dict]:
+    """
+    Count one entry with a single conditional update. The booking flips to
+    "used" when its last entry is consumed. Returns the updated booking, or
+    None when the booking cannot admit anyone.
+    """
+    return await db["bookings"].find_one_and_update(
+        admission_filter(booking_id, now),
+        [
+            {"$set": {
+                "entries_used": {"$add": [{"$ifNull": ["$entries_used", 0]}, 1]},
+                "last_entry_at": now,
+                "revision": NEXT_REVISION,
+            }},
+            {"$set": {
+                "status": {
+                    "$cond": [
+                        {"$gte": [
+                            "$entries_used",
+                            {"$ifNull": ["$pass_rules.max_entries", DEFAULT_MAX_ENTRIES]},
+                        ]},
+                        "used",
+                        "$status",
+                    ]
+                },
+            }},
+        ],
+        projection={"group_members": 0, "qr_code": 0, "group_qr_codes": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def entries_remaining(booking: dict) -> int:
+    rules = booking.get("pass_rules") or {}
+    return rules.get("max_entries", DEFAULT_MAX_ENTRIES) - booking.get("entries_used", 0)
+
+
+NOT_ENTERED = {"$not": ["$$this.entry_status"]}
+ALL_ENTERED = {"$allElementsTrue": ["$group_members.entry_status"]}
+
+
+def group_filter(booking_id: str, now: datetime) -> dict:
+    return {
+        "_id": ObjectId(booking_id),
+        "status": "active",
+        "is_group": True,
+        "$and": window_filter(now),
+    }
+
+
+def _admitted_indexes(
+    members: List[dict],
+    count: Optional[int],
+    indexes: Optional[List[int]]
+) -> List[int]:
+    """
+    Members a successful update admitted, replayed from the pre-image
+    """
+    if indexes is not None:
+        return sorted(set(indexes))
+    waiting = [i for i, member in enumerate(members) if not member["entry_status"]]
+    return waiting if count is None else waiting[:count]
+
+
+async def admit_group(
+    db,
+    booking_id: str,
+    now: datetime,
+    count: Optional[int] = None,
+    indexes: Optional[List[int]] = None
+) -> Optional[Tuple[dict, List[int]]]:
+    """
+    Admit every waiting member (default), the first `count` waiting members,
+    or the members at `indexes`, in one conditional update. The booking
+    flips to "used" in the same update once nobody is left outside.
+    Returns the pre-image and the admitted indexes, or None when the
+    booking cannot admit that request.
+    """
+    query = group_filter(booking_id, now)
+    projection = {"group_members": 1, "pass_rules": 1, "status": 1}
+
+    if count is None and indexes is None:
+        query["group_members.entry_status"] = False
+        before = await db["bookings"].find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "group_members.$[member].entry_status": True,
+                    "status": "used",
+                    "last_entry_at": now,
+                },
+                "$inc": {"revision": 1},
+            },
+            array_filters=[{"member.entry_status": False}],
+            projection=projection,
+            return_document=ReturnDocument.BEFORE
+        )
+    else:
+        if indexes is not None:
+            # Every requested member must exist and still be outside
+            query["$expr"] = {"$and": [
+                {"$lt": [max(indexes), {"$size": "$group_members"}]},
+                {"$not": {"$anyElementTrue": [[
+                    {"$arrayElemAt": ["$group_members.entry_status", index]}
+                    for index in indexes
+                ]]}},
+            ]}
+            members = {
+                "$map": {
+                    "input": {"$range": [0, {"$size": "$group_members"}]},
+                    "as": "index",
+                    "in": {
+                        "$cond": [
+                            {"$in": ["$$index", indexes]},
+                            {"$mergeObjects": [
+                                {"$arrayElemAt": ["$group_members", "$$index"]},
+                                {"entry_status": True},
+                            ]},
+                            {"$arrayElemAt": ["$group_members", "$$index"]},
+                        ]
+                    },
+                }
+            }
+        else:
+            query["$expr"] = {"$gte": [
+                {"$size": {"$filter": {"input": "$group_members", "cond": NOT_ENTERED}}},
+                count,
+            ]}
+            # Walk the members once, admitting waiting ones until count is spent
+            members = {
+                "$let": {
+                    "vars": {
+                        "walk": {
+                            "$reduce": {
+                                "input": "$group_members",
+                                "initialValue": {"members": [], "left": count},
+                                "in": {
+                                    "$cond": [
+                                        {"$and": [{"$gt": ["$$value.left", 0]}, NOT_ENTERED]},
+                                        {
+                                            "members": {"$concatArrays": [
+                                                "$$value.members",
+                                                [{"$mergeObjects": ["$$this", {"entry_status": True}]}],
+                                            ]},
+                                            "left": {"$subtract": ["$$value.left", 1]},
+                                        },
+                                        {
+                                            "members": {"$concatArrays": ["$$value.members", ["$$this"]]},
+                                            "left": "$$value.left",
+                                        },
+                                    ]
+                                },
+                            }
+                        }
+                    },
+                    "in": "$$walk.members",
+                }
+            }
+
+        before = await db["bookings"].find_one_and_update(
+            query,
+            [
+                {"$set": {"group_members": members, "last_entry_at": now, "revision": NEXT_REVISION}},
+                {"$set": {"status": {"$cond": [ALL_ENTERED, "used", "$status"]}}},
+            ],
+            projection=projection,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    if before is None:
+        return None
+    return before, _admitted_indexes(before["group_members"], count, indexes)
+
+
+def group_rejection(
+    booking: Optional[dict],
+    now: datetime,
+    count: Optional[int] = None,
+    indexes: Optional[List[int]] = None
+) -> Tuple[int, str]:
+    """
+    Status code and reason for a group admission that did not match
+    """
+    if not booking or not booking.get("is_group"):
+        return 404, "Invalid booking"
+    if booking["status"] != "active":
+        return 400, f"Booking is {booking['status']}"
+    error = window_error(booking, now)
+    if error:
+        return 400, error
+    members = booking["group_members"]
+    if indexes is not None:
+        if any(index < 0 or index >= len(members) for index in indexes):
+            return 400, "Invalid member index"
+        entered = [index for index in indexes if members[index]["entry_status"]]
+        if len(indexes) == 1 and entered:
+            return 400, "Member has already entered"
+        if entered:
+            return 400, f"Members already entered: {entered}"
+    waiting = sum(1 for member in members if not member["entry_status"])
+    if waiting == 0:
+        return 400, "All members have already entered"
+    if count is not None and count > waiting:
+        return 400, f"Only {waiting} members have not entered yet"
+    return 409, "Booking changed during admission, please retry"
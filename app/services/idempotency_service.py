@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
+from ..core.config import get_settings
+from ..db.mongodb import MongoDB
+
+settings = get_settings()
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class IdempotencyService:
+    """
+    Replays stored responses for retried requests carrying an Idempotency-Key.
+
+    Completed responses live in the TTL-indexed idempotency_keys collection with
+    an in-process LRU in front of it. Duplicates arriving while the first request
+    is still running wait for it: on the same worker through a shared future, on
+    other workers by polling the in-progress record. The worker running a
+    request heartbeats its claim; a claim not renewed for claim_seconds
+    belonged to a worker that died, and the next retry takes it over.
+    """
+
+    def __init__(self, ttl_seconds: int, cache_size: int, wait_seconds: float, claim_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self.wait_seconds = wait_seconds
+        self.claim_seconds = claim_seconds
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def fingerprint(payload: Any) -> str:
+        encoded = json.dumps(jsonable_encoder(payload), sort_keys=True)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[tuple]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key: str, fingerprint: str, status_code: int, body: Any):
+        self._cache[key] = (
+            time.monotonic() + self.ttl_seconds, fingerprint, status_code, body
+        )
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _replay(self, idempotency_key: str, fingerprint: str, stored_fingerprint: str,
+                status_code: int, body: Any) -> JSONResponse:
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        return JSONResponse(
+            content=body,
+            status_code=status_code,
+            headers={"Idempotency-Key": idempotency_key, "Idempotent-Replayed": "true"}
+        )
+
+    def _stale(self, record: dict) -> bool:
+        claimed_at = record.get("claimed_at") or record["created_at"]
+        return claimed_at < datetime.utcnow() - timedelta(seconds=self.claim_seconds)
+
+    async def _wait_for_other_worker(self, db, key: str) -> Optional[dict]:
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            record = await db["idempotency_keys"].find_one({"_id": key})
+            if record is None or record["status"] == COMPLETED or self._stale(record):
+                return record
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still being processed"
+        )
+
+    async def _heartbeat(self, db, key: str, claim: str):
+        while True:
+            await asyncio.sleep(self.claim_seconds / 3)
+            try:
+                await db["idempotency_keys"].update_one(
+                    {"_id": key, "claim": claim, "status": IN_PROGRESS},
+                    {"$set": {"claimed_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                print(f"Idempotency claim heartbeat failed: {str(e)}")
+
+    async def _execute(
+        self,
+        db,
+        key: str,
+        claim: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Run the handler under a claim and store its response
+        """
+        heartbeat = asyncio.create_task(self._heartbeat(db, key, claim))
+        try:
+            result = await handler()
+        except BaseException:
+            await db["idempotency_keys"].delete_one(
+                {"_id": key, "claim": claim, "status": IN_PROGRESS}
+            )
+            raise
+        finally:
+            heartbeat.cancel()
+
+        status_code = getattr(result, "status_code", 200)
+        body = jsonable_encoder(result)
+        await db["idempotency_keys"].update_one(
+            {"_id": key, "claim": claim},
+            {"$set": {
+                "status": COMPLETED,
+                "status_code": status_code,
+                "response": body,
+            }}
+        )
+        self._cache_put(key, fingerprint, status_code, body)
+        return result
+
+    async def run(
+        self,
+        scope: str,
+        owner: str,
+        idempotency_key: Optional[str],
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Execute handler once per (scope, owner, idempotency_key)
+        """
+        if not idempotency_key:
+            return await handler()
+
+        key = f"{scope}:{owner}:{idempotency_key}"
+        fingerprint = self.fingerprint(payload)
+        db = MongoDB.get_db()
+
+        while True:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return self._replay(idempotency_key, fingerprint, *cached[1:])
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                await asyncio.shield(inflight)
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            claim = uuid.uuid4().hex
+            try:
+                try:
+                    now = datetime.utcnow()
+                    await db["idempotency_keys"].insert_one({
+                        "_id": key,
+                        "status": IN_PROGRESS,
+                        "fingerprint": fingerprint,
+                        "claim": claim,
+                        "created_at": now,
+                        "claimed_at": now,
+                    })
+                except DuplicateKeyError:
+                    record = await db["idempotency_keys"].find_one({"_id": key})
+                    if (record is not None and record["status"] == IN_PROGRESS and
+                            not self._stale(record)):
+                        record = await self._wait_for_other_worker(db, key)
+                    if record is None:
+                        # The other request failed and released the key
+                        continue
+                    if record["status"] == IN_PROGRESS:
+                        # The worker holding the key stopped heartbeating;
+                        # take the claim over, unless another retry did first
+                        if record["fingerprint"] != fingerprint:
+                            raise HTTPException(
+                                status_code=422,
+                                detail="Idempotency-Key was already used with a different request"
+                            )
+                        taken = await db["idempotency_keys"].update_one(
+                            {"_id": key, "status": IN_PROGRESS, "claim": record.get("claim")},
+                            {"$set": {"claim": claim, "claimed_at": datetime.utcnow()}}
+                        )
+                        if taken.modified_count == 0:
+                            continue
+                        return await self._execute(db, key, claim, fingerprint, handler)
+                    self._cache_put(
+                        key, record["fingerprint"], record["status_code"], record["response"]
+                    )
+                    continue
+
+                return await self._execute(db, key, claim, fingerprint, handler)
+            finally:
+                del self._inflight[key]
+                future.set_result(None)
+
+
+idempotency_service = IdempotencyService(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    wait_seconds=settings.IDEMPOTENCY_WAIT_SECONDS,
+    claim_seconds=settings.IDEMPOTENCY_CLAIM_SECONDS,
+)
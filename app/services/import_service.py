@@ -0,0 +1,302 @@
+import asyncio
+import csv
+import io
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from ..core.config import get_settings
+from ..core.security import get_password_hash
+from ..db.events import current_event_id
+from ..db.models.booking import BookingCreate
+from ..db.models.passes import PassCreate
+from ..db.models.user import UserCreate, UserRole
+from .booking_service import (
+    build_booking, inventory_changed, release_inventory, reserve_inventory
+)
+from .cache_service import get_cached_pass, invalidation_bus
+from .phone_lookup_service import phone_keys
+
+settings = get_settings()
+
+JOBS_COLLECTION = "import_jobs"
+MAX_REPORTED_ERRORS = 100
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# Password hashing and QR rendering run here, off the event loop
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=settings.IMPORT_WORKERS, thread_name_prefix="import"
+        )
+    return _pool
+
+
+def iter_rows(spool, data_format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yield (row number, raw row, parse error) from a CSV or NDJSON upload;
+    a line that does not parse comes with its error instead of a row
+    """
+    text = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+    if data_format == "csv":
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            # Empty CSV cells mean "not provided"
+            yield number, {key: value for key, value in row.items() if value not in ("", None)}, None
+    else:
+        for number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {str(e)}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Row is not a JSON object"
+                continue
+            yield number, row, None
+
+
+class ImportJob:
+    def __init__(self, db, job_id: ObjectId, kind: str, admin_id: str):
+        self.db = db
+        self.job_id = job_id
+        self.kind = kind
+        self.admin_id = admin_id
+
+    async def _progress(self, read: int, imported: int, errors: List[dict]):
+        update = {"$inc": {
+            "rows_read": read,
+            "rows_imported": imported,
+            "rows_failed": len(errors),
+        }}
+        if errors:
+            update["$push"] = {"errors": {"$each": errors, "$slice": MAX_REPORTED_ERRORS}}
+        await self.db[JOBS_COLLECTION].update_one({"_id": self.job_id}, update)
+
+    async def _prepare_users(self, batch: List[Tuple[int, dict]]):
+        loop = asyncio.get_running_loop()
+        valid, errors = [], []
+        for number, row in batch:
+            try:
+                user = UserCreate(**row)
+                role = UserRole(row.get("role", UserRole.USER.value))
+            except (ValidationError, ValueError) as e:
+                errors.append({"row": number, "error": str(e)})
+                continue
+            valid.append((number, user, role))
+
+        # Skip emails that already exist, or repeat within the batch, in one query
+        emails = [user.email for _, user, _ in valid]
+        existing = {
+            user["email"] for user in await self.db["users"].find(
+                {"email": {"$in": emails}}, {"email": 1}
+            ).to_list(None)
+        }
+        unique = []
+        for number, user, role in valid:
+            if user.email in existing:
+                errors.append({"row": number, "error": "Email already registered"})
+                continue
+            existing.add(user.email)
+            unique.append((number, user, role))
+
+        hashes = await asyncio.gather(*[
+            loop.run_in_executor(get_pool(), get_password_hash, user.password)
+            for _, user, _ in unique
+        ])
+        documents = []
+        for (number, user, role), password_hash in zip(unique, hashes):
+            user_dict = user.dict()
+            user_dict.pop("password")
+            user_dict["_id"] = ObjectId()
+            user_dict["password_hash"] = password_hash
+            user_dict["role"] = role.value
+            user_dict["created_at"] = datetime.utcnow()
+            user_dict.update(phone_keys(user_dict["phone"]))
+            documents.append((number, user_dict))
+        return documents, errors
+
+    async def _prepare_passes(self, batch: List[Tuple[int, dict]]):
+        documents, errors = [], []
+        for number, row in batch:
+            row.setdefault("created_by", self.admin_id)
+            try:
+                pass_ = PassCreate(**row)
+            except ValidationError as e:
+                errors.append({"row": number, "error": str(e)})
+                continue
+            pass_dict = pass_.dict()
+            pass_dict["_id"] = ObjectId()
+            pass_dict["is_active"] = True
+            pass_dict["created_at"] = datetime.now()
+            pass_dict["revision"] = 1
+            pass_dict["event_id"] = pass_dict["event_id"] or current_event_id()
+            documents.append((number, pass_dict))
+        return documents, errors
+
+    async def _prepare_bookings(self, batch: List[Tuple[int, dict]]):
+        loop = asyncio.get_running_loop()
+        pending, errors = [], []
+        for number, row in batch:
+            row.setdefault("sold_by", "import")
+            try:
+                if isinstance(row.get("group_members"), str):
+                    row["group_members"] = json.loads(row["group_members"])
+                booking = BookingCreate(**row)
+            except (ValidationError, ValueError) as e:
+                errors.append({"row": number, "error": str(e)})
+                continue
+            pass_ = await get_cached_pass(self.db, booking.pass_id)
+            if not pass_ or not pass_["is_active"]:
+                errors.append({"row": number, "error": "Pass not found or inactive"})
+                continue
+            amount = pass_["price"]
+            if booking.discount_applied:
+                amount = amount * (1 - booking.discount_applied/100)
+            pending.append((number, booking, pass_, amount))
+
+        # QR rendering is the expensive part of a booking
+        built = await asyncio.gather(*[
+            loop.run_in_executor(get_pool(), build_booking, booking, pass_, amount)
+            for _, booking, pass_, amount in pending
+        ])
+        # Pre-sold bookings take their unit like any other sale, once the
+        # booking is rendered so a failed render cannot leak one
+        reserved = await asyncio.gather(*[
+            reserve_inventory(self.db, pass_, publish=False) for _, _, pass_, _ in pending
+        ])
+        await inventory_changed(
+            str(pass_["_id"]) for (_, _, pass_, _), ok in zip(pending, reserved)
+            if ok and pass_.get("available_quantity") is not None
+        )
+        documents = []
+        for (number, *_), booking_dict, ok in zip(pending, built, reserved):
+            if ok:
+                documents.append((number, booking_dict))
+            else:
+                errors.append({"row": number, "error": "Pass sold out"})
+        return documents, errors
+
+    async def _write(self, collection: str, documents: List[Tuple[int, dict]]):
+        """
+        Unordered insert_many; rows rejected by the server are reported
+        """
+        if not documents:
+            return 0, []
+        try:
+            result = await self.db[collection].insert_many(
+                [document for _, document in documents], ordered=False
+            )
+            return len(result.inserted_ids), []
+        except BulkWriteError as e:
+            errors = [
+                {"row": documents[error["index"]][0], "error": error["errmsg"]}
+                for error in e.details["writeErrors"]
+            ]
+            return e.details["nInserted"], errors
+
+    async def _release_failed(self, documents: List[Tuple[int, dict]], write_errors: List[dict]):
+        """
+        Give back the units of bookings the server rejected
+        """
+        failed = {error["row"] for error in write_errors}
+        released: Dict[str, int] = {}
+        for number, document in documents:
+            if number in failed:
+                released[document["pass_id"]] = released.get(document["pass_id"], 0) + 1
+        await release_inventory(self.db, released)
+
+    async def run(self, spool, data_format: str):
+        prepare: Dict[str, Callable] = {
+            "users": self._prepare_users,
+            "passes": self._prepare_passes,
+            "bookings": self._prepare_bookings,
+        }[self.kind]
+
+        await self.db[JOBS_COLLECTION].update_one(
+            {"_id": self.job_id},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+        )
+        try:
+            rows = iter_rows(spool, data_format)
+            while True:
+                batch, parse_errors = [], []
+                for number, row, error in rows:
+                    if error is not None:
+                        parse_errors.append({"row": number, "error": error})
+                    else:
+                        batch.append((number, row))
+                    if len(batch) + len(parse_errors) == settings.IMPORT_BATCH_SIZE:
+                        break
+                if not batch and not parse_errors:
+                    break
+
+                documents, errors = await prepare(batch)
+                imported, write_errors = await self._write(self.kind, documents)
+                if self.kind == "bookings" and write_errors:
+                    await self._release_failed(documents, write_errors)
+                await self._progress(
+                    len(batch) + len(parse_errors), imported, parse_errors + errors + write_errors
+                )
+                if self.kind == "passes" and imported:
+                    await invalidation_bus.publish("catalog")
+
+            await self.db[JOBS_COLLECTION].update_one(
+                {"_id": self.job_id},
+                {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            await self.db[JOBS_COLLECTION].update_one(
+                {"_id": self.job_id},
+                {"$set": {
+                    "status": "failed",
+                    "failure": str(e),
+                    "finished_at": datetime.utcnow(),
+                }}
+            )
+        finally:
+            spool.close()
+
+
+# Running jobs, held so the tasks are not garbage collected mid-import
+_running: set = set()
+
+
+async def start_import(db, kind: str, data_format: str, body, admin_id: str) -> ObjectId:
+    """
+    Spool the streamed upload to disk, record the job and process it in the
+    background. Returns the job id to poll.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in body:
+        spool.write(chunk)
+    spool.seek(0)
+
+    job_id = ObjectId()
+    await db[JOBS_COLLECTION].insert_one({
+        "_id": job_id,
+        "kind": kind,
+        "format": data_format,
+        "status": "pending",
+        "created_by": admin_id,
+        "created_at": datetime.utcnow(),
+        "rows_read": 0,
+        "rows_imported": 0,
+        "rows_failed": 0,
+        "errors": [],
+    })
+
+    task = asyncio.create_task(ImportJob(db, job_id, kind, admin_id).run(spool, data_format))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return job_id
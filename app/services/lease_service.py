@@ -0,0 +1,44 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+LEASES_COLLECTION = "scheduler_leases"
+
+
+class MongoLease:
+    """
+    Named lease in Mongo so that one worker across all processes and hosts
+    runs a scheduled job. The holder renews it while working; if it dies the
+    lease lapses after ttl_seconds and another worker takes over.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self, db) -> bool:
+        """
+        Take or renew the lease; False when another worker holds it
+        """
+        now = datetime.utcnow()
+        try:
+            await db[LEASES_COLLECTION].find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}],
+                },
+                {"$set": {
+                    "holder": self.holder,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by someone else
+            return False
+        return True
+
+    async def release(self, db):
+        await db[LEASES_COLLECTION].delete_one({"_id": self.name, "holder": self.holder})
@@ -0,0 +1,192 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo.errors import BulkWriteError
+from ..core.config import get_settings
+from .booking_service import release_inventory
+from .lease_service import MongoLease
+from .sales_summary_service import reconcile as reconcile_sales_summary
+
+settings = get_settings()
+
+BOOKINGS_ARCHIVE = "bookings_archive"
+STAFF_SALES_ARCHIVE = "staff_sales_archive"
+BOOKING_STATUSES = ["active", "used", "cancelled"]
+
+
+async def expire_pending_bookings(db, batch_size: int) -> int:
+    """
+    Cancel online bookings still unpaid after PENDING_BOOKING_TTL_MINUTES and
+    put their passes back on sale. A sweeper rather than a TTL index, since
+    expiry has to release inventory instead of deleting the booking.
+    """
+    cutoff = datetime.now() - timedelta(minutes=settings.PENDING_BOOKING_TTL_MINUTES)
+    expired = 0
+    while True:
+        candidates = await db["bookings"].find(
+            {
+                "payment_status": "pending",
+                "created_at": {"$lt": cutoff},
+                "status": "active",
+                "sold_by": {"$in": [None, "online"]},
+            },
+            {"_id": 1}
+        ).limit(batch_size).to_list(None)
+        if not candidates:
+            return expired
+
+        # Tag the bookings this run actually expired; one paid in the
+        # meantime no longer matches and keeps its inventory
+        run_id = uuid.uuid4().hex
+        await db["bookings"].update_many(
+            {
+                "_id": {"$in": [booking["_id"] for booking in candidates]},
+                "payment_status": "pending",
+                "status": "active",
+            },
+            {
+                "$set": {
+                    "status": "cancelled",
+                    "payment_status": "failed",
+                    "cancel_reason": "payment_timeout",
+                    "expired_at": datetime.now(),
+                    "lifecycle_run": run_id,
+                },
+                "$inc": {"revision": 1},
+            }
+        )
+        released = await db["bookings"].aggregate([
+            {"$match": {
+                "_id": {"$in": [booking["_id"] for booking in candidates]},
+                "lifecycle_run": run_id,
+            }},
+            {"$group": {"_id": "$pass_id", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        await release_inventory(db, {row["_id"]: row["count"] for row in released})
+        expired += sum(row["count"] for row in released)
+        if len(candidates) < batch_size:
+            return expired
+
+
+async def _copy(db, collection: str, documents: List[dict]):
+    """
+    Insert into an archive collection, skipping documents a previous,
+    interrupted run already copied
+    """
+    if not documents:
+        return
+    try:
+        await db[collection].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+async def archive_completed_season(db, batch_size: int) -> int:
+    """
+    Move bookings whose pass expired more than ARCHIVE_AFTER_DAYS ago, and
+    their staff sales, into archive collections. Each batch is copied before
+    it is deleted, so an interrupted run is simply resumed by the next one.
+    Daily sales summaries are aggregates and stay where they are.
+    """
+    cutoff = datetime.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    archived = 0
+    while True:
+        bookings = await db["bookings"].find({
+            "$or": [
+                {"status": {"$in": BOOKING_STATUSES}, "pass_rules.validity_end": {"$lt": cutoff}},
+                # Bookings from before pass rules were denormalized carry no
+                # validity window; only finished ones can go by age, an
+                # unused season pass must stay where the gate reads it
+                {
+                    "pass_rules": None,
+                    "status": {"$in": ["used", "cancelled"]},
+                    "created_at": {"$lt": cutoff},
+                },
+            ]
+        }).limit(batch_size).to_list(None)
+        if not bookings:
+            return archived
+
+        booking_ids = [booking["_id"] for booking in bookings]
+        sales = await db["staff_sales"].find(
+            {"booking_id": {"$in": [str(_id) for _id in booking_ids]}}
+        ).to_list(None)
+
+        now = datetime.now()
+        for document in bookings + sales:
+            document["archived_at"] = now
+        await _copy(db, BOOKINGS_ARCHIVE, bookings)
+        await _copy(db, STAFF_SALES_ARCHIVE, sales)
+
+        await db["staff_sales"].delete_many({"_id": {"$in": [sale["_id"] for sale in sales]}})
+        await db["bookings"].delete_many({"_id": {"$in": booking_ids}})
+        archived += len(bookings)
+        if len(bookings) < batch_size:
+            return archived
+
+
+class LifecycleScheduler:
+    """
+    Runs pending-booking expiry, the staff sales summary reconcile and
+    season archival on the worker holding the "booking_lifecycle" lease
+    """
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lease = MongoLease("booking_lifecycle", ttl_seconds=interval * 2)
+        self.db = None
+        self.last_run: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.db is not None:
+            await self.lease.release(self.db)
+        self.db = None
+
+    async def run_once(self, db=None) -> Dict:
+        db = db or self.db
+        stats = {"started_at": datetime.now()}
+        stats["expired"] = await expire_pending_bookings(db, self.batch_size)
+        # Ahead of archival, so no sale leaves uncounted
+        stats["summarized"] = await reconcile_sales_summary(db, self.batch_size)
+        stats["archived"] = await archive_completed_season(db, self.batch_size)
+        stats["finished_at"] = datetime.now()
+        self.last_run = stats
+        return stats
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self.lease.acquire(self.db):
+                    stats = await self.run_once()
+                    if stats["expired"] or stats["archived"] or stats["summarized"]:
+                        print(
+                            f"Booking lifecycle: expired {stats['expired']}, "
+                            f"archived {stats['archived']}, "
+                            f"summarized {stats['summarized']} missed sales"
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Booking lifecycle run failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+lifecycle_scheduler = LifecycleScheduler(
+    interval=settings.LIFECYCLE_INTERVAL_SECONDS,
+    batch_size=settings.LIFECYCLE_BATCH_SIZE,
+)
@@ -0,0 +1,442 @@
+import asyncio
+import os
+import time as clock
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from ..core.config import get_settings
+from .booking_service import release_inventory
+from .notification_service import NotificationService
+from .payment_service import payment_service
+from .timeseries_service import timeseries_service
+
+settings = get_settings()
+
+JOBS_COLLECTION = "cancellation_jobs"
+RESUME_INTERVAL_SECONDS = 30
+REFUND_BACKOFF_SECONDS = 0.5
+NOTIFY_CONCURRENCY = 16
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def night_window(night: date) -> Tuple[datetime, datetime]:
+    """
+    An event night runs from midnight until the rollover hour next morning
+    """
+    start = datetime.combine(night, time())
+    return start, start + timedelta(days=1, hours=settings.OCCUPANCY_NIGHT_ROLLOVER_HOUR)
+
+
+def selector_query(selector: dict, cutoff: datetime) -> dict:
+    """
+    Bookings a job applies to. Bookings made after the job started are left
+    alone, so a resumed job cancels the same set.
+    """
+    query = {"status": {"$in": selector["statuses"]}, "created_at": {"$lte": cutoff}}
+    if selector.get("pass_id"):
+        query["pass_id"] = selector["pass_id"]
+    if selector.get("night"):
+        start, end = night_window(date.fromisoformat(selector["night"]))
+        query["pass_rules.validity_start"] = {"$gte": start}
+        query["pass_rules.validity_end"] = {"$lte": end}
+    return query
+
+
+def refund_label(booking: dict) -> str:
+    if booking.get("refund_status") == "processed":
+        return f"₹{booking.get('amount_paid')} refunded"
+    if booking.get("refund_status") == "pending":
+        return "payment received late, refund on its way"
+    if booking.get("refund_status") == "failed":
+        return "refund delayed, our team will contact you"
+    if booking.get("payment_status") == "cash":
+        return "cash refund at the sales counter"
+    return "no payment was taken"
+
+
+class MassCancellation:
+    """
+    Admin job that calls off every booking matching a selector.
+
+    A job runs in phases whose progress lives on the bookings themselves, so
+    a job interrupted by a crash or redeploy is resumed from where it
+    stopped by whichever worker next claims it:
+
+    - cancel: chunked update_many tagging bookings with the job id, then
+      one release of their inventory per pass
+    - refund: paid bookings are refunded with bounded concurrency and
+      retries; refunds are recorded by idempotency key, so a repeated
+      refund returns the recorded one
+    - notify: one email per customer (bookings are read in user order)
+      through a dedicated SMTP pool
+
+    The worker running a job heartbeats on the job document, per chunk and
+    from inside long chunks before each refund attempt and email; a job
+    whose heartbeat is older than MASS_CANCEL_LEASE_SECONDS is up for grabs.
+    """
+
+    def __init__(self, chunk_size: int, refund_concurrency: int, max_attempts: int, lease_seconds: float):
+        self.chunk_size = chunk_size
+        self.refund_concurrency = refund_concurrency
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.db = None
+        self._notifier: Optional[NotificationService] = None
+        self._running: Dict[ObjectId, asyncio.Task] = {}
+        # Lease renewals from inside a chunk, and jobs whose lease was lost
+        self._renewed_at: Dict[ObjectId, float] = {}
+        self._lost: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        self._task = asyncio.create_task(self._resume_loop())
+
+    async def stop(self):
+        tasks = [task for task in [self._task, *self._running.values()] if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self.db is not None:
+            # Hand unfinished jobs over without waiting for the lease to run out
+            await self.db[JOBS_COLLECTION].update_many(
+                {"owner": self.worker_id, "status": "running"},
+                {"$set": {"heartbeat_at": None}}
+            )
+        self.db = None
+
+    def _get_notifier(self) -> NotificationService:
+        if self._notifier is None:
+            executor = ThreadPoolExecutor(
+                max_workers=NOTIFY_CONCURRENCY, thread_name_prefix="cancellations"
+            )
+            self._notifier = NotificationService(executor=executor, keep_alive=True)
+        return self._notifier
+
+    async def create(self, selector: dict, admin_id: str) -> ObjectId:
+        """
+        Record a job and start it on this worker; returns the id to poll
+        """
+        job_id = ObjectId()
+        now = datetime.now()
+        matched = await self.db["bookings"].count_documents(selector_query(selector, now))
+        await self.db[JOBS_COLLECTION].insert_one({
+            "_id": job_id,
+            "selector": selector,
+            "status": "pending",
+            "created_by": admin_id,
+            "created_at": now,
+            "cutoff": now,
+            "matched": matched,
+            "cancelled": 0,
+            "refunded": 0,
+            "refunds_failed": 0,
+            "notified": 0,
+            "phase": None,
+            "heartbeat_at": None,
+        })
+        self._launch(job_id)
+        return job_id
+
+    async def retry_refunds(self, job_id: ObjectId) -> int:
+        """
+        Queue a finished job's failed refunds for another round
+        """
+        result = await self.db["bookings"].update_many(
+            {"cancel_job": job_id, "refund_status": "failed"},
+            {"$set": {"refund_status": None, "cancellation_notice": None}}
+        )
+        await self.db[JOBS_COLLECTION].update_one(
+            {"_id": job_id, "status": {"$in": ["completed", "completed_with_errors"]}},
+            {
+                "$set": {"status": "pending", "heartbeat_at": None, "finished_at": None},
+                "$inc": {"refunds_failed": -result.modified_count},
+            }
+        )
+        self._launch(job_id)
+        return result.modified_count
+
+    def _launch(self, job_id: ObjectId):
+        if job_id in self._running:
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._running[job_id] = task
+        task.add_done_callback(lambda _: self._running.pop(job_id, None))
+
+    async def _claim(self, job_id: Optional[ObjectId] = None) -> Optional[dict]:
+        now = datetime.now()
+        query = {
+            "status": {"$in": ["pending", "running"]},
+            "$or": [
+                {"heartbeat_at": None},
+                {"heartbeat_at": {"$lt": now - timedelta(seconds=self.lease_seconds)}},
+            ],
+        }
+        if job_id is not None:
+            query["_id"] = job_id
+        return await self.db[JOBS_COLLECTION].find_one_and_update(
+            query,
+            {"$set": {"status": "running", "owner": self.worker_id, "heartbeat_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _heartbeat(self, job_id: ObjectId, phase: str, **progress: int):
+        result = await self.db[JOBS_COLLECTION].update_one(
+            {"_id": job_id, "owner": self.worker_id, "status": "running"},
+            {
+                "$set": {"heartbeat_at": datetime.now(), "phase": phase},
+                "$inc": progress,
+            }
+        )
+        if result.matched_count == 0:
+            self._lost.add(job_id)
+            raise LeaseLost()
+        self._renewed_at[job_id] = clock.monotonic()
+
+    async def _keepalive(self, job_id: ObjectId, phase: str):
+        """
+        Renew the lease from inside a chunk, whose refund retries or emails
+        can outlast it; raises LeaseLost once another worker owns the job,
+        before any more refunds or emails go out
+        """
+        if job_id in self._lost:
+            raise LeaseLost()
+        if clock.monotonic() - self._renewed_at.get(job_id, 0) < self.lease_seconds / 3:
+            return
+        # Claimed before awaiting, so concurrent tasks renew once
+        self._renewed_at[job_id] = clock.monotonic()
+        await self._heartbeat(job_id, phase)
+
+    async def _run(self, job_id: ObjectId):
+        job = await self._claim(job_id)
+        if job is None:
+            return
+        self._lost.discard(job_id)
+        self._renewed_at[job_id] = clock.monotonic()
+        try:
+            await self._cancel_phase(job)
+            await self._refund_phase(job)
+            await self._notify_phase(job)
+            failed = await self.db["bookings"].count_documents(
+                {"cancel_job": job_id, "refund_status": "failed"}
+            )
+            await self.db[JOBS_COLLECTION].update_one(
+                {"_id": job_id, "owner": self.worker_id},
+                {"$set": {
+                    "status": "completed_with_errors" if failed else "completed",
+                    "phase": None,
+                    "failure": None,
+                    "finished_at": datetime.now(),
+                }}
+            )
+            # Sales charts cache settled buckets that now hold cancelled bookings
+            await timeseries_service.invalidate()
+        except LeaseLost:
+            print(f"Mass cancellation {job_id}: taken over by another worker")
+        except Exception as e:
+            print(f"Mass cancellation {job_id} failed, will resume: {str(e)}")
+            await self.db[JOBS_COLLECTION].update_one(
+                {"_id": job_id, "owner": self.worker_id},
+                {"$set": {"heartbeat_at": None, "failure": str(e)}}
+            )
+        finally:
+            self._renewed_at.pop(job_id, None)
+
+    async def _release_inventory(self, job_id: ObjectId):
+        """
+        Give back the units of every cancelled booking not released yet.
+        Bookings are marked before the passes are incremented, so a crash in
+        between under-restocks rather than overselling.
+        """
+        released = await self.db["bookings"].aggregate([
+            {"$match": {"cancel_job": job_id, "inventory_released": False}},
+            {"$group": {"_id": "$pass_id", "count": {"$sum": 1}, "ids": {"$push": "$_id"}}},
+        ]).to_list(None)
+        if not released:
+            return
+        await self.db["bookings"].update_many(
+            {"_id": {"$in": [_id for row in released for _id in row["ids"]]}},
+            {"$set": {"inventory_released": True}}
+        )
+        await release_inventory(self.db, {row["_id"]: row["count"] for row in released})
+
+    async def _cancel_phase(self, job: dict):
+        query = selector_query(job["selector"], job["cutoff"])
+        await self._release_inventory(job["_id"])
+        while True:
+            ids = [
+                booking["_id"] for booking in
+                await self.db["bookings"].find(query, {"_id": 1}).limit(self.chunk_size).to_list(None)
+            ]
+            if not ids:
+                return
+            # The selector's status condition keeps a booking cancelled
+            # elsewhere in the meantime from being counted twice
+            result = await self.db["bookings"].update_many(
+                {"_id": {"$in": ids}, "status": query["status"]},
+                {
+                    "$set": {
+                        "status": "cancelled",
+                        "cancel_reason": job["selector"]["reason"],
+                        "cancel_job": job["_id"],
+                        "cancelled_at": datetime.now(),
+                        "inventory_released": False,
+                        "refund_status": None,
+                        "cancellation_notice": None,
+                    },
+                    "$inc": {"revision": 1},
+                }
+            )
+            await self._release_inventory(job["_id"])
+            await self._heartbeat(job["_id"], "cancel", cancelled=result.modified_count)
+            if len(ids) < self.chunk_size:
+                return
+
+    async def _refund(self, job_id: ObjectId, booking: dict, semaphore: asyncio.Semaphore) -> Optional[dict]:
+        """
+        Refund one booking, retrying with backoff; None once attempts run out
+        """
+        async with semaphore:
+            for attempt in range(self.max_attempts):
+                await self._keepalive(job_id, "refund")
+                refund = await payment_service.refund_payment(
+                    booking["payment_id"],
+                    booking.get("amount_paid"),
+                    idempotency_key=f"{job_id}:{booking['_id']}"
+                )
+                if refund and refund.get("status") == "processed":
+                    return refund
+                if attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(REFUND_BACKOFF_SECONDS * 2 ** attempt)
+        return None
+
+    async def _refund_phase(self, job: dict):
+        semaphore = asyncio.Semaphore(self.refund_concurrency)
+        while True:
+            bookings = await self.db["bookings"].find(
+                {
+                    "cancel_job": job["_id"],
+                    "payment_status": "paid",
+                    "payment_id": {"$ne": None},
+                    "refund_status": None,
+                },
+                {"payment_id": 1, "amount_paid": 1}
+            ).limit(self.chunk_size).to_list(None)
+            if not bookings:
+                return
+            refunds = await asyncio.gather(*[
+                self._refund(job["_id"], booking, semaphore) for booking in bookings
+            ])
+            now = datetime.now()
+            await self.db["bookings"].bulk_write([
+                UpdateOne(
+                    {"_id": booking["_id"]},
+                    {"$set": {
+                        "refund_status": "processed",
+                        "refund_id": refund["refund_id"],
+                        "refunded_at": now,
+                    }}
+                ) if refund else UpdateOne(
+                    {"_id": booking["_id"]},
+                    {"$set": {"refund_status": "failed"}, "$inc": {"refund_attempts": self.max_attempts}}
+                )
+                for booking, refund in zip(bookings, refunds)
+            ], ordered=False)
+            refunded = sum(1 for refund in refunds if refund)
+            await self._heartbeat(
+                job["_id"], "refund",
+                refunded=refunded, refunds_failed=len(refunds) - refunded
+            )
+
+    async def _notify_phase(self, job: dict):
+        notifier = self._get_notifier()
+        while True:
+            bookings = await self.db["bookings"].find(
+                {"cancel_job": job["_id"], "cancellation_notice": None},
+                {"user_id": 1, "payment_status": 1, "refund_status": 1, "amount_paid": 1}
+            ).sort("user_id", 1).limit(self.chunk_size).to_list(None)
+            if not bookings:
+                return
+
+            users = await self.db["users"].find(
+                {"_id": {"$in": list({
+                    ObjectId(booking["user_id"]) for booking in bookings
+                    if ObjectId.is_valid(booking["user_id"])
+                })}},
+                {"email": 1}
+            ).to_list(None)
+            emails = {str(user["_id"]): user["email"] for user in users}
+            by_user: Dict[str, List[dict]] = {}
+            for booking in bookings:
+                by_user.setdefault(booking["user_id"], []).append(booking)
+
+            async def send(user_id: str, user_bookings: List[dict]) -> Tuple[List[ObjectId], str]:
+                ids = [booking["_id"] for booking in user_bookings]
+                if user_id not in emails:
+                    return ids, "no_email"
+                await self._keepalive(job["_id"], "notify")
+                sent = await notifier.send_cancellation_notice(emails[user_id], {
+                    "reason": job["selector"]["reason"].replace("_", " "),
+                    "bookings": [
+                        {"id": str(booking["_id"]), "refund": refund_label(booking)}
+                        for booking in user_bookings
+                    ],
+                })
+                return ids, "sent" if sent else "failed"
+
+            results = await asyncio.gather(*[
+                send(user_id, user_bookings) for user_id, user_bookings in by_user.items()
+            ])
+            # One update per outcome rather than per customer
+            outcomes: Dict[str, List[ObjectId]] = {}
+            for ids, outcome in results:
+                outcomes.setdefault(outcome, []).extend(ids)
+            await self.db["bookings"].bulk_write([
+                UpdateMany({"_id": {"$in": ids}}, {"$set": {"cancellation_notice": outcome}})
+                for outcome, ids in outcomes.items()
+            ], ordered=False)
+            await self._heartbeat(
+                job["_id"], "notify",
+                notified=len(outcomes.get("sent", []))
+            )
+
+    async def _resume_loop(self):
+        while True:
+            await asyncio.sleep(RESUME_INTERVAL_SECONDS)
+            try:
+                abandoned = await self.db[JOBS_COLLECTION].find(
+                    {
+                        "status": {"$in": ["pending", "running"]},
+                        "$or": [
+                            {"heartbeat_at": None},
+                            {"heartbeat_at": {"$lt": datetime.now() - timedelta(seconds=self.lease_seconds)}},
+                        ],
+                    },
+                    {"_id": 1}
+                ).to_list(None)
+                for job in abandoned:
+                    self._launch(job["_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Mass cancellation resume check failed: {str(e)}")
+
+
+mass_cancellation = MassCancellation(
+    chunk_size=settings.MASS_CANCEL_CHUNK_SIZE,
+    refund_concurrency=settings.REFUND_CONCURRENCY,
+    max_attempts=settings.REFUND_MAX_ATTEMPTS,
+    lease_seconds=settings.MASS_CANCEL_LEASE_SECONDS,
+)
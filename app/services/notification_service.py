@@ -1,20 +1,24 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from concurrent.futures import Executor
 from typing import List, Optional
 from ..core.config import get_settings
 import asyncio
+import threading
 from datetime import datetime
 
 settings = get_settings()
 
 class NotificationService:
-    def __init__(self):
+    def __init__(self, executor: Optional[Executor] = None, keep_alive: bool = False):
         self.smtp_server = settings.SMTP_SERVER
         self.smtp_port = settings.SMTP_PORT
         self.smtp_username = settings.SMTP_USERNAME
         self.smtp_password = settings.SMTP_PASSWORD
         self.from_email = settings.FROM_EMAIL
+        # Bulk senders pass their own pool so SMTP waits never occupy the
+        # default executor, and keep one logged-in connection per thread
+        self.executor = executor
+        self.keep_alive = keep_alive
+        self._local = threading.local()
 
     async def send_email(
         self,
@@ -26,6 +30,9 @@ class NotificationService:
         """
         Send email using SMTP
         """
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
         try:
             message = MIMEMultipart('alternative')
             message['Subject'] = subject
@@ -41,16 +48,20 @@ class NotificationService:
 
             # Use asyncio to run SMTP operations in a thread pool
             return await asyncio.get_event_loop().run_in_executor(
-                None, self._send_smtp_email, message
+                self.executor, self._send_smtp_email, message
             )
         except Exception as e:
             print(f"Error sending email: {str(e)}")
             return False
 
-    def _send_smtp_email(self, message: MIMEMultipart) -> bool:
+    def _send_smtp_email(self, message: "MIMEMultipart") -> bool:
         """
         Helper method to send email via SMTP
         """
+        import smtplib
+
+        if self.keep_alive:
+            return self._send_kept_alive(message)
         try:
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls()
@@ -61,6 +72,40 @@ class NotificationService:
             print(f"SMTP Error: {str(e)}")
             return False
 
+    def _send_kept_alive(self, message: "MIMEMultipart") -> bool:
+        """
+        Send over this thread's open connection, reconnecting once if the
+        server dropped it
+        """
+        import smtplib
+
+        for attempt in range(2):
+            try:
+                server = getattr(self._local, "server", None)
+                if server is None:
+                    server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+                    server.starttls()
+                    server.login(self.smtp_username, self.smtp_password)
+                    self._local.server = server
+                server.send_message(message)
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._local.server = None
+            except Exception as e:
+                print(f"SMTP Error: {str(e)}")
+                self._close_connection()
+                return False
+        return False
+
+    def _close_connection(self):
+        server = getattr(self._local, "server", None)
+        self._local.server = None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
     async def send_booking_confirmation(
         self,
         email: str,
@@ -112,6 +157,34 @@ class NotificationService:
         """
         return await self.send_email(email, subject, html_content)
 
+    async def send_cancellation_notice(
+        self,
+        email: str,
+        cancellation_details: dict
+    ) -> bool:
+        """
+        Tell a customer their bookings were cancelled and how they are refunded
+        """
+        subject = "Navratri Pass - Booking Cancelled"
+        items = "".join(
+            f"<li>Booking ID: {booking.get('id')} - {booking.get('refund')}</li>"
+            for booking in cancellation_details.get("bookings", [])
+        )
+        html_content = f"""
+        <html>
+            <body>
+                <h2>Booking Cancelled</h2>
+                <p>We are sorry, the event you booked for has been called off
+                ({cancellation_details.get('reason')}). Your bookings were cancelled:</p>
+                <ul>
+                    {items}
+                </ul>
+                <p>Online payments are refunded to the original payment method.</p>
+            </body>
+        </html>
+        """
+        return await self.send_email(email, subject, html_content)
+
     async def send_bulk_notification(
         self,
         emails: List[str],
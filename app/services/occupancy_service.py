@@ -0,0 +1,203 @@
+import asyncio
+import json
+import random
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional, Tuple
+from pymongo import UpdateOne
+from ..core.config import get_settings
+
+settings = get_settings()
+
+COUNTERS_COLLECTION = "occupancy_counters"
+HEARTBEAT_SECONDS = 15
+
+
+def current_night(now: Optional[datetime] = None) -> str:
+    """
+    Event nights run past midnight; scans before the rollover hour belong to
+    the previous night
+    """
+    now = now or datetime.now()
+    return (now - timedelta(hours=settings.OCCUPANCY_NIGHT_ROLLOVER_HOUR)).date().isoformat()
+
+
+def bucket_start(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now()
+    minute = now.minute - now.minute % settings.OCCUPANCY_BUCKET_MINUTES
+    return now.replace(minute=minute, second=0, microsecond=0)
+
+
+def current_bucket(now: Optional[datetime] = None) -> str:
+    return bucket_start(now).strftime("%H:%M")
+
+
+class OccupancyService:
+    """
+    Sharded per-gate, per-time-bucket entry counters.
+
+    Admissions are upserted $incs on one of OCCUPANCY_SHARDS documents per
+    gate and pass type, so concurrent gates do not contend on one hot
+    counter; the scan event log batches them per flush. A
+    background refresher folds the shards into a per-night snapshot that
+    feeds the SSE stream and the capacity check; the check itself reads only
+    the in-memory estimate and never adds a round trip to a scan.
+    """
+
+    def __init__(self, capacity: int, shards: int, refresh_seconds: float):
+        self.capacity = capacity
+        self.shards = shards
+        self.refresh_seconds = refresh_seconds
+        self.db = None
+        self.snapshot: Dict = {"night": current_night(), "total": 0, "gates": {}, "buckets": {}}
+        self.version = 0
+        self._since_refresh = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.db = None
+
+    def estimated_total(self) -> int:
+        return self.snapshot["total"] + self._since_refresh
+
+    def at_capacity(self, entries: int = 1) -> bool:
+        if not self.capacity:
+            return False
+        return self.estimated_total() + entries > self.capacity
+
+    def counter_update(
+        self,
+        gate: str,
+        entries: int,
+        pass_type: Optional[str] = None,
+        now: Optional[datetime] = None
+    ) -> UpdateOne:
+        """
+        Upserted $inc adding entries (negative for exits) to a random shard.
+        Gross entries and exits are kept next to the net count for the
+        attendance time series.
+        """
+        now = now or datetime.now()
+        night, bucket = current_night(now), current_bucket(now)
+        pass_type = pass_type or "unknown"
+        shard = random.randrange(self.shards)
+        return UpdateOne(
+            {"_id": f"{night}|{gate}|{bucket}|{pass_type}|{shard}"},
+            {
+                "$inc": {
+                    "count": entries,
+                    "entered" if entries > 0 else "exited": abs(entries),
+                },
+                "$set": {"updated_at": now},
+                "$setOnInsert": {
+                    "night": night,
+                    "gate": gate,
+                    "bucket": bucket,
+                    "at": bucket_start(now),
+                    "pass_type": pass_type,
+                    "shard": shard,
+                },
+            },
+            upsert=True
+        )
+
+    async def record(self, db, gate: str, entries: int = 1, pass_type: Optional[str] = None):
+        await self.record_many(db, {(gate, pass_type): entries})
+
+    async def record_many(self, db, totals: Dict[Tuple[str, Optional[str]], int]):
+        """
+        Apply entry totals keyed by (gate, pass_type) in one bulk write
+        """
+        operations = [
+            self.counter_update(gate, entries, pass_type)
+            for (gate, pass_type), entries in totals.items()
+            if entries
+        ]
+        if not operations:
+            return
+        self._since_refresh += sum(totals.values())
+        await db[COUNTERS_COLLECTION].bulk_write(operations, ordered=False)
+
+    async def refresh(self):
+        night = current_night()
+        pending = self._since_refresh
+        pipeline = [
+            {"$match": {"night": night}},
+            {"$group": {"_id": {"gate": "$gate", "bucket": "$bucket"}, "count": {"$sum": "$count"}}},
+        ]
+        rows = await self.db[COUNTERS_COLLECTION].aggregate(pipeline).to_list(None)
+        self._since_refresh -= pending
+
+        gates: Dict[str, int] = {}
+        buckets: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            gate, bucket = row["_id"]["gate"], row["_id"]["bucket"]
+            gates[gate] = gates.get(gate, 0) + row["count"]
+            buckets.setdefault(gate, {})[bucket] = row["count"]
+
+        snapshot = {
+            "night": night,
+            "total": sum(gates.values()),
+            "gates": gates,
+            "buckets": buckets,
+        }
+        if snapshot != self.snapshot:
+            self.snapshot = snapshot
+            self.version += 1
+            # Swap in a fresh event so every subscriber waiting on the old one
+            # wakes up, without one subscriber's reset hiding it from another
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Occupancy refresh failed: {str(e)}")
+
+    def view(self) -> dict:
+        return {
+            **self.snapshot,
+            "estimated_total": self.estimated_total(),
+            "capacity": self.capacity or None,
+            "version": self.version,
+        }
+
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        Server-Sent Events: one message per snapshot change, coalesced to at
+        most one per refresh interval, with heartbeats in between
+        """
+        sent_version = -1
+        while True:
+            changed = self._changed
+            if self.version != sent_version:
+                sent_version = self.version
+                yield f"id: {sent_version}\nevent: occupancy\ndata: {json.dumps(self.view())}\n\n"
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+
+
+occupancy_service = OccupancyService(
+    capacity=settings.VENUE_CAPACITY,
+    shards=settings.OCCUPANCY_SHARDS,
+    refresh_seconds=settings.OCCUPANCY_REFRESH_SECONDS,
+)
@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+from ..core.config import get_settings
+from .payment_service import get_gateway, payment_service, verify_webhook_signatures
+
+settings = get_settings()
+
+EVENTS_COLLECTION = "payment_events"
+# A worker that claimed events and died releases them after this long
+CLAIM_LEASE_SECONDS = 60
+# refund_status of a cancelled booking whose payment was captured afterwards
+LATE_CAPTURE_REFUND = "pending"
+
+
+def booking_transition(booking_id: str, payment: dict, now: datetime) -> List[UpdateOne]:
+    """
+    Conditional booking updates for a gateway payment. Only pending bookings
+    move, and a capture also wins over an earlier failed attempt, so
+    duplicate or out-of-order deliveries are harmless. A capture that lands
+    after the booking was cancelled (payment timeout, mass cancellation)
+    records the payment and queues it for a refund instead.
+    """
+    try:
+        _id = ObjectId(booking_id)
+    except (InvalidId, TypeError):
+        return []
+    if payment.get("status") == "captured":
+        paid = {"payment_status": "paid", "payment_id": payment["id"], "paid_at": now}
+        return [
+            UpdateOne(
+                {
+                    "_id": _id,
+                    "payment_status": {"$in": ["pending", "failed"]},
+                    "status": {"$ne": "cancelled"},
+                },
+                {"$set": paid, "$inc": {"revision": 1}}
+            ),
+            UpdateOne(
+                {
+                    "_id": _id,
+                    "payment_status": {"$in": ["pending", "failed"]},
+                    "status": "cancelled",
+                },
+                {
+                    "$set": {**paid, "refund_status": LATE_CAPTURE_REFUND},
+                    "$inc": {"revision": 1},
+                }
+            ),
+        ]
+    if payment.get("status") == "failed":
+        return [UpdateOne(
+            {"_id": _id, "payment_status": "pending"},
+            {
+                "$set": {"payment_status": "failed", "payment_id": payment["id"]},
+                "$inc": {"revision": 1},
+            }
+        )]
+    return []
+
+
+class PaymentReconciler:
+    """
+    Applies gateway payment outcomes to bookings.
+
+    The webhook endpoint only appends the raw delivery to payment_events.
+    Every worker runs a loop that claims a batch of pending events, checks
+    their signatures together and applies the resulting transitions with one
+    bulk_write. A slower sweep asks the gateway about bookings left pending
+    past PAYMENT_STALE_MINUTES, covering lost webhooks; it needs a gateway
+    client and is skipped without one.
+    """
+
+    def __init__(self, batch_size: int, interval: float, sweep_interval: float, gateway=None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self.gateway = gateway
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.db = None
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, db):
+        self.db = db
+        self._tasks = [
+            asyncio.create_task(self._reconcile_loop()),
+            asyncio.create_task(self._sweep_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self.db = None
+
+    async def ingest(self, db, body: bytes, signature: Optional[str], event_id: Optional[str]):
+        """
+        Durably record a webhook delivery; redeliveries of a known event id
+        are acknowledged without a second copy
+        """
+        event = {
+            "body": body,
+            "signature": signature,
+            "status": "pending",
+            "received_at": datetime.utcnow(),
+        }
+        if event_id:
+            event["event_id"] = event_id
+        events = db[EVENTS_COLLECTION].with_options(
+            write_concern=WriteConcern(w="majority", j=True)
+        )
+        try:
+            await events.insert_one(event)
+        except DuplicateKeyError:
+            return
+        self._wake.set()
+
+    async def _claim(self) -> List[dict]:
+        now = datetime.utcnow()
+        claimable = {"$or": [
+            {"status": "pending"},
+            {"status": "processing", "claimed_at": {"$lt": now - timedelta(seconds=CLAIM_LEASE_SECONDS)}},
+        ]}
+        candidates = await self.db[EVENTS_COLLECTION].find(
+            claimable, {"_id": 1}
+        ).sort("received_at", 1).limit(self.batch_size).to_list(None)
+        if not candidates:
+            return []
+        claim = f"{self.worker_id}-{uuid.uuid4().hex[:8]}"
+        await self.db[EVENTS_COLLECTION].update_many(
+            {"_id": {"$in": [event["_id"] for event in candidates]}, **claimable},
+            {"$set": {"status": "processing", "claimed_by": claim, "claimed_at": now}}
+        )
+        return await self.db[EVENTS_COLLECTION].find({"claimed_by": claim}).to_list(None)
+
+    async def reconcile_once(self) -> Dict[str, int]:
+        """
+        Process one batch of webhook events
+        """
+        events = await self._claim()
+        if not events:
+            return {}
+
+        now = datetime.utcnow()
+        outcomes: Dict[str, List[ObjectId]] = {"processed": [], "rejected": [], "ignored": []}
+        operations = []
+        for event, valid in zip(events, verify_webhook_signatures(events)):
+            if not valid:
+                outcomes["rejected"].append(event["_id"])
+                continue
+            try:
+                payment = json.loads(event["body"])["payload"]["payment"]["entity"]
+            except (ValueError, KeyError, TypeError):
+                outcomes["ignored"].append(event["_id"])
+                continue
+            transition = booking_transition((payment.get("notes") or {}).get("booking_id"), payment, now)
+            if not transition:
+                outcomes["ignored"].append(event["_id"])
+                continue
+            operations.extend(transition)
+            outcomes["processed"].append(event["_id"])
+
+        if operations:
+            await self.db["bookings"].bulk_write(operations, ordered=False)
+        for status, ids in outcomes.items():
+            if ids:
+                await self.db[EVENTS_COLLECTION].update_many(
+                    {"_id": {"$in": ids}},
+                    {"$set": {"status": status, "processed_at": now}, "$unset": {"claimed_by": ""}}
+                )
+        return {status: len(ids) for status, ids in outcomes.items()}
+
+    async def sweep_once(self) -> int:
+        """
+        Ask the gateway about stale pending bookings; returns bookings updated
+        """
+        if self.gateway is None:
+            return 0
+        now = datetime.utcnow()
+        stale = await self.db["bookings"].find(
+            {
+                "payment_status": "pending",
+                "created_at": {"$lt": datetime.now() - timedelta(minutes=settings.PAYMENT_STALE_MINUTES)},
+                # Bookings the gateway knows nothing about are rechecked once per sweep
+                "$or": [
+                    {"payment_checked_at": None},
+                    {"payment_checked_at": {"$lt": now - timedelta(seconds=self.sweep_interval / 2)}},
+                ],
+            },
+            {"_id": 1}
+        ).limit(self.batch_size).to_list(None)
+        if not stale:
+            return 0
+        await self.db["bookings"].update_many(
+            {"_id": {"$in": [booking["_id"] for booking in stale]}},
+            {"$set": {"payment_checked_at": now}}
+        )
+        payments = await self.gateway.fetch_payments([str(booking["_id"]) for booking in stale])
+        operations = [
+            operation
+            for booking_id, payment in payments.items()
+            for operation in booking_transition(booking_id, payment, now)
+        ]
+        if not operations:
+            return 0
+        result = await self.db["bookings"].bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    async def refund_late_captures(self) -> int:
+        """
+        Refund payments captured after their booking was cancelled; returns
+        refunds processed. A refund the gateway keeps failing is marked
+        failed after REFUND_MAX_ATTEMPTS sweeps.
+        """
+        bookings = await self.db["bookings"].find(
+            {"status": "cancelled", "payment_status": "paid", "refund_status": LATE_CAPTURE_REFUND},
+            {"payment_id": 1, "amount_paid": 1, "refund_attempts": 1}
+        ).limit(self.batch_size).to_list(None)
+        operations, processed = [], 0
+        for booking in bookings:
+            refund = await payment_service.refund_payment(
+                booking["payment_id"],
+                booking.get("amount_paid"),
+                idempotency_key=f"late-capture:{booking['_id']}:{booking['payment_id']}"
+            )
+            if refund and refund.get("status") == "processed":
+                processed += 1
+                update = {"$set": {
+                    "refund_status": "processed",
+                    "refund_id": refund["refund_id"],
+                    "refunded_at": datetime.now(),
+                }}
+            elif booking.get("refund_attempts", 0) + 1 >= settings.REFUND_MAX_ATTEMPTS:
+                update = {"$set": {"refund_status": "failed"}, "$inc": {"refund_attempts": 1}}
+            else:
+                update = {"$inc": {"refund_attempts": 1}}
+            operations.append(UpdateOne(
+                {"_id": booking["_id"], "refund_status": LATE_CAPTURE_REFUND}, update
+            ))
+        if not operations:
+            return 0
+        await self.db["bookings"].bulk_write(operations, ordered=False)
+        return processed
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # A full batch means a burst is in progress; keep draining
+                while sum((await self.reconcile_once()).values()) >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Payment reconciliation failed: {str(e)}")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                updated = await self.sweep_once()
+                if updated:
+                    print(f"Payment sweep updated {updated} bookings")
+                refunded = await self.refund_late_captures()
+                if refunded:
+                    print(f"Payment sweep refunded {refunded} late captures")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Payment sweep failed: {str(e)}")
+
+
+payment_reconciler = PaymentReconciler(
+    batch_size=settings.PAYMENT_RECONCILE_BATCH,
+    interval=settings.PAYMENT_RECONCILE_SECONDS,
+    sweep_interval=settings.PAYMENT_SWEEP_SECONDS,
+    gateway=get_gateway(),
+)
+
+
+if __name__ == "__main__":
+    # End-to-end check against the local gateway, using a scratch database
+    # on MONGODB_URL: python -m app.services.payment_reconciler
+    import time
+    from ..db.mongodb import MongoDB
+    from .payment_service import LocalGateway, sign_webhook
+
+    async def check(bookings: int = 1000):
+        await MongoDB.connect_to_database()
+        db = MongoDB.client[f"{settings.DB_NAME}_payments_check"]
+        await db.drop_collection(EVENTS_COLLECTION)
+        await db.drop_collection("bookings")
+        from ..db.indexes import ensure_indexes
+        await ensure_indexes(db)
+
+        created = datetime.now() - timedelta(minutes=settings.PAYMENT_STALE_MINUTES + 1)
+        ids = [ObjectId() for _ in range(bookings)]
+        await db["bookings"].insert_many([
+            {"_id": _id, "payment_status": "pending", "amount_paid": 500.0, "created_at": created}
+            for _id in ids
+        ])
+
+        gateway = LocalGateway()
+        payment_reconciler.gateway = gateway
+
+        # 80% captured with a webhook (10% delivered twice), 10% failed,
+        # 10% captured but the webhook was lost, plus a forged capture for a
+        # failed booking
+        deliveries = []
+        for index, _id in enumerate(ids):
+            payment = gateway.pay(str(_id), 500.0, captured=index % 10 != 0)
+            if index % 10 == 9:
+                continue
+            deliveries.append(gateway.webhook(payment))
+            if index % 10 == 1:
+                deliveries.append(deliveries[-1])
+        captured = dict(gateway.payments[str(ids[0])], status="captured")
+        forged = json.dumps({"payload": {"payment": {"entity": captured}}}).encode()
+        deliveries.append((forged, sign_webhook(forged, "wrong-secret"), None))
+
+        started = time.perf_counter()
+        for body, signature, event_id in deliveries:
+            await payment_reconciler.ingest(db, body, signature, event_id)
+        ingested = time.perf_counter()
+        payment_reconciler.db = db
+        totals: Dict[str, int] = {}
+        while True:
+            counts = await payment_reconciler.reconcile_once()
+            if not counts:
+                break
+            for status, count in counts.items():
+                totals[status] = totals.get(status, 0) + count
+        reconciled = time.perf_counter()
+        swept = await payment_reconciler.sweep_once()
+        finished = time.perf_counter()
+
+        statuses = await db["bookings"].aggregate([
+            {"$group": {"_id": "$payment_status", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        print(f"ingested {len(deliveries)} deliveries in {ingested - started:.2f}s")
+        print(f"reconciled {totals} in {reconciled - ingested:.2f}s")
+        print(f"sweep updated {swept} bookings in {finished - reconciled:.2f}s")
+        print({row["_id"]: row["count"] for row in statuses})
+        await MongoDB.client.drop_database(db.name)
+        await MongoDB.close_database_connection()
+
+    asyncio.run(check())
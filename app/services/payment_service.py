@@ -1,5 +1,41 @@
-from typing import Dict, Optional
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import json
+import uuid
+from pymongo.errors import DuplicateKeyError
+from ..core.config import get_settings
+from ..db.mongodb import MongoDB
+
+settings = get_settings()
+
+REFUNDS_COLLECTION = "refunds"
+# A refund claimed by a worker that died before recording the outcome can
+# be attempted again after this long
+REFUND_CLAIM_SECONDS = 60
+
+
+def sign_webhook(body: bytes, secret: str = None) -> str:
+    """
+    Razorpay-style webhook signature: hex HMAC-SHA256 of the raw body
+    """
+    secret = secret or settings.PAYMENT_WEBHOOK_SECRET
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_webhook_signatures(events: Iterable[dict], secret: str = None) -> List[bool]:
+    """
+    Check a batch of stored webhook events, reusing one keyed HMAC
+    """
+    secret = secret or settings.PAYMENT_WEBHOOK_SECRET
+    keyed = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+    results = []
+    for event in events:
+        mac = keyed.copy()
+        mac.update(event["body"])
+        results.append(hmac.compare_digest(mac.hexdigest(), event.get("signature") or ""))
+    return results
 
 class PaymentService:
     
@@ -48,16 +84,69 @@ class PaymentService:
     async def refund_payment(
         self,
         payment_id: str,
-        amount: float = None
+        amount: float = None,
+        idempotency_key: str = None
     ) -> Dict:
         """
-        Refund a payment
+        Refund a payment. Refunds with an idempotency key are recorded in
+        the refunds collection: a retry with the same key returns the
+        recorded refund instead of paying out twice, and one that races a
+        refund still in flight gets None and retries later.
+        """
+        if idempotency_key is None:
+            return await self._refund(payment_id, amount, None)
+
+        refunds = MongoDB.get_db()[REFUNDS_COLLECTION]
+        now = datetime.now()
+        try:
+            await refunds.insert_one({
+                "_id": idempotency_key,
+                "status": "processing",
+                "payment_id": payment_id,
+                "claimed_at": now,
+            })
+        except DuplicateKeyError:
+            record = await refunds.find_one({"_id": idempotency_key})
+            if record is not None and record["status"] == "processed":
+                return record["refund"]
+            # Take over a claim whose worker died; a live one is left alone
+            taken = await refunds.update_one(
+                {
+                    "_id": idempotency_key,
+                    "status": "processing",
+                    "claimed_at": {"$lt": now - timedelta(seconds=REFUND_CLAIM_SECONDS)},
+                },
+                {"$set": {"claimed_at": now}}
+            )
+            if taken.modified_count == 0:
+                return None
+
+        refund = await self._refund(payment_id, amount, idempotency_key)
+        if refund is None or refund.get("status") != "processed":
+            await refunds.delete_one({"_id": idempotency_key, "status": "processing"})
+            return refund
+        await refunds.update_one(
+            {"_id": idempotency_key},
+            {"$set": {"status": "processed", "refund": refund, "processed_at": now}}
+        )
+        return refund
+
+    async def _refund(
+        self,
+        payment_id: str,
+        amount: Optional[float],
+        idempotency_key: Optional[str]
+    ) -> Optional[Dict]:
+        """
+        Gateway refund call; the key is passed on so the gateway can
+        deduplicate too
         """
         try:
             refund = {
                 "refund_id": f"REF_{datetime.now().strftime('%Y%m%d%H%M%S')}",
                 "payment_id": payment_id,
                 "amount": amount,
+                "idempotency_key": idempotency_key,
                 "status": "processed",
                 "processed_at": datetime.now().isoformat()
             }
@@ -65,3 +154,71 @@ class PaymentService:
         except Exception as e:
             print(f"Refund failed: {str(e)}")
             return None
+
+
+payment_service = PaymentService()
+
+
+class LocalGateway:
+    """
+    In-process stand-in for the payment gateway. It keeps payments in
+    memory, produces signed webhook deliveries and answers status lookups
+    the way the real client is expected to.
+    """
+
+    def __init__(self, secret: str = None):
+        self.secret = secret or settings.PAYMENT_WEBHOOK_SECRET
+        self.payments: Dict[str, dict] = {}
+
+    def pay(self, booking_id: str, amount: float, captured: bool = True) -> dict:
+        payment = {
+            "id": f"pay_{uuid.uuid4().hex[:14]}",
+            "entity": "payment",
+            "amount": int(round(amount * 100)),
+            "currency": "INR",
+            "status": "captured" if captured else "failed",
+            "notes": {"booking_id": booking_id},
+            "created_at": int(datetime.now().timestamp()),
+        }
+        self.payments[booking_id] = payment
+        return payment
+
+    def webhook(self, payment: dict) -> tuple:
+        """
+        Body, signature and event id headers as the gateway would deliver them
+        """
+        event = "payment.captured" if payment["status"] == "captured" else "payment.failed"
+        body = json.dumps({
+            "event": event,
+            "payload": {"payment": {"entity": payment}},
+        }).encode()
+        return body, sign_webhook(body, self.secret), f"evt_{uuid.uuid4().hex[:14]}"
+
+    async def fetch_payments(self, booking_ids: List[str]) -> Dict[str, dict]:
+        """
+        Latest payment for each booking that has one
+        """
+        return {
+            booking_id: self.payments[booking_id]
+            for booking_id in booking_ids
+            if booking_id in self.payments
+        }
+
+
+# Gateway clients by PAYMENT_GATEWAY; the reconciler only needs fetch_payments
+GATEWAYS = {
+    "local": LocalGateway,
+}
+
+
+def get_gateway(name: Optional[str] = None):
+    """
+    Gateway client the reconciler sweeps with, or None when none is
+    configured. The local stand-in is only used when asked for by name.
+    """
+    name = settings.PAYMENT_GATEWAY if name is None else name
+    if not name:
+        return None
+    if name not in GATEWAYS:
+        raise ValueError(f"Unknown payment gateway: {name}")
+    return GATEWAYS[name]()
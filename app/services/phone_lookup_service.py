@@ -0,0 +1,238 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from ..core.config import get_settings
+from ..db.events import event_scope
+from .entry_service import entries_remaining
+from .occupancy_service import current_night
+
+settings = get_settings()
+
+# Numbers are stored and searched as the 10-digit national number; a +91
+# country code or a leading trunk 0 is dropped
+NATIONAL_DIGITS = 10
+COUNTRY_CODE = "91"
+SUFFIX_DIGITS = 4
+
+# Search modes
+PREFIX = "prefix"
+LAST4 = "last4"
+MODES = (PREFIX, LAST4)
+
+BACKFILL_BATCH_SIZE = 500
+
+# Users matched by one lookup; a last-4 search on a large user base has to
+# stop somewhere
+MAX_HOLDERS = 200
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """
+    National digits of a full or partial phone number, however it was typed
+    """
+    phone = (phone or "").strip()
+    digits = re.sub(r"\D", "", phone)
+    if len(digits) > NATIONAL_DIGITS:
+        digits = digits[-NATIONAL_DIGITS:]
+    elif phone.startswith("+") and digits.startswith(COUNTRY_CODE):
+        digits = digits[len(COUNTRY_CODE):]
+    return digits.lstrip("0")
+
+
+def phone_keys(phone: Optional[str]) -> dict:
+    """
+    Indexed search keys stored next to a phone number
+    """
+    digits = normalize_phone(phone)
+    return {"phone_normalized": digits, "phone_last4": digits[-SUFFIX_DIGITS:]}
+
+
+def with_phone_keys(members: Optional[List[dict]]) -> Optional[List[dict]]:
+    if members is None:
+        return None
+    return [{**member, **phone_keys(member.get("phone"))} for member in members]
+
+
+def tonight_filter(now: datetime) -> dict:
+    """
+    Active bookings that can still be used at some point tonight
+    """
+    night_end = datetime.fromisoformat(current_night(now)) + timedelta(
+        days=1, hours=settings.OCCUPANCY_NIGHT_ROLLOVER_HOUR
+    )
+    return {
+        **event_scope(),
+        "status": "active",
+        "$and": [
+            {"$or": [
+                {"pass_rules.validity_start": None},
+                {"pass_rules.validity_start": {"$lt": night_end}},
+            ]},
+            {"$or": [
+                {"pass_rules.validity_end": None},
+                {"pass_rules.validity_end": {"$gte": now}},
+            ]},
+        ],
+    }
+
+
+def _summary(booking: dict, holder: Optional[dict], digits: str, mode: str) -> dict:
+    field = "phone_normalized" if mode == PREFIX else "phone_last4"
+
+    def matches(keys: dict) -> bool:
+        value = keys.get(field) or ""
+        return value.startswith(digits) if mode == PREFIX else value == digits
+
+    members = booking.get("group_members") or []
+    summary = {
+        "booking_id": str(booking["_id"]),
+        "pass_type": (booking.get("pass_rules") or {}).get("type"),
+        "is_group": booking.get("is_group", False),
+        "holder_name": holder["name"] if holder else None,
+        "holder_phone": holder["phone"] if holder else None,
+        "matched_holder": bool(holder) and matches(holder),
+        "validity_start": (booking.get("pass_rules") or {}).get("validity_start"),
+        "validity_end": (booking.get("pass_rules") or {}).get("validity_end"),
+    }
+    if booking.get("is_group"):
+        summary["group_members"] = [
+            {
+                "index": index,
+                "name": member["name"],
+                "phone": member["phone"],
+                "entered": member["entry_status"],
+                "matched": matches(member),
+            }
+            for index, member in enumerate(members)
+        ]
+    else:
+        summary["entries_remaining"] = entries_remaining(booking)
+    return summary
+
+
+class PhoneLookupService:
+    """
+    Finds tonight's active bookings by phone number for an attendee who
+    cannot show their QR code.
+
+    Every stored phone carries two derived keys: the normalized national
+    number and its last four digits. A prefix search is an anchored regex
+    on the first, which Mongo answers as a range scan of the index; a
+    last-4 search is an equality match on the second. Holders are found on
+    the users indexes and then their bookings on (event_id, user_id);
+    group members are found directly on multikey indexes over
+    group_members, both scoped to the current event.
+    """
+
+    def criteria(self, phone: str, mode: str) -> Tuple[str, Any, str]:
+        """
+        Indexed field, its match and the searched digits; ValueError when the
+        input is too short to search on
+        """
+        if mode == LAST4:
+            digits = re.sub(r"\D", "", phone)
+            if len(digits) != SUFFIX_DIGITS:
+                raise ValueError(f"Last-4 search needs exactly {SUFFIX_DIGITS} digits")
+            return "phone_last4", digits, digits
+        digits = normalize_phone(phone)
+        if len(digits) < settings.PHONE_LOOKUP_MIN_PREFIX:
+            raise ValueError(
+                f"Prefix search needs at least {settings.PHONE_LOOKUP_MIN_PREFIX} digits"
+            )
+        # Digits only, so nothing to escape; the anchor keeps it an index range
+        return "phone_normalized", {"$regex": f"^{digits}"}, digits
+
+    async def lookup(
+        self,
+        db,
+        phone: str,
+        mode: str = PREFIX,
+        now: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[dict]:
+        now = now or datetime.now()
+        limit = limit or settings.PHONE_LOOKUP_LIMIT
+        field, value, digits = self.criteria(phone, mode)
+        tonight = tonight_filter(now)
+        projection = {"qr_code": 0, "group_qr_codes": 0}
+
+        async def holder_bookings():
+            holders = await db["users"].find(
+                {field: value}, {"name": 1, "phone": 1, field: 1}
+            ).limit(MAX_HOLDERS).to_list(None)
+            if not holders:
+                return [], holders
+            bookings = await db["bookings"].find(
+                {**tonight, "user_id": {"$in": [str(user["_id"]) for user in holders]}},
+                projection
+            ).limit(limit).to_list(None)
+            return bookings, holders
+
+        (by_holder, holders), by_member = await asyncio.gather(
+            holder_bookings(),
+            db["bookings"].find(
+                {**tonight, f"group_members.{field}": value}, projection
+            ).limit(limit).to_list(None),
+        )
+
+        bookings: Dict[str, dict] = {}
+        for booking in by_holder + by_member:
+            bookings.setdefault(str(booking["_id"]), booking)
+        bookings = dict(list(bookings.items())[:limit])
+
+        users = {str(user["_id"]): user for user in holders}
+        # Holders of bookings found through a group member, in one query
+        missing = {
+            booking["user_id"] for booking in bookings.values()
+            if booking.get("user_id") not in users and ObjectId.is_valid(booking.get("user_id"))
+        }
+        if missing:
+            for user in await db["users"].find(
+                {"_id": {"$in": [ObjectId(user_id) for user_id in missing]}},
+                {"name": 1, "phone": 1, "phone_normalized": 1, "phone_last4": 1}
+            ).to_list(None):
+                users[str(user["_id"])] = user
+
+        return [
+            _summary(booking, users.get(booking.get("user_id")), digits, mode)
+            for booking in bookings.values()
+        ]
+
+    async def backfill(self, db) -> Dict[str, int]:
+        """
+        Derive the search keys for users and group bookings stored before
+        they existed; returns the number of documents updated per collection
+        """
+        updated = {"users": 0, "bookings": 0}
+        sources = (
+            ("users", {"phone": {"$ne": None}, "phone_normalized": None}, "phone",
+             phone_keys),
+            ("bookings", {
+                "is_group": True,
+                "group_members.0": {"$exists": True},
+                "group_members.0.phone_normalized": None,
+            }, "group_members",
+             lambda members: {"group_members": with_phone_keys(members)}),
+        )
+        for collection, query, field, keys in sources:
+            operations = []
+            async for doc in db[collection].find(query, {field: 1}):
+                # Guarded on the source value, so an entry admitted meanwhile
+                # is not overwritten with a stale member list
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], field: doc[field]}, {"$set": keys(doc[field])}
+                ))
+                if len(operations) == BACKFILL_BATCH_SIZE:
+                    result = await db[collection].bulk_write(operations, ordered=False)
+                    updated[collection] += result.modified_count
+                    operations = []
+            if operations:
+                result = await db[collection].bulk_write(operations, ordered=False)
+                updated[collection] += result.modified_count
+        return updated
+
+
+phone_lookup_service = PhoneLookupService()
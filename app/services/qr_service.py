@@ -1,23 +1,168 @@
-import qrcode
+from functools import lru_cache
 from io import BytesIO
+from typing import List, Tuple
 import base64
+from ..core.config import get_settings
 
-def generate_qr_code(data: str) -> str:
+settings = get_settings()
+
+# qrcode/Pillow are imported on first render to keep them off the cold-start path
+
+QR_BORDER = 4  # quiet zone required by the QR spec
+MIN_BOX_SIZE = 1
+MAX_BOX_SIZE = 20
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "matrix": "application/json",
+}
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def build_matrix(data: str) -> Tuple[Tuple[bool, ...], ...]:
     """
-    Generate a QR code for the given data and return it as a base64 encoded string
+    Module matrix for the data, without the quiet zone
     """
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=0,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def render_png(data: str, box_size: int) -> bytes:
+    import qrcode
+
     qr = qrcode.QRCode(
-        version=1,
+        version=None,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=QR_BORDER,
     )
     qr.add_data(data)
     qr.make(fit=True)
 
     img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert the image to base64
     buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    img.save(buffered, format="PNG", optimize=True)
+    return buffered.getvalue()
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def render_svg(data: str, box_size: int = 0) -> bytes:
+    """
+    SVG drawing each horizontal run of dark modules as a 1-unit stroke, using
+    relative moves to keep the path short. box_size sets the rendered pixel
+    size per module; 0 leaves it scalable.
+    """
+    matrix = build_matrix(data)
+    size = len(matrix) + 2 * QR_BORDER
+    path = [f"M{QR_BORDER} {QR_BORDER + 0.5}"]
+    cursor_x, cursor_y = QR_BORDER, QR_BORDER
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            run = x
+            while run < len(row) and row[run]:
+                run += 1
+            start_x, start_y = x + QR_BORDER, y + QR_BORDER
+            path.append(f"m{start_x - cursor_x} {start_y - cursor_y}h{run - x}")
+            cursor_x, cursor_y = run + QR_BORDER, start_y
+            x = run
+
+    dimensions = f' width="{size * box_size}" height="{size * box_size}"' if box_size else ""
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}"{dimensions}'
+        f' shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path stroke="#000" d="{"".join(path)}"/></svg>'
+    )
+    return svg.encode()
+
+
+def render_matrix(data: str) -> dict:
+    """
+    Raw modules for clients that draw the code themselves: "bits" is the
+    row-major matrix packed MSB first, one bit per module (1 = dark), base64
+    encoded. Clients add the quiet zone of "border" modules when drawing.
+    """
+    matrix = build_matrix(data)
+    packed = bytearray()
+    current, count = 0, 0
+    for row in matrix:
+        for module in row:
+            current = (current << 1) | int(module)
+            count += 1
+            if count == 8:
+                packed.append(current)
+                current, count = 0, 0
+    if count:
+        packed.append(current << (8 - count))
+    return {
+        "size": len(matrix),
+        "border": QR_BORDER,
+        "bits": base64.b64encode(bytes(packed)).decode(),
+    }
+
+
+def negotiate_format(requested: str = None, accept: str = None) -> str:
+    """
+    Pick a variant from an explicit format parameter, then the Accept header
+    """
+    if requested:
+        return requested if requested in MEDIA_TYPES else None
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip()
+        for name, known in MEDIA_TYPES.items():
+            if media_type == known:
+                return name
+    return "png"
+
+
+def generate_qr_code(data: str, box_size: int = None) -> str:
+    """
+    Generate a QR code for the given data and return it as a base64 encoded string
+    """
+    png = render_png(data, box_size or settings.QR_DEFAULT_BOX_SIZE)
+    return base64.b64encode(png).decode()
+
+
+def _legacy_png(data: str) -> bytes:
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffered = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+if __name__ == "__main__":
+    # Bytes-on-the-wire comparison: python -m app.services.qr_service
+    import json
+    from bson import ObjectId
+
+    data = str(ObjectId())
+    variants: List[Tuple[str, bytes]] = [
+        ("legacy png box=10 border=5", _legacy_png(data)),
+        ("png box=10", render_png(data, 10)),
+        (f"png box={settings.QR_DEFAULT_BOX_SIZE} (default)", render_png(data, settings.QR_DEFAULT_BOX_SIZE)),
+        ("png box=2", render_png(data, 2)),
+        ("svg", render_svg(data)),
+        ("matrix json", json.dumps(render_matrix(data)).encode()),
+    ]
+    baseline = len(base64.b64encode(variants[0][1]))
+    print(f"{'variant':32} {'bytes':>7} {'base64':>7} {'vs legacy':>9}")
+    for name, payload in variants:
+        encoded = len(base64.b64encode(payload))
+        print(f"{name:32} {len(payload):>7} {encoded:>7} {encoded / baseline:>8.0%}")
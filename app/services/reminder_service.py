@@ -0,0 +1,153 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from ..core.config import get_settings
+from .lease_service import MongoLease
+from .notification_service import NotificationService
+
+settings = get_settings()
+
+
+class ReminderScheduler:
+    """
+    Emails holders of active bookings whose pass expires within the next
+    REMINDER_WINDOW_HOURS.
+
+    Every worker runs the loop, but only the holder of the "pass_reminders"
+    lease does the work. Bookings are read with an index-backed range scan on
+    pass_rules.validity_end and marked with expiry_reminder_at once emailed,
+    so reruns and new leaders skip them. Sends go through a dedicated thread
+    pool with persistent SMTP connections, away from the executor the API
+    uses.
+    """
+
+    def __init__(self, interval: float, window_hours: float, chunk_size: int, concurrency: int):
+        self.interval = interval
+        self.window_hours = window_hours
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        # Outlives one sleep so the same worker keeps leading between runs
+        self.lease = MongoLease("pass_reminders", ttl_seconds=interval * 2)
+        self.db = None
+        self.last_run: Optional[Dict] = None
+        self._notifier: Optional[NotificationService] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.db is not None:
+            await self.lease.release(self.db)
+        self.db = None
+
+    def _get_notifier(self) -> NotificationService:
+        if self._notifier is None:
+            executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="reminders"
+            )
+            self._notifier = NotificationService(executor=executor, keep_alive=True)
+        return self._notifier
+
+    async def _send_chunk(self, chunk: List[dict]) -> List[ObjectId]:
+        """
+        Email one chunk of bookings; returns the booking ids that were sent.
+        Bookings of the same user for the same pass share one email.
+        """
+        users = await self.db["users"].find(
+            {"_id": {"$in": list({
+                ObjectId(booking["user_id"]) for booking in chunk
+                if ObjectId.is_valid(booking["user_id"])
+            })}},
+            {"email": 1}
+        ).to_list(None)
+        emails = {str(user["_id"]): user["email"] for user in users}
+
+        recipients: Dict[tuple, List[dict]] = {}
+        for booking in chunk:
+            if booking["user_id"] in emails:
+                recipients.setdefault((booking["user_id"], booking["pass_id"]), []).append(booking)
+
+        notifier = self._get_notifier()
+
+        async def send(bookings: List[dict]) -> List[ObjectId]:
+            booking = bookings[0]
+            sent = await notifier.send_pass_reminder(
+                emails[booking["user_id"]],
+                {"id": booking["pass_id"], "validity_end": booking["pass_rules"]["validity_end"]}
+            )
+            return [booking["_id"] for booking in bookings] if sent else []
+
+        results = await asyncio.gather(*[send(bookings) for bookings in recipients.values()])
+        return [booking_id for sent in results for booking_id in sent]
+
+    async def run_once(self) -> Dict:
+        """
+        Send every due reminder; stops early if the lease is lost
+        """
+        now = datetime.now()
+        cursor = self.db["bookings"].find(
+            {
+                "status": "active",
+                "pass_rules.validity_end": {"$gte": now, "$lte": now + timedelta(hours=self.window_hours)},
+                "expiry_reminder_at": None,
+            },
+            {"user_id": 1, "pass_id": 1, "pass_rules.validity_end": 1}
+        ).sort("pass_rules.validity_end", 1).batch_size(self.chunk_size)
+
+        stats = {"started_at": now, "due": 0, "sent": 0}
+        chunk: List[dict] = []
+
+        async def flush() -> bool:
+            sent = await self._send_chunk(chunk)
+            if sent:
+                await self.db["bookings"].update_many(
+                    {"_id": {"$in": sent}},
+                    {"$set": {"expiry_reminder_at": datetime.now()}}
+                )
+            stats["due"] += len(chunk)
+            stats["sent"] += len(sent)
+            chunk.clear()
+            return await self.lease.acquire(self.db)
+
+        async for booking in cursor:
+            chunk.append(booking)
+            if len(chunk) == self.chunk_size and not await flush():
+                break
+        if chunk:
+            await flush()
+
+        stats["finished_at"] = datetime.now()
+        self.last_run = stats
+        return stats
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self.lease.acquire(self.db):
+                    stats = await self.run_once()
+                    if stats["due"]:
+                        print(f"Pass reminders: sent {stats['sent']} of {stats['due']} due")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Pass reminder run failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+reminder_scheduler = ReminderScheduler(
+    interval=settings.REMINDER_INTERVAL_SECONDS,
+    window_hours=settings.REMINDER_WINDOW_HOURS,
+    chunk_size=settings.REMINDER_CHUNK_SIZE,
+    concurrency=settings.REMINDER_CONCURRENCY,
+)
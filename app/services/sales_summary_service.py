@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+SUMMARY_COLLECTION = "staff_sales_daily"
+
+# Sales still unsummarized this long after the sale are folded in by the
+# reconcile; younger ones may just be mid-request
+RECONCILE_GRACE_SECONDS = 60
+
+
+def summary_id(staff_id: str, day: str) -> str:
+    return f"{staff_id}|{day}"
+
+
+def day_range(start_date: Optional[datetime], end_date: Optional[datetime]) -> dict:
+    query = {}
+    if start_date:
+        query["$gte"] = start_date.date().isoformat()
+    if end_date:
+        query["$lte"] = end_date.date().isoformat()
+    return query
+
+
+async def record_sale(
+    db,
+    sale_id: ObjectId,
+    staff_id: str,
+    sale_time: datetime,
+    gross: float,
+    net: float
+):
+    """
+    Fold one staff sale into the staff member's row for that day, then mark
+    the sale summarized. Each row lists the sales it counts, so a sale
+    folded in twice (a retry, or the reconcile racing the request) counts once.
+    """
+    day = sale_time.date().isoformat()
+    try:
+        await db[SUMMARY_COLLECTION].update_one(
+            {"_id": summary_id(staff_id, day), "sales": {"$ne": sale_id}},
+            {
+                "$inc": {
+                    "count": 1,
+                    "gross": gross,
+                    "discount": gross - net,
+                    "net": net,
+                },
+                "$push": {"sales": sale_id},
+                "$set": {"updated_at": datetime.now()},
+                "$setOnInsert": {"staff_id": staff_id, "day": day},
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The row exists and already lists this sale
+        pass
+    await db["staff_sales"].update_one({"_id": sale_id}, {"$set": {"summarized": True}})
+
+
+async def reconcile(db, batch_size: int) -> int:
+    """
+    Fold in staff sales whose request stopped between storing the sale and
+    updating the summary; returns the number of sales reconciled
+    """
+    cutoff = datetime.now() - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+    reconciled = 0
+    while True:
+        sales = await db["staff_sales"].find(
+            {"summarized": False, "sale_time": {"$lt": cutoff}},
+            {"staff_id": 1, "sale_time": 1, "gross_amount": 1, "amount_paid": 1}
+        ).limit(batch_size).to_list(None)
+        for sale in sales:
+            await record_sale(
+                db, sale["_id"], sale["staff_id"], sale["sale_time"],
+                gross=sale["gross_amount"], net=sale["amount_paid"]
+            )
+        reconciled += len(sales)
+        if len(sales) < batch_size:
+            return reconciled
+
+
+async def get_staff_daily(
+    db,
+    staff_id: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> List[dict]:
+    query = {"staff_id": staff_id}
+    days = day_range(start_date, end_date)
+    if days:
+        query["day"] = days
+    return await db[SUMMARY_COLLECTION].find(
+        query, {"_id": 0, "updated_at": 0, "sales": 0}
+    ).sort("day", 1).to_list(None)
+
+
+async def get_staff_totals(
+    db,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> List[dict]:
+    """
+    Per-staff totals over a date range, with staff names resolved in one query
+    """
+    match = {}
+    days = day_range(start_date, end_date)
+    if days:
+        match["day"] = days
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": "$staff_id",
+                "total_sales": {"$sum": "$count"},
+                "gross_amount": {"$sum": "$gross"},
+                "total_discount": {"$sum": "$discount"},
+                "total_amount": {"$sum": "$net"},
+            }
+        },
+        {"$sort": {"total_amount": -1}},
+    ]
+    totals = await db[SUMMARY_COLLECTION].aggregate(pipeline).to_list(None)
+
+    staff_ids = [ObjectId(row["_id"]) for row in totals if ObjectId.is_valid(row["_id"])]
+    staff = await db["users"].find(
+        {"_id": {"$in": staff_ids}}, {"name": 1, "email": 1}
+    ).to_list(None)
+    staff_info = {str(user["_id"]): user for user in staff}
+
+    for row in totals:
+        info = staff_info.get(row["_id"])
+        row["staff_id"] = row.pop("_id")
+        row["staff_name"] = info["name"] if info else None
+        row["staff_email"] = info["email"] if info else None
+    return totals
+
+
+async def backfill(db) -> int:
+    """
+    Rebuild staff_sales_daily from staff_sales, taking amounts from the linked
+    booking and pass for sales recorded before the summary existed
+    """
+    pipeline = [
+        {
+            "$lookup": {
+                "from": "bookings",
+                "let": {"booking_id": {"$toObjectId": "$booking_id"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$booking_id"]}}},
+                    {"$project": {"pass_id": 1, "amount_paid": 1}},
+                ],
+                "as": "booking",
+            }
+        },
+        {"$unwind": "$booking"},
+        {
+            "$lookup": {
+                "from": "passes",
+                "let": {"pass_id": {"$toObjectId": "$booking.pass_id"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$pass_id"]}}},
+                    {"$project": {"price": 1}},
+                ],
+                "as": "pass",
+            }
+        },
+        {
+            "$project": {
+                "staff_id": 1,
+                "day": {
+                    "$dateToString": {
+                        "format": "%Y-%m-%d",
+                        "date": {"$ifNull": ["$sale_time", {"$toDate": "$_id"}]},
+                    }
+                },
+                "net": {"$ifNull": ["$amount_paid", "$booking.amount_paid"]},
+                "gross": {
+                    "$ifNull": [
+                        "$gross_amount",
+                        {"$ifNull": [{"$first": "$pass.price"}, "$booking.amount_paid"]},
+                    ]
+                },
+            }
+        },
+        {
+            "$group": {
+                "_id": {"$concat": ["$staff_id", "|", "$day"]},
+                "staff_id": {"$first": "$staff_id"},
+                "day": {"$first": "$day"},
+                "count": {"$sum": 1},
+                "sales": {"$push": "$_id"},
+                "gross": {"$sum": "$gross"},
+                "net": {"$sum": "$net"},
+            }
+        },
+        {
+            "$set": {
+                "discount": {"$subtract": ["$gross", "$net"]},
+                "updated_at": "$$NOW",
+            }
+        },
+        {"$merge": {"into": SUMMARY_COLLECTION, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    await db["staff_sales"].aggregate(pipeline).to_list(None)
+    return await db[SUMMARY_COLLECTION].count_documents({})
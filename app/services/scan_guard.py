@@ -0,0 +1,150 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from ..core.config import get_settings
+from .cache_service import invalidation_bus
+
+settings = get_settings()
+
+BUS_NAMESPACE = "consumed_scans"
+
+
+class RecentScanGuard:
+    """
+    Worker-local set of QR payloads known to be finished for good (used up,
+    cancelled or a fully entered group), with the rejection message
+    the gate showed for them. Re-scans within the window are rejected
+    without touching Mongo.
+
+    Those states never revert, so an entry can only be stale by being
+    missing; the window and size bound exist purely to cap memory. New
+    entries are batched to the other workers over the invalidation bus,
+    best effort.
+    """
+
+    def __init__(self, window_seconds: float, max_size: int, share_seconds: float):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.share_seconds = share_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._outbox: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        invalidation_bus.subscribe(BUS_NAMESPACE, self._receive)
+        self._task = asyncio.create_task(self._share_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def check(self, qr_code: str) -> Optional[str]:
+        """
+        Rejection message for a payload consumed recently, else None
+        """
+        entry = self._entries.get(qr_code)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[qr_code]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def _remember(self, qr_code: str, message: str):
+        self._entries[qr_code] = (time.monotonic() + self.window_seconds, message)
+        self._entries.move_to_end(qr_code)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def consume(self, qr_code: str, message: str):
+        self._remember(qr_code, message)
+        self._outbox[qr_code] = message
+
+    def _receive(self, payload: Dict[str, str]):
+        for qr_code, message in (payload or {}).items():
+            self._remember(qr_code, message)
+
+    async def _share_loop(self):
+        while True:
+            await asyncio.sleep(self.share_seconds)
+            if not self._outbox:
+                continue
+            outbox, self._outbox = self._outbox, {}
+            try:
+                await invalidation_bus.broadcast(BUS_NAMESPACE, outbox)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Scan guard share failed: {str(e)}")
+
+    def stats(self) -> dict:
+        checks = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / checks if checks else 0.0,
+        }
+
+
+scan_guard = RecentScanGuard(
+    window_seconds=settings.SCAN_GUARD_WINDOW_SECONDS,
+    max_size=settings.SCAN_GUARD_MAX_SIZE,
+    share_seconds=settings.SCAN_GUARD_SHARE_SECONDS,
+)
+
+
+if __name__ == "__main__":
+    # Gate load with and without the guard in a rescan-heavy night:
+    # python -m app.services.scan_guard
+    import random
+
+    def simulate(guard: Optional[RecentScanGuard], attendees: int = 20000, seed: int = 7) -> dict:
+        """
+        Count Mongo round trips the validation route would make. An
+        admission costs one conditional update; rejecting a consumed pass
+        costs the failed update plus the explaining read.
+        """
+        rng = random.Random(seed)
+        consumed = set()
+        scans: List[str] = []
+        for attendee in range(attendees):
+            # Most people scan once; many re-present their code or pass a
+            # screenshot along
+            scans.extend([f"booking-{attendee}"] * (1 + min(int(rng.expovariate(0.9)), 6)))
+        rng.shuffle(scans)
+        # Re-scans cluster right after the first scan at the gate
+        scans.sort(key=lambda qr: int(qr.split("-")[1]) + rng.random() * 50)
+
+        round_trips = 0
+        for qr_code in scans:
+            if guard is not None and guard.check(qr_code):
+                continue
+            if qr_code in consumed:
+                round_trips += 2
+                if guard is not None:
+                    guard.consume(qr_code, "Pass is used")
+            else:
+                round_trips += 1
+                consumed.add(qr_code)
+                if guard is not None:
+                    guard.consume(qr_code, "Pass is used")
+        return {"scans": len(scans), "round_trips": round_trips}
+
+    baseline = simulate(None)
+    guard = RecentScanGuard(settings.SCAN_GUARD_WINDOW_SECONDS, settings.SCAN_GUARD_MAX_SIZE, 1)
+    guarded = simulate(guard)
+    print(f"scans:                  {baseline['scans']}")
+    print(f"round trips, unguarded: {baseline['round_trips']}")
+    print(f"round trips, guarded:   {guarded['round_trips']}")
+    print(f"load shed:              {1 - guarded['round_trips'] / baseline['round_trips']:.0%}")
+    print(f"guard: {guard.stats()}")
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from ..core.config import get_settings
+from .occupancy_service import occupancy_service
+
+settings = get_settings()
+
+SCAN_EVENTS_COLLECTION = "scan_events"
+RETRY_SECONDS = 1
+
+# Outcomes recorded for a scan
+ADMITTED = "admitted"
+REJECTED = "rejected"
+GROUP_LOOKUP = "group_lookup"
+
+
+class ScanEventLog:
+    """
+    Write-behind, append-only log of every gate scan: who scanned which
+    booking, at which gate and when, and what the gate answered.
+
+    Handlers only append to an in-process buffer and never wait on it. A
+    flusher writes it with one insert_many every flush interval, or sooner
+    once a batch is full, and folds the admissions of the batch into the
+    occupancy counters with one bulk write. Admissions are counted before
+    anything else, so only the log entry itself is best-effort: the buffer
+    is bounded, and when Mongo falls behind a full buffer wakes the flusher
+    and further entries are dropped rather than stall the gate. Whatever
+    is buffered is flushed on shutdown.
+    """
+
+    def __init__(self, flush_ms: float, batch_size: int, max_buffer: int):
+        self.flush_seconds = flush_ms / 1000
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.db = None
+        self.written = 0
+        self.dropped = 0
+        self._buffer: List[dict] = []
+        # Admissions not yet applied to the occupancy counters
+        self._totals: Dict[Tuple[str, Optional[str]], int] = {}
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self, db):
+        self.db = db
+        self._stopping = False
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            # Let an in-flight flush finish instead of cancelling it mid-write
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        if self.db is not None:
+            while self._buffer or self._totals:
+                if not await self.flush():
+                    print(f"Scan log: {len(self._buffer)} events lost at shutdown")
+                    break
+        self.db = None
+
+    def record(
+        self,
+        booking_id: str,
+        gate: str,
+        scanned_by: str,
+        outcome: str,
+        entries: int = 0,
+        pass_type: Optional[str] = None,
+        message: Optional[str] = None,
+        member_indexes: Optional[List[int]] = None
+    ):
+        # Occupancy is fed from here alone, so the admission counts even
+        # when its log entry has to be dropped
+        if entries:
+            key = (gate, pass_type)
+            self._totals[key] = self._totals.get(key, 0) + entries
+
+        if len(self._buffer) >= self.max_buffer:
+            self._full.set()
+            self.dropped += 1
+            print(f"Scan log buffer full, dropped scan of {booking_id}")
+            return
+
+        self._buffer.append({
+            "_id": ObjectId(),
+            "booking_id": booking_id,
+            "gate": gate,
+            "scanned_by": scanned_by,
+            "scanned_at": datetime.utcnow(),
+            "outcome": outcome,
+            "entries": entries,
+            "pass_type": pass_type,
+            "message": message,
+            "member_indexes": member_indexes,
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self) -> bool:
+        """
+        Write one batch of events and every pending admission total; False
+        when something has to be retried
+        """
+        batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+        totals, self._totals = self._totals, {}
+        ok = True
+
+        if batch:
+            try:
+                await self.db[SCAN_EVENTS_COLLECTION].insert_many(batch, ordered=False)
+                self.written += len(batch)
+            except BulkWriteError as e:
+                # Events from a retried batch that did land are skipped
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    self._buffer[:0] = batch
+                    ok = False
+                    print(f"Scan log flush failed: {str(e)}")
+                else:
+                    self.written += len(batch)
+            except Exception as e:
+                self._buffer[:0] = batch
+                ok = False
+                print(f"Scan log flush failed: {str(e)}")
+
+        if totals:
+            try:
+                await occupancy_service.record_many(self.db, totals)
+            except Exception as e:
+                for key, entries in totals.items():
+                    self._totals[key] = self._totals.get(key, 0) + entries
+                ok = False
+                print(f"Scan log occupancy update failed: {str(e)}")
+
+        return ok
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            # Drain full batches back to back; a partial one waits for the timer
+            while self._buffer or self._totals:
+                if not await self.flush():
+                    await asyncio.sleep(RETRY_SECONDS)
+                    break
+                if len(self._buffer) < self.batch_size:
+                    break
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+scan_log = ScanEventLog(
+    flush_ms=settings.SCAN_LOG_FLUSH_MS,
+    batch_size=settings.SCAN_LOG_BATCH_SIZE,
+    max_buffer=settings.SCAN_LOG_MAX_BUFFER,
+)
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from ..core.config import get_settings
+from ..db.events import ALL_EVENTS, event_scope
+from .cache_service import invalidation_bus
+
+settings = get_settings()
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+GROUP_BY = ("pass_type", "sold_by")
+MAX_BUCKETS = 24 * 120
+MAX_CACHED_BUCKETS = 50000
+
+# Bookings counted as sold; pending ones settle or expire within
+# PENDING_BOOKING_TTL_MINUTES
+SOLD_STATUSES = ["paid", "cash"]
+
+# Cancelled bookings keep their payment_status (a refund, if any, is
+# tracked in refund_status), so they are excluded by status
+SOLD_FILTER = {"payment_status": {"$in": SOLD_STATUSES}, "status": {"$ne": "cancelled"}}
+
+BUS_NAMESPACE = "timeseries"
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    """
+    Python twin of $dateTrunc for the supported units
+    """
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _group_key(group_by: Optional[str], field: str) -> dict:
+    if group_by is None:
+        return {"$literal": "all"}
+    if field == "bookings":
+        return {
+            "pass_type": {"$ifNull": ["$pass_rules.type", "unknown"]},
+            "sold_by": {"$ifNull": ["$sold_by", "online"]},
+        }[group_by]
+    return {"$ifNull": ["$pass_type", "unknown"]}
+
+
+class TimeseriesService:
+    """
+    Bucketed sales, revenue and entries for the admin charts.
+
+    Sales and revenue come from a $dateTrunc aggregation over one event's
+    bookings on the (event_id, payment_status, created_at) index; entries
+    come from the gross "entered" counts on the venue's occupancy counters.
+    Buckets that can no longer change (older than the pending-payment window
+    plus the analytics staleness bound) are cached per worker, so a refresh
+    only aggregates the recent buckets. Cancellations change settled
+    buckets after the fact and drop them through invalidate().
+    """
+
+    def __init__(self):
+        # (granularity, group_by, event) -> bucket start -> group -> metrics
+        self._settled: Dict[Tuple[str, Optional[str], str], Dict[datetime, Dict[str, dict]]] = {}
+        invalidation_bus.subscribe(BUS_NAMESPACE, self._drop)
+
+    def _drop(self, payload: Optional[dict]):
+        """
+        Forget the cached buckets holding payload["at"], or all of them
+        """
+        at = (payload or {}).get("at")
+        if at is None:
+            self._settled.clear()
+            return
+        for (granularity, _, _), buckets in self._settled.items():
+            buckets.pop(truncate(at, granularity), None)
+
+    async def invalidate(self, at: Optional[datetime] = None):
+        """
+        Drop the buckets holding a booking sold at `at` (every bucket when
+        None) in this worker and the others
+        """
+        payload = {"at": at}
+        self._drop(payload)
+        await invalidation_bus.broadcast(BUS_NAMESPACE, payload)
+
+    def settled_before(self, now: datetime) -> datetime:
+        return now - timedelta(
+            minutes=settings.PENDING_BOOKING_TTL_MINUTES,
+            seconds=settings.ANALYTICS_MAX_STALENESS_SECONDS
+        )
+
+    async def _aggregate(
+        self,
+        db,
+        granularity: str,
+        group_by: Optional[str],
+        start: datetime,
+        end: datetime,
+        scope: dict
+    ) -> Dict[datetime, Dict[str, dict]]:
+        buckets: Dict[datetime, Dict[str, dict]] = {}
+
+        def slot(bucket: datetime, key: str) -> dict:
+            return buckets.setdefault(bucket, {}).setdefault(
+                str(key), {"sales": 0, "revenue": 0.0, "entries": 0}
+            )
+
+        sales = await db["bookings"].aggregate([
+            {"$match": {
+                **scope,
+                **SOLD_FILTER,
+                "created_at": {"$gte": start, "$lt": end},
+            }},
+            {"$group": {
+                "_id": {
+                    "bucket": {"$dateTrunc": {"date": "$created_at", "unit": granularity}},
+                    "key": _group_key(group_by, "bookings"),
+                },
+                "sales": {"$sum": 1},
+                "revenue": {"$sum": "$amount_paid"},
+            }},
+        ]).to_list(None)
+        for row in sales:
+            metrics = slot(row["_id"]["bucket"], row["_id"]["key"])
+            metrics["sales"] = row["sales"]
+            metrics["revenue"] = row["revenue"]
+
+        # Entries are not attributed to a seller
+        if group_by != "sold_by":
+            entries = await db["occupancy_counters"].aggregate([
+                {"$match": {"at": {"$gte": start, "$lt": end}}},
+                {"$group": {
+                    "_id": {
+                        "bucket": {"$dateTrunc": {"date": "$at", "unit": granularity}},
+                        "key": _group_key(group_by, "counters"),
+                    },
+                    "entries": {"$sum": {"$ifNull": ["$entered", 0]}},
+                }},
+            ]).to_list(None)
+            for row in entries:
+                slot(row["_id"]["bucket"], row["_id"]["key"])["entries"] = row["entries"]
+        return buckets
+
+    async def series(
+        self,
+        db,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        group_by: Optional[str] = None,
+        event_id: Optional[str] = None
+    ) -> List[dict]:
+        now = datetime.now()
+        step = GRANULARITIES[granularity]
+        settled_before = self.settled_before(now)
+        scope = event_scope(event_id)
+        cached = self._settled.setdefault(
+            (granularity, group_by, scope.get("event_id", ALL_EVENTS)), {}
+        )
+
+        starts = []
+        bucket = truncate(start, granularity)
+        while bucket < end:
+            starts.append(bucket)
+            bucket += step
+
+        # One aggregation covers every bucket that is unsettled or not cached yet
+        needed = [bucket for bucket in starts if bucket not in cached]
+        fresh: Dict[datetime, Dict[str, dict]] = {}
+        if needed:
+            fresh = await self._aggregate(
+                db, granularity, group_by, needed[0], needed[-1] + step, scope
+            )
+            if len(cached) > MAX_CACHED_BUCKETS:
+                cached.clear()
+            for bucket in needed:
+                if bucket + step <= settled_before:
+                    # Empty settled buckets are cached too
+                    cached[bucket] = fresh.get(bucket, {})
+
+        return [
+            {
+                "start": bucket,
+                "settled": bucket in cached,
+                "groups": cached[bucket] if bucket in cached else fresh.get(bucket, {}),
+            }
+            for bucket in starts
+        ]
+
+
+timeseries_service = TimeseriesService()
@@ -1,14 +1,66 @@
+from app.core.startup import startup_profile, warm_up
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import auth, passes, bookings, staff, admin, validation
 from app.db.mongodb import MongoDB
+from app.core.config import get_settings
+from app.services.cache_service import invalidation_bus
+from app.services.occupancy_service import occupancy_service
+from app.services.scan_guard import scan_guard
+from app.services.scan_log_service import scan_log
+from app.services.payment_reconciler import payment_reconciler
+from app.services.reminder_service import reminder_scheduler
+from app.services.lifecycle_service import lifecycle_scheduler
+from app.services.mass_cancel_service import mass_cancellation
+from app.core.request_context import RequestContextMiddleware
+from app.core.priority import PriorityLaneMiddleware, load_monitor
 from contextlib import asynccontextmanager
+import asyncio
+
+ROUTERS = [
+    ("auth", "/auth", "Authentication"),
+    ("passes", "/passes", "Passes"),
+    ("bookings", "/bookings", "Bookings"),
+    ("staff", "/staff", "Staff"),
+    ("admin", "/admin", "Admin"),
+    ("validation", "/validate", "Validation"),
+    ("occupancy", "/occupancy", "Occupancy"),
+    ("payments", "/payments", "Payments"),
+]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await MongoDB.connect_to_database()
+    with startup_profile.phase("connect_to_database"):
+        await MongoDB.connect_to_database()
     print("MongoDB connected")
+    await load_monitor.start()
+    with startup_profile.phase("invalidation_bus"):
+        await invalidation_bus.start(MongoDB.get_db())
+    with startup_profile.phase("occupancy"):
+        await occupancy_service.start(MongoDB.get_db())
+    await scan_guard.start()
+    await scan_log.start(MongoDB.get_db())
+    with startup_profile.phase("payment_reconciler"):
+        await payment_reconciler.start(MongoDB.get_db())
+    with startup_profile.phase("reminder_scheduler"):
+        await reminder_scheduler.start(MongoDB.get_db())
+    with startup_profile.phase("lifecycle_scheduler"):
+        await lifecycle_scheduler.start(MongoDB.get_db())
+    with startup_profile.phase("mass_cancellation"):
+        await mass_cancellation.start(MongoDB.get_db())
+    warm_up_task = asyncio.create_task(warm_up(startup_profile))
+    startup_profile.mark_ready()
+    print(f"Startup report: {startup_profile.report()}")
     yield
+    warm_up_task.cancel()
+    await mass_cancellation.stop()
+    await lifecycle_scheduler.stop()
+    await reminder_scheduler.stop()
+    await payment_reconciler.stop()
+    await scan_log.stop()
+    await scan_guard.stop()
+    await occupancy_service.stop()
+    await invalidation_bus.stop()
+    await load_monitor.stop()
     await MongoDB.close_database_connection()
     print("MongoDB disconnected")
 
@@ -20,6 +72,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Innermost of the three, but still ahead of routing: inside CORS so a
+# shed 503 carries the headers a browser needs to read its Retry-After
+app.add_middleware(PriorityLaneMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,13 +82,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestContextMiddleware)
 
-app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-app.include_router(passes.router, prefix="/passes", tags=["Passes"])
-app.include_router(bookings.router, prefix="/bookings", tags=["Bookings"])
-app.include_router(staff.router, prefix="/staff", tags=["Staff"])
-app.include_router(admin.router, prefix="/admin", tags=["Admin"])
-app.include_router(validation.router, prefix="/validate", tags=["Validation"])
+for name, prefix, tag in ROUTERS:
+    module = startup_profile.import_module(f"app.api.endpoints.{name}")
+    app.include_router(module.router, prefix=prefix, tags=[tag])
 
 @app.get("/")
 async def root():
@@ -47,4 +100,13 @@ async def root():
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    settings = get_settings()
+    # Workers are separate processes that each import main:app and run the
+    # lifespan hook, so Motor clients and caches are created per worker
+    uvicorn.run(
+        "main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.WORKERS,
+        timeout_graceful_shutdown=settings.GRACEFUL_SHUTDOWN_SECONDS,
+    )
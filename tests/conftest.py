@@ -0,0 +1,75 @@
+import configparser
+import os
+from pathlib import Path
+
+import motor.motor_asyncio
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+# Settings are read at import time; the tests never send mail
+for name in ("SMTP_USERNAME", "SMTP_PASSWORD", "FROM_EMAIL"):
+    os.environ.setdefault(name, "test")
+
+from app.db.mongodb import MongoDB  # noqa: E402
+
+
+def mongo_config():
+    parser = configparser.ConfigParser()
+    parser.read(Path(__file__).parent.parent / "pytest.ini")
+    return parser["mongodb"]["test_uri"], parser["mongodb"]["test_db"]
+
+
+def mongomock_async(mongomock_motor):
+    """
+    mongomock_motor with collections from with_options() kept awaitable
+    """
+    collection = mongomock_motor.AsyncMongoMockCollection
+
+    def with_options(self, **options):
+        wrapped = getattr(self, "_AsyncMongoMockCollection__collection")
+        return collection(self.database, wrapped.with_options(**options))
+
+    collection.with_options = with_options
+    return mongomock_motor
+
+
+@pytest.fixture
+async def db():
+    """
+    Empty database on the test MongoDB from pytest.ini, or an in-memory
+    mongomock one when no server is reachable
+    """
+    uri, name = mongo_config()
+    client = motor.motor_asyncio.AsyncIOMotorClient(uri, serverSelectionTimeoutMS=500)
+    try:
+        await client.admin.command("ping")
+    except ServerSelectionTimeoutError:
+        client.close()
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        yield mongomock_async(mongomock_motor).AsyncMongoMockClient()[name]
+        return
+    await client.drop_database(name)
+    yield client[name]
+    await client.drop_database(name)
+    client.close()
+
+
+@pytest.fixture
+def app_db(db, monkeypatch):
+    """
+    The test database, also behind MongoDB.get_db() for code that looks
+    its handle up itself
+    """
+    monkeypatch.setattr(MongoDB, "get_db", classmethod(lambda cls: db))
+    return db
+
+
+@pytest.fixture
+def server_db(db):
+    """
+    The test database, for tests using server features mongomock lacks
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    if isinstance(db, mongomock_motor.AsyncMongoMockDatabase):
+        pytest.skip("needs a MongoDB server")
+    return db
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import Response
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from app.api.endpoints import admin
+from app.core.config import get_settings
+from app.db import mongodb
+from app.db.mongodb import MIN_MAX_STALENESS_SECONDS, MongoDB
+
+settings = get_settings()
+
+REPORT_PATHS = {"/users", "/staff-sales", "/stats", "/stats/timeseries", "/group-bookings"}
+
+
+@pytest.fixture
+async def connected(monkeypatch):
+    async def no_indexes(db):
+        pass
+
+    monkeypatch.setattr(mongodb, "ensure_indexes", no_indexes)
+    for name in ("client", "db", "analytics_db", "pid"):
+        monkeypatch.setattr(MongoDB, name, None)
+    monkeypatch.setattr(MongoDB, "lane_clients", {})
+    monkeypatch.setattr(MongoDB, "lane_dbs", {})
+    # Motor connects lazily, so no server is needed to inspect the handles
+    await MongoDB.connect_to_database()
+    yield MongoDB
+    await MongoDB.close_database_connection()
+
+
+async def test_analytics_reads_prefer_secondaries(connected):
+    analytics_db = connected.get_analytics_db()
+    assert analytics_db.read_preference == SecondaryPreferred(
+        max_staleness=max(settings.ANALYTICS_MAX_STALENESS_SECONDS, MIN_MAX_STALENESS_SECONDS)
+    )
+    assert analytics_db.read_concern.level == "local"
+    # Gate validation and everything else stays on the primary
+    assert connected.db.read_preference == Primary()
+
+
+async def test_analytics_reads_use_their_own_pool(connected):
+    if "analytics" not in connected.lane_clients:
+        pytest.skip("no dedicated analytics pool configured")
+    assert connected.get_analytics_db().client is connected.lane_clients["analytics"]
+
+
+async def test_report_dependency_returns_analytics_db(connected):
+    response = Response()
+    assert admin.get_analytics_db(response) is connected.get_analytics_db()
+    assert response.headers["X-Read-Preference"] == "secondaryPreferred"
+    assert float(response.headers["X-Data-Staleness-Seconds"]) == 0.0
+
+
+def test_reports_read_from_analytics_db():
+    dependencies = {
+        route.path: {dependency.call for dependency in route.dependant.dependencies}
+        for route in admin.router.routes
+        if route.path in REPORT_PATHS and "GET" in route.methods
+    }
+    assert set(dependencies) == REPORT_PATHS
+    for path, calls in dependencies.items():
+        assert admin.get_analytics_db in calls, path
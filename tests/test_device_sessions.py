@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.api.endpoints.auth import get_current_user
+from app.core.config import get_settings
+from app.services.device_session_service import (
+    SESSIONS_COLLECTION, open_session, revoke_session, rotate_session
+)
+
+settings = get_settings()
+
+
+@pytest.fixture
+async def session(app_db):
+    user_id = ObjectId()
+    await app_db["users"].insert_one({
+        "_id": user_id,
+        "name": "Gate Staff",
+        "email": "gate@example.com",
+        "phone": "9800000000",
+        "role": "staff",
+        "password_hash": "x",
+    })
+    return await open_session(app_db, str(user_id), "scanner-1")
+
+
+async def revoked(db, tokens: dict) -> bool:
+    record = await db[SESSIONS_COLLECTION].find_one({"_id": ObjectId(tokens["session_id"])})
+    return record["revoked"]
+
+
+async def test_rotation_replaces_refresh_token(app_db, session):
+    rotated = await rotate_session(app_db, session["refresh_token"])
+    assert rotated["session_id"] == session["session_id"]
+    assert rotated["refresh_token"] != session["refresh_token"]
+    assert await rotate_session(app_db, rotated["refresh_token"]) is not None
+
+
+async def test_lost_response_can_be_retried_once(app_db, session):
+    await rotate_session(app_db, session["refresh_token"])
+    retried = await rotate_session(app_db, session["refresh_token"])
+    assert retried is not None
+    assert not await revoked(app_db, session)
+
+    # A second retry is reuse of a replaced token
+    assert await rotate_session(app_db, session["refresh_token"]) is None
+    assert await revoked(app_db, session)
+    assert await rotate_session(app_db, retried["refresh_token"]) is None
+
+
+async def test_superseded_token_revokes_session(app_db, session):
+    lost = await rotate_session(app_db, session["refresh_token"])
+    retried = await rotate_session(app_db, session["refresh_token"])
+
+    # The response that was lost turns up later: its token was replaced
+    assert await rotate_session(app_db, lost["refresh_token"]) is None
+    assert await revoked(app_db, session)
+    assert await rotate_session(app_db, retried["refresh_token"]) is None
+
+
+async def test_grace_runs_from_rotation_time(app_db, session):
+    await rotate_session(app_db, session["refresh_token"])
+    await app_db[SESSIONS_COLLECTION].update_one(
+        {"_id": ObjectId(session["session_id"])},
+        {"$set": {"last_refreshed_at": datetime.utcnow() - timedelta(
+            seconds=settings.DEVICE_REFRESH_GRACE_SECONDS + 1
+        )}}
+    )
+    assert await rotate_session(app_db, session["refresh_token"]) is None
+    assert await revoked(app_db, session)
+
+
+async def test_revoked_session_rejects_access_token(app_db, session):
+    user = await get_current_user(session["access_token"])
+    assert user.role == "staff"
+
+    assert await revoke_session(app_db, session["session_id"])
+    with pytest.raises(HTTPException) as rejected:
+        await get_current_user(session["access_token"])
+    assert rejected.value.status_code == 401
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from app.db.events import backfill_event_ids
+
+SEASON_2025 = (datetime(2025, 9, 1), datetime(2025, 11, 1))
+SEASON_2026 = (datetime(2026, 9, 1), datetime(2026, 11, 1))
+
+
+async def test_documents_are_tagged_by_date_range(db):
+    await db["passes"].insert_many([
+        {"_id": "pass-2025", "validity_start": datetime(2025, 9, 22)},
+        {"_id": "pass-2026", "validity_start": datetime(2026, 10, 11)},
+    ])
+    await db["bookings"].insert_many([
+        {"_id": "booking-2025", "pass_rules": {"validity_start": datetime(2025, 9, 22)},
+         "created_at": datetime(2025, 8, 1)},
+        # No rules copied yet: placed by when it was sold
+        {"_id": "booking-legacy", "created_at": datetime(2025, 10, 2)},
+        {"_id": "booking-tagged", "event_id": "other",
+         "pass_rules": {"validity_start": datetime(2025, 9, 22)}},
+    ])
+    await db["staff_sales"].insert_many([
+        {"_id": "sale-2025", "sale_time": datetime(2025, 10, 1)},
+        {"_id": "sale-2026", "sale_time": datetime(2026, 10, 12)},
+    ])
+
+    tagged = await backfill_event_ids(db, "navratri-2025", *SEASON_2025)
+    assert tagged == {
+        "passes": 1, "bookings": 2, "staff_sales": 1,
+        "bookings_archive": 0, "staff_sales_archive": 0,
+    }
+    await backfill_event_ids(db, "navratri-2026", *SEASON_2026)
+
+    events = {}
+    for collection in ("passes", "bookings", "staff_sales"):
+        async for document in db[collection].find():
+            events[document["_id"]] = document.get("event_id")
+    assert events == {
+        "pass-2025": "navratri-2025",
+        "pass-2026": "navratri-2026",
+        "booking-2025": "navratri-2025",
+        "booking-legacy": "navratri-2025",
+        "booking-tagged": "other",
+        "sale-2025": "navratri-2025",
+        "sale-2026": "navratri-2026",
+    }
@@ -0,0 +1,65 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.api.endpoints import validation
+from app.services.occupancy_service import occupancy_service
+from app.services.scan_guard import RecentScanGuard
+
+
+@pytest.fixture
+def venue(app_db, monkeypatch):
+    monkeypatch.setattr(
+        validation, "scan_guard", RecentScanGuard(window_seconds=60, max_size=100, share_seconds=1)
+    )
+    monkeypatch.setattr(occupancy_service, "capacity", 10)
+    monkeypatch.setattr(occupancy_service, "estimated_total", lambda: 7)
+    return app_db
+
+
+async def group_booking(db, waiting: int, entered: int = 0) -> str:
+    booking_id = ObjectId()
+    await db["bookings"].insert_one({
+        "_id": booking_id,
+        "status": "active",
+        "is_group": True,
+        "pass_rules": {"type": "group"},
+        "group_members": [
+            {"name": f"member {index}", "phone": "9800000000", "entry_status": index < entered}
+            for index in range(entered + waiting)
+        ],
+    })
+    return str(booking_id)
+
+
+async def test_admit_all_checks_capacity_for_every_waiting_member(venue):
+    booking_id = await group_booking(venue, waiting=4)
+
+    with pytest.raises(HTTPException) as rejected:
+        await validation._admit_group(booking_id)
+    assert rejected.value.status_code == 409
+    booking = await venue["bookings"].find_one({"_id": ObjectId(booking_id)})
+    assert not any(member["entry_status"] for member in booking["group_members"])
+
+
+async def test_admit_all_counts_only_members_still_outside(venue, monkeypatch):
+    booking_id = await group_booking(venue, waiting=3, entered=3)
+    admitted = []
+
+    async def admit_group(db, booking_id, now, count=None, indexes=None):
+        before = await db["bookings"].find_one({"_id": ObjectId(booking_id)})
+        admitted.append((count, indexes))
+        return before, [3, 4, 5]
+
+    monkeypatch.setattr(validation, "admit_group", admit_group)
+    result, _ = await validation._admit_group(booking_id)
+    assert admitted == [(None, None)]
+    assert result["all_entered"]
+
+
+async def test_count_is_checked_against_capacity(venue):
+    booking_id = await group_booking(venue, waiting=5)
+
+    with pytest.raises(HTTPException) as rejected:
+        await validation._admit_group(booking_id, count=4)
+    assert rejected.value.status_code == 409
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.idempotency_service import COMPLETED, IN_PROGRESS, IdempotencyService
+
+KEY = "sell:staff-1:key-1"
+
+
+def worker(**options) -> IdempotencyService:
+    """
+    One worker's service; workers share the database but not their caches
+    """
+    return IdempotencyService(
+        **{"ttl_seconds": 3600, "cache_size": 100, "wait_seconds": 0.2, "claim_seconds": 30, **options}
+    )
+
+
+class Handler:
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("handler failed")
+        return {"booking": self.calls}
+
+
+async def sell(service, handler, payload=None):
+    return await service.run("sell", "staff-1", "key-1", payload or {"pass_id": "p1"}, handler)
+
+
+async def test_retry_replays_stored_response(app_db):
+    handler = Handler()
+    first = worker()
+    assert await sell(first, handler) == {"booking": 1}
+
+    for service in (first, worker()):
+        replayed = await sell(service, handler)
+        assert replayed.status_code == 200
+        assert replayed.body == b'{"booking":1}'
+        assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert handler.calls == 1
+
+
+async def test_key_reused_with_different_body_is_rejected(app_db):
+    await sell(worker(), Handler())
+
+    for service in (worker(), worker()):
+        with pytest.raises(HTTPException) as rejected:
+            await sell(service, Handler(), {"pass_id": "p2"})
+        assert rejected.value.status_code == 422
+
+
+async def test_concurrent_duplicates_run_once(app_db):
+    handler = Handler(delay=0.05)
+    service = worker()
+    results = await asyncio.gather(*[sell(service, handler) for _ in range(5)])
+    assert handler.calls == 1
+    assert results[0] == {"booking": 1}
+
+
+async def test_failed_request_releases_key(app_db):
+    service = worker()
+    with pytest.raises(RuntimeError):
+        await sell(service, Handler(fail=True))
+    assert await app_db["idempotency_keys"].count_documents({}) == 0
+
+    assert await sell(service, Handler()) == {"booking": 1}
+
+
+async def test_retry_takes_over_claim_of_dead_worker(app_db):
+    stale = datetime.utcnow() - timedelta(seconds=60)
+    service = worker()
+    await app_db["idempotency_keys"].insert_one({
+        "_id": KEY,
+        "status": IN_PROGRESS,
+        "fingerprint": service.fingerprint({"pass_id": "p1"}),
+        "claim": "dead-worker",
+        "created_at": stale,
+        "claimed_at": stale,
+    })
+
+    assert await sell(service, Handler()) == {"booking": 1}
+    record = await app_db["idempotency_keys"].find_one({"_id": KEY})
+    assert record["status"] == COMPLETED
+    assert record["claim"] != "dead-worker"
+
+    # The dead worker cannot overwrite the response if it comes back
+    await app_db["idempotency_keys"].update_one(
+        {"_id": KEY, "claim": "dead-worker"}, {"$set": {"response": {"booking": 99}}}
+    )
+    replayed = await sell(worker(), Handler())
+    assert replayed.body == b'{"booking":1}'
+
+
+async def test_live_claim_is_not_taken_over(app_db):
+    service = worker()
+    now = datetime.utcnow()
+    await app_db["idempotency_keys"].insert_one({
+        "_id": KEY,
+        "status": IN_PROGRESS,
+        "fingerprint": service.fingerprint({"pass_id": "p1"}),
+        "claim": "busy-worker",
+        "created_at": now,
+        "claimed_at": now,
+    })
+    handler = Handler()
+
+    with pytest.raises(HTTPException) as busy:
+        await sell(service, handler)
+    assert busy.value.status_code == 409
+    assert handler.calls == 0
+
+
+async def test_heartbeat_keeps_long_request_claimed(app_db):
+    slow = Handler(delay=0.6)
+    running = asyncio.create_task(sell(worker(claim_seconds=0.3), slow))
+    # Past claim_seconds since the claim; only the heartbeat keeps it fresh
+    await asyncio.sleep(0.45)
+
+    retry = Handler()
+    with pytest.raises(HTTPException) as busy:
+        await sell(worker(claim_seconds=0.3, wait_seconds=0.05), retry)
+    assert busy.value.status_code == 409
+    assert retry.calls == 0
+
+    assert await running == {"booking": 1}
+    record = await app_db["idempotency_keys"].find_one({"_id": KEY})
+    assert record["claimed_at"] > record["created_at"]
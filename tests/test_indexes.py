@@ -0,0 +1,30 @@
+import pytest
+
+from app.db import indexes
+from app.db.indexes import already_taken, ensure_unique
+
+
+@pytest.fixture(autouse=True)
+def fallbacks(monkeypatch):
+    monkeypatch.setattr(indexes, "UNIQUE_FALLBACKS", set())
+
+
+async def test_unique_index_enforces_uniqueness(db):
+    await db["users"].insert_one({"email": "a@example.com"})
+
+    assert await ensure_unique(db, "users", "email")
+    # The index rejects duplicates, so no explicit check is made
+    assert not await already_taken(db, "users", "email", "a@example.com")
+
+
+async def test_duplicates_fall_back_to_explicit_check(db):
+    await db["users"].insert_many([{"email": "a@example.com"}, {"email": "a@example.com"}])
+
+    assert not await ensure_unique(db, "users", "email")
+    assert await already_taken(db, "users", "email", "a@example.com")
+    assert not await already_taken(db, "users", "email", "b@example.com")
+
+    # Once the duplicates are cleaned up the next start builds the index
+    await db["users"].delete_one({"email": "a@example.com"})
+    assert await ensure_unique(db, "users", "email")
+    assert not await already_taken(db, "users", "email", "a@example.com")
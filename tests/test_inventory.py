@@ -0,0 +1,42 @@
+from bson import ObjectId
+
+from app.core.etag import document_etag
+from app.services.booking_service import release_inventory, reserve_inventory
+from app.services.cache_service import catalog_cache, get_cached_pass, pass_cache
+
+
+async def limited_pass(db, quantity: int) -> dict:
+    pass_ = {"_id": ObjectId(), "available_quantity": quantity, "revision": 1}
+    await db["passes"].insert_one(pass_)
+    return pass_
+
+
+async def test_reserve_refreshes_cached_pass_and_catalog(db):
+    pass_ = await limited_pass(db, 2)
+    cached = await get_cached_pass(db, str(pass_["_id"]))
+    catalog_cache.set("active:test", ("etag", [cached]))
+
+    assert await reserve_inventory(db, pass_)
+    assert catalog_cache.get("active:test") is None
+    fresh = await get_cached_pass(db, str(pass_["_id"]))
+    assert fresh["available_quantity"] == 1
+    assert document_etag(fresh) != document_etag(cached)
+
+
+async def test_release_refreshes_cached_pass(db):
+    pass_ = await limited_pass(db, 0)
+    await get_cached_pass(db, str(pass_["_id"]))
+
+    assert not await reserve_inventory(db, pass_)
+    await release_inventory(db, {str(pass_["_id"]): 2})
+    assert pass_cache.get(str(pass_["_id"])) is None
+    assert (await get_cached_pass(db, str(pass_["_id"])))["available_quantity"] == 2
+
+
+async def test_unlimited_passes_are_not_touched(db):
+    pass_ = {"_id": ObjectId(), "available_quantity": None, "revision": 1}
+    await db["passes"].insert_one(pass_)
+    await get_cached_pass(db, str(pass_["_id"]))
+
+    assert await reserve_inventory(db, pass_)
+    assert pass_cache.get(str(pass_["_id"])) is not None
@@ -0,0 +1,131 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import mass_cancel_service
+from app.services.mass_cancel_service import JOBS_COLLECTION, MassCancellation
+from app.services.payment_service import REFUND_CLAIM_SECONDS, REFUNDS_COLLECTION, payment_service
+
+BOOKINGS = 25
+SELECTOR = {"pass_id": "pass-1", "night": None, "statuses": ["active"], "reason": "rain"}
+
+
+class Gateway:
+    """
+    Counts refunds actually paid out per idempotency key; the call numbered
+    crash_on dies before paying, like a worker killed mid-request
+    """
+
+    def __init__(self, crash_on: int = 0):
+        self.crash_on = crash_on
+        self.calls = 0
+        self.paid = Counter()
+
+    async def refund(self, payment_id, amount, idempotency_key):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0)
+        if call == self.crash_on:
+            raise ConnectionError("worker stopped")
+        self.paid[idempotency_key] += 1
+        return {
+            "refund_id": f"REF_{idempotency_key}",
+            "payment_id": payment_id,
+            "amount": amount,
+            "status": "processed",
+        }
+
+
+class Notifier:
+    def __init__(self):
+        self.sent = Counter()
+
+    async def send_cancellation_notice(self, email, details):
+        self.sent[email] += 1
+        return True
+
+
+def worker(db) -> MassCancellation:
+    service = MassCancellation(chunk_size=10, refund_concurrency=4, max_attempts=3, lease_seconds=30)
+    service.db = db
+    service._notifier = Notifier()
+    return service
+
+
+@pytest.fixture
+async def bookings(app_db, monkeypatch):
+    monkeypatch.setattr(mass_cancel_service, "REFUND_BACKOFF_SECONDS", 0)
+    created_at = datetime.now() - timedelta(hours=1)
+    users = [{"_id": ObjectId(), "email": f"user{index}@example.com"} for index in range(BOOKINGS)]
+    await app_db["users"].insert_many(users)
+    await app_db["bookings"].insert_many([
+        {
+            "_id": ObjectId(),
+            "user_id": str(user["_id"]),
+            "pass_id": "pass-1",
+            "status": "active",
+            "payment_status": "paid",
+            "payment_id": f"pay_{index}",
+            "amount_paid": 500.0,
+            "created_at": created_at,
+        }
+        for index, user in enumerate(users)
+    ])
+    return app_db
+
+
+async def run_job(service: MassCancellation, job_id=None) -> ObjectId:
+    if job_id is None:
+        job_id = await service.create(SELECTOR, "admin-1")
+    else:
+        service._launch(job_id)
+    await service._running[job_id]
+    return job_id
+
+
+async def test_job_cancels_refunds_and_notifies_once(bookings, monkeypatch):
+    gateway = Gateway()
+    monkeypatch.setattr(payment_service, "_refund", gateway.refund)
+    service = worker(bookings)
+
+    job_id = await run_job(service)
+    job = await bookings[JOBS_COLLECTION].find_one({"_id": job_id})
+    assert job["status"] == "completed"
+    assert (job["cancelled"], job["refunded"], job["notified"]) == (BOOKINGS, BOOKINGS, BOOKINGS)
+    assert len(gateway.paid) == BOOKINGS
+    assert set(service._notifier.sent.values()) == {1}
+
+
+async def test_resumed_job_neither_double_refunds_nor_skips(bookings, monkeypatch):
+    gateway = Gateway(crash_on=7)
+    monkeypatch.setattr(payment_service, "_refund", gateway.refund)
+
+    job_id = await run_job(worker(bookings))
+    # Refunds of the interrupted chunk still in flight settle
+    await asyncio.sleep(0.1)
+    job = await bookings[JOBS_COLLECTION].find_one({"_id": job_id})
+    assert job["status"] == "running" and job["heartbeat_at"] is None
+    paid_before = sum(gateway.paid.values())
+    assert 0 < paid_before < BOOKINGS
+
+    # The crashed refund's claim is left to expire, as after a dead worker
+    await bookings[REFUNDS_COLLECTION].update_many(
+        {"status": "processing"},
+        {"$set": {"claimed_at": datetime.now() - timedelta(seconds=REFUND_CLAIM_SECONDS + 1)}}
+    )
+    resumed = worker(bookings)
+    await run_job(resumed, job_id)
+
+    job = await bookings[JOBS_COLLECTION].find_one({"_id": job_id})
+    assert job["status"] == "completed"
+    assert job["refunds_failed"] == 0
+    assert len(gateway.paid) == BOOKINGS
+    assert set(gateway.paid.values()) == {1}
+    refunded = await bookings["bookings"].count_documents(
+        {"cancel_job": job_id, "status": "cancelled", "refund_status": "processed"}
+    )
+    assert refunded == BOOKINGS
+    assert sum(resumed._notifier.sent.values()) == BOOKINGS
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.services.booking_service import backfill_pass_rules
+
+VALIDITY = (datetime(2026, 10, 11), datetime(2026, 10, 21))
+
+
+async def seasonal_pass(db) -> str:
+    pass_id = ObjectId()
+    await db["passes"].insert_one({
+        "_id": pass_id, "type": "seasonal", "max_entries": 10,
+        "validity_start": VALIDITY[0], "validity_end": VALIDITY[1],
+    })
+    return str(pass_id)
+
+
+async def booking(db, pass_id: str, **fields) -> ObjectId:
+    booking_id = ObjectId()
+    await db["bookings"].insert_one({
+        "_id": booking_id, "pass_id": pass_id, "status": "active", "is_group": False, **fields
+    })
+    return booking_id
+
+
+async def test_legacy_bookings_get_full_rules(db):
+    pass_id = await seasonal_pass(db)
+    legacy = await booking(db, pass_id)
+    # A pass edit used to leave a partial copy behind
+    partial = await booking(db, pass_id, pass_rules={"max_entries": 10})
+    current = await booking(db, pass_id, pass_rules={"type": "seasonal", "max_entries": 3})
+
+    assert (await backfill_pass_rules(db))["bookings"] == 2
+    rules = {
+        document["_id"]: document["pass_rules"]
+        async for document in db["bookings"].find()
+    }
+    expected = {
+        "type": "seasonal", "max_entries": 10,
+        "validity_start": VALIDITY[0], "validity_end": VALIDITY[1],
+    }
+    assert rules[legacy] == rules[partial] == expected
+    assert rules[current]["max_entries"] == 3
+
+    assert (await backfill_pass_rules(db))["bookings"] == 0
+
+
+async def test_seasonal_bookings_used_up_by_one_entry_are_reopened(db):
+    pass_id = await seasonal_pass(db)
+    uncounted = await booking(db, pass_id, status="used")
+    counted = await booking(db, pass_id, status="used", entries_used=1)
+    cancelled = await booking(db, pass_id, status="cancelled")
+
+    assert (await backfill_pass_rules(db))["reopened"] == 2
+    bookings = {document["_id"]: document async for document in db["bookings"].find()}
+    assert (bookings[uncounted]["status"], bookings[uncounted]["entries_used"]) == ("active", 1)
+    assert (bookings[counted]["status"], bookings[counted]["entries_used"]) == ("active", 1)
+    assert bookings[cancelled]["status"] == "cancelled"
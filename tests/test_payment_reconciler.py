@@ -0,0 +1,138 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from app.core.config import get_settings
+from app.services.payment_reconciler import EVENTS_COLLECTION, PaymentReconciler
+from app.services.payment_service import LocalGateway, get_gateway, sign_webhook
+
+settings = get_settings()
+
+
+@pytest.fixture
+async def reconciler(app_db):
+    await app_db[EVENTS_COLLECTION].create_index(
+        [("event_id", ASCENDING)], unique=True, sparse=True
+    )
+    reconciler = PaymentReconciler(
+        batch_size=100, interval=1, sweep_interval=60, gateway=LocalGateway()
+    )
+    reconciler.db = app_db
+    return reconciler
+
+
+async def pending_booking(db, minutes_old: int = 0, **fields) -> ObjectId:
+    _id = ObjectId()
+    await db["bookings"].insert_one({
+        "_id": _id,
+        "status": "active",
+        "payment_status": "pending",
+        "amount_paid": 500.0,
+        "created_at": datetime.now() - timedelta(minutes=minutes_old),
+        **fields,
+    })
+    return _id
+
+
+async def deliver(reconciler, delivery) -> dict:
+    await reconciler.ingest(reconciler.db, *delivery)
+    return await reconciler.reconcile_once()
+
+
+def test_local_gateway_stays_out_of_default_wiring():
+    assert get_gateway("") is None
+    assert isinstance(get_gateway("local"), LocalGateway)
+    with pytest.raises(ValueError):
+        get_gateway("unknown")
+
+
+async def test_webhook_capture_marks_booking_paid(reconciler):
+    booking_id = await pending_booking(reconciler.db)
+    payment = reconciler.gateway.pay(str(booking_id), 500.0)
+
+    assert await deliver(reconciler, reconciler.gateway.webhook(payment)) == {
+        "processed": 1, "rejected": 0, "ignored": 0
+    }
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert booking["payment_status"] == "paid"
+    assert booking["payment_id"] == payment["id"]
+
+
+async def test_duplicate_delivery_is_stored_and_applied_once(reconciler):
+    booking_id = await pending_booking(reconciler.db)
+    delivery = reconciler.gateway.webhook(reconciler.gateway.pay(str(booking_id), 500.0))
+
+    await reconciler.ingest(reconciler.db, *delivery)
+    await reconciler.ingest(reconciler.db, *delivery)
+    assert await reconciler.db[EVENTS_COLLECTION].count_documents({}) == 1
+
+    assert (await reconciler.reconcile_once())["processed"] == 1
+    assert await reconciler.reconcile_once() == {}
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert booking["revision"] == 1
+
+
+async def test_forged_webhook_is_rejected(reconciler):
+    booking_id = await pending_booking(reconciler.db)
+    payment = dict(reconciler.gateway.pay(str(booking_id), 500.0))
+    body = json.dumps({"payload": {"payment": {"entity": payment}}}).encode()
+
+    counts = await deliver(reconciler, (body, sign_webhook(body, "wrong-secret"), None))
+    assert counts["rejected"] == 1
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert booking["payment_status"] == "pending"
+
+
+async def test_failure_after_capture_does_not_undo_it(reconciler):
+    booking_id = await pending_booking(reconciler.db)
+    captured = reconciler.gateway.webhook(reconciler.gateway.pay(str(booking_id), 500.0))
+    failed = reconciler.gateway.webhook(
+        reconciler.gateway.pay(str(booking_id), 500.0, captured=False)
+    )
+
+    await deliver(reconciler, captured)
+    await deliver(reconciler, failed)
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert booking["payment_status"] == "paid"
+
+
+async def test_sweep_recovers_lost_webhook(reconciler):
+    stale = settings.PAYMENT_STALE_MINUTES + 1
+    lost = await pending_booking(reconciler.db, minutes_old=stale)
+    unknown = await pending_booking(reconciler.db, minutes_old=stale)
+    recent = await pending_booking(reconciler.db)
+    reconciler.gateway.pay(str(lost), 500.0)
+    reconciler.gateway.pay(str(recent), 500.0)
+
+    assert await reconciler.sweep_once() == 1
+    statuses = {
+        booking["_id"]: booking["payment_status"]
+        for booking in await reconciler.db["bookings"].find().to_list(None)
+    }
+    assert statuses == {lost: "paid", unknown: "pending", recent: "pending"}
+
+
+async def test_sweep_is_skipped_without_gateway(reconciler):
+    reconciler.gateway = None
+    await pending_booking(reconciler.db, minutes_old=settings.PAYMENT_STALE_MINUTES + 1)
+    assert await reconciler.sweep_once() == 0
+
+
+async def test_capture_after_cancellation_is_refunded(reconciler):
+    booking_id = await pending_booking(
+        reconciler.db, status="cancelled", payment_status="failed"
+    )
+    payment = reconciler.gateway.pay(str(booking_id), 500.0)
+
+    await deliver(reconciler, reconciler.gateway.webhook(payment))
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert (booking["status"], booking["payment_status"]) == ("cancelled", "paid")
+    assert booking["refund_status"] == "pending"
+
+    assert await reconciler.refund_late_captures() == 1
+    assert await reconciler.refund_late_captures() == 0
+    booking = await reconciler.db["bookings"].find_one({"_id": booking_id})
+    assert booking["refund_status"] == "processed"
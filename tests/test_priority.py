@@ -0,0 +1,118 @@
+import httpx
+import pytest
+
+from app.core import priority
+from app.core.config import get_settings
+from app.core.priority import (
+    LANE_CONCURRENCY, SHED_AT, DecayingPeak, LoadMonitor, PriorityLaneMiddleware, classify
+)
+from app.core.request_context import current_lane
+
+settings = get_settings()
+
+
+def overloaded(monitor: LoadMonitor, pressure: float) -> LoadMonitor:
+    monitor.loop_lag_ms.observe(pressure * settings.LOOP_LAG_THRESHOLD_MS)
+    return monitor
+
+
+@pytest.mark.parametrize("path, lane", [
+    ("/validate/validate-qr", "gate"),
+    ("/auth/device/refresh", "gate"),
+    ("/auth/device/login", "staff"),
+    ("/auth/device/sessions", "staff"),
+    ("/auth/login", "customer"),
+    ("/staff/sell", "staff"),
+    ("/occupancy/stream", "staff"),
+    ("/admin/stats", "analytics"),
+    ("/bookings", "customer"),
+    ("/", "customer"),
+])
+def test_classify(path, lane):
+    assert classify(path) == lane
+
+
+def test_lanes_shed_by_priority_under_pressure():
+    monitor = overloaded(LoadMonitor(), SHED_AT["customer"] + 0.5)
+    assert monitor.admit("gate")
+    assert monitor.admit("staff")
+    assert not monitor.admit("customer")
+    assert not monitor.admit("analytics")
+    assert monitor.shed == {"gate": 0, "staff": 0, "customer": 1, "analytics": 1}
+
+
+def test_gate_is_never_shed():
+    monitor = overloaded(LoadMonitor(), 100.0)
+    assert monitor.admit("gate")
+
+
+def test_lane_concurrency_limit():
+    monitor = LoadMonitor()
+    limit = LANE_CONCURRENCY["analytics"]
+    assert all(monitor.admit("analytics") for _ in range(limit))
+    assert not monitor.admit("analytics")
+    monitor.release("analytics")
+    assert monitor.admit("analytics")
+
+
+def test_streams_take_no_concurrency_slot():
+    monitor = LoadMonitor()
+    monitor.in_flight["staff"] = LANE_CONCURRENCY["staff"]
+    assert monitor.admit("staff", streaming=True)
+    assert monitor.streams["staff"] == 1
+    monitor.release("staff", streaming=True)
+    assert monitor.streams["staff"] == 0
+
+    # but are still shed with their lane
+    overloaded(monitor, SHED_AT["staff"] + 0.5)
+    assert not monitor.admit("staff", streaming=True)
+
+
+async def call(app, path: str) -> list:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "path": path, "method": "GET", "headers": []}, receive, send)
+    return sent
+
+
+async def test_shed_request_gets_503_with_retry_after():
+    async def app(scope, receive, send):
+        raise AssertionError("shed request reached the app")
+
+    middleware = PriorityLaneMiddleware(app, overloaded(LoadMonitor(), 10.0))
+    start = (await call(middleware, "/admin/stats"))[0]
+    assert start["status"] == 503
+    assert (b"retry-after", str(settings.SHED_RETRY_AFTER_SECONDS).encode()) in start["headers"]
+
+
+async def test_admitted_request_runs_in_its_lane():
+    lanes = []
+
+    async def app(scope, receive, send):
+        lanes.append(current_lane.get())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    monitor = LoadMonitor()
+    middleware = PriorityLaneMiddleware(app, monitor)
+    assert (await call(middleware, "/staff/sell"))[0]["status"] == 200
+    assert lanes == ["staff"]
+    assert monitor.in_flight["staff"] == 0
+
+
+async def test_shed_response_carries_cors_headers(monkeypatch):
+    from main import app
+
+    monkeypatch.setattr(priority.load_monitor, "loop_lag_ms", DecayingPeak())
+    overloaded(priority.load_monitor, 10.0)
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/admin/stats", headers={"Origin": "http://example.com"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(settings.SHED_RETRY_AFTER_SECONDS)
+    assert "access-control-allow-origin" in response.headers
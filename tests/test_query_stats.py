@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from app.db import query_stats as query_stats_module
+from app.db.query_stats import QueryStatsListener
+
+
+def run(listener: QueryStatsListener, request_id: int, collection: str, duration_ms: float):
+    command = {"find": collection, "filter": {"_id": 1}}
+    listener.started(SimpleNamespace(command_name="find", command=command, request_id=request_id))
+    listener.succeeded(SimpleNamespace(request_id=request_id, duration_micros=duration_ms * 1000))
+
+
+def test_shapes_are_aggregated():
+    listener = QueryStatsListener(slow_threshold_ms=100)
+    run(listener, 1, "bookings", 5)
+    run(listener, 2, "bookings", 15)
+
+    [stats] = listener.top_shapes()
+    assert (stats.collection, stats.count, stats.max_ms) == ("bookings", 2, 15)
+    assert listener.slow_queries() == []
+
+
+def test_slow_queries_are_logged_past_shape_limit(monkeypatch):
+    monkeypatch.setattr(query_stats_module, "MAX_SHAPES", 1)
+    listener = QueryStatsListener(slow_threshold_ms=100)
+    run(listener, 1, "bookings", 5)
+    run(listener, 2, "passes", 250)
+
+    assert [stats.collection for stats in listener.top_shapes()] == ["bookings"]
+    [slow] = listener.slow_queries()
+    assert (slow["collection"], slow["duration_ms"]) == ("passes", 250)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services.sales_summary_service import (
+    RECONCILE_GRACE_SECONDS, SUMMARY_COLLECTION, get_staff_daily, reconcile, record_sale
+)
+
+
+async def staff_sale(db, minutes_old: float = 0, **fields) -> dict:
+    sale = {
+        "_id": ObjectId(),
+        "staff_id": "staff-1",
+        "sale_time": datetime.now() - timedelta(minutes=minutes_old),
+        "gross_amount": 500.0,
+        "amount_paid": 400.0,
+        "summarized": False,
+        **fields,
+    }
+    await db["staff_sales"].insert_one(sale)
+    return sale
+
+
+async def record(db, sale: dict):
+    await record_sale(
+        db, sale["_id"], sale["staff_id"], sale["sale_time"],
+        gross=sale["gross_amount"], net=sale["amount_paid"]
+    )
+
+
+async def test_sale_is_counted_once(db):
+    sale = await staff_sale(db)
+    await record(db, sale)
+    await record(db, sale)
+
+    [row] = await get_staff_daily(db, "staff-1")
+    assert (row["count"], row["gross"], row["discount"], row["net"]) == (1, 500.0, 100.0, 400.0)
+    assert "sales" not in row
+    assert (await db["staff_sales"].find_one({"_id": sale["_id"]}))["summarized"]
+
+
+async def test_reconcile_folds_in_missed_sales(db):
+    grace_minutes = RECONCILE_GRACE_SECONDS / 60
+    counted = await staff_sale(db, minutes_old=grace_minutes + 5)
+    await record(db, counted)
+    # Stored, but the request stopped before the summary update
+    missed = await staff_sale(db, minutes_old=grace_minutes + 1)
+    # Possibly still in flight
+    await staff_sale(db)
+
+    assert await reconcile(db, batch_size=1) == 1
+    assert await reconcile(db, batch_size=1) == 0
+    rows = await db[SUMMARY_COLLECTION].find().to_list(None)
+    assert sum(row["count"] for row in rows) == 2
+    assert {sale for row in rows for sale in row["sales"]} == {counted["_id"], missed["_id"]}
+
+
+async def test_reconcile_marks_sales_already_counted(db):
+    sale = await staff_sale(db, minutes_old=RECONCILE_GRACE_SECONDS / 60 + 1)
+    await record(db, sale)
+    # Summary updated, but the sale was never marked
+    await db["staff_sales"].update_one({"_id": sale["_id"]}, {"$set": {"summarized": False}})
+
+    assert await reconcile(db, batch_size=10) == 1
+    [row] = await get_staff_daily(db, "staff-1")
+    assert row["count"] == 1
@@ -0,0 +1,70 @@
+import pytest
+from bson import ObjectId
+
+from app.api.endpoints import validation
+from app.db.mongodb import MongoDB
+from app.services import scan_guard as scan_guard_module
+from app.services.cache_service import invalidation_bus
+from app.services.scan_guard import BUS_NAMESPACE, RecentScanGuard
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    guard = RecentScanGuard(window_seconds=60, max_size=100, share_seconds=1)
+    monkeypatch.setattr(validation, "scan_guard", guard)
+    return guard
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scan_guard_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def no_database():
+    raise AssertionError("guarded scan reached the database")
+
+
+async def test_rescan_of_used_pass_makes_no_database_call(guard, app_db, monkeypatch):
+    booking_id = ObjectId()
+    await app_db["bookings"].insert_one({"_id": booking_id, "status": "used", "is_group": False})
+
+    response, _ = await validation._validate_qr_code(str(booking_id))
+    assert response == {"valid": False, "message": "Pass is used"}
+
+    monkeypatch.setattr(MongoDB, "get_db", classmethod(lambda cls: no_database()))
+    response, _ = await validation._validate_qr_code(str(booking_id))
+    assert response == {"valid": False, "message": "Pass is used"}
+    assert guard.stats()["hits"] == 1
+
+
+def test_entries_expire_after_window(guard, clock):
+    guard.consume("qr", "Pass is used")
+    clock[0] += guard.window_seconds - 1
+    assert guard.check("qr") == "Pass is used"
+
+    clock[0] += 2
+    assert guard.check("qr") is None
+    assert guard.stats()["entries"] == 0
+
+
+def test_size_bound_evicts_oldest(guard):
+    guard.max_size = 2
+    for qr_code in ("a", "b", "c"):
+        guard.consume(qr_code, "Pass is used")
+    assert guard.check("a") is None
+    assert guard.check("c") == "Pass is used"
+
+
+def test_entries_from_other_workers_are_stored(guard, monkeypatch):
+    monkeypatch.setitem(invalidation_bus._handlers, BUS_NAMESPACE, guard._receive)
+
+    invalidation_bus._apply({
+        "namespace": BUS_NAMESPACE,
+        "payload": {"qr": "Pass is cancelled"},
+        "origin": "another-worker",
+    })
+    assert guard.check("qr") == "Pass is cancelled"
+    # Received entries are not shared back out
+    assert guard._outbox == {}
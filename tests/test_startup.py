@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+
+from app.core.config import get_settings
+from app.core.startup import WARM_UP_MODULES, StartupProfile, measure_cold_import, warm_up
+
+settings = get_settings()
+
+COLD_IMPORT_RUNS = 3
+
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    # The cold import runs `import main` in a fresh interpreter from here
+    monkeypatch.chdir(Path(__file__).parent.parent)
+
+
+def test_cold_import_stays_within_budget(repo_root):
+    results = [measure_cold_import() for _ in range(COLD_IMPORT_RUNS)]
+    timings = sorted(result["ms"] for result in results)
+    assert timings[len(timings) // 2] <= settings.STARTUP_BUDGET_MS
+    assert not {name for result in results for name in result["eager"]}
+
+
+def test_phases_are_timed():
+    profile = StartupProfile()
+    with profile.phase("connect"):
+        pass
+    profile.mark_ready()
+
+    report = profile.report()
+    assert set(report["phases_ms"]) == {"connect"}
+    assert report["ready_ms"] is not None
+    assert report["budget_ms"] == settings.STARTUP_BUDGET_MS
+
+
+async def test_warm_up_loads_heavy_modules():
+    profile = StartupProfile()
+    await warm_up(profile)
+    assert "warm_up" in profile.phases
+    assert profile.report()["heavy_modules_loaded"] == list(WARM_UP_MODULES)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services.cache_service import invalidation_bus
+from app.services.timeseries_service import BUS_NAMESPACE, TimeseriesService
+
+SOLD_AT = datetime(2025, 10, 1, 20, 30)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # Keep the module singleton subscribed to the bus
+    monkeypatch.setitem(invalidation_bus._handlers, BUS_NAMESPACE, None)
+    return TimeseriesService()
+
+
+async def sale(db, **fields) -> ObjectId:
+    booking_id = ObjectId()
+    await db["bookings"].insert_one({
+        "_id": booking_id,
+        "event_id": "navratri-2026",
+        "payment_status": "paid",
+        "status": "active",
+        "amount_paid": 500.0,
+        "created_at": SOLD_AT,
+        **fields,
+    })
+    return booking_id
+
+
+async def daily_sales(service, db) -> dict:
+    [bucket] = await service.series(
+        db, "day", SOLD_AT.replace(hour=0, minute=0), SOLD_AT + timedelta(hours=1),
+        event_id="navratri-2026"
+    )
+    return bucket["groups"].get("all", {"sales": 0, "revenue": 0.0})
+
+
+async def test_cancelled_bookings_are_not_sales(service, server_db):
+    await sale(server_db)
+    await sale(server_db, status="cancelled", refund_status="processed")
+
+    assert (await daily_sales(service, server_db))["sales"] == 1
+
+
+async def test_cancellation_drops_settled_bucket(service, server_db):
+    booking_id = await sale(server_db)
+    assert (await daily_sales(service, server_db))["sales"] == 1
+
+    await server_db["bookings"].update_one({"_id": booking_id}, {"$set": {"status": "cancelled"}})
+    assert (await daily_sales(service, server_db))["sales"] == 1
+    await service.invalidate(SOLD_AT)
+    assert (await daily_sales(service, server_db))["sales"] == 0
+
+
+def test_invalidate_drops_only_matching_buckets(service):
+    day = SOLD_AT.replace(hour=0, minute=0)
+    hour = SOLD_AT.replace(minute=0)
+    other = day - timedelta(days=2)
+    service._settled = {
+        ("day", None, "navratri-2026"): {day: {}, other: {}},
+        ("hour", None, "navratri-2026"): {hour: {}},
+    }
+    service._drop({"at": SOLD_AT})
+    assert service._settled == {
+        ("day", None, "navratri-2026"): {other: {}},
+        ("hour", None, "navratri-2026"): {},
+    }
+    service._drop(None)
+    assert service._settled == {}
+
+
+def test_cancellations_from_other_workers_drop_buckets(service):
+    service._settled = {("day", None, "all"): {SOLD_AT.replace(hour=0, minute=0): {}}}
+    invalidation_bus._handlers[BUS_NAMESPACE] = service._drop
+    invalidation_bus._apply({
+        "namespace": BUS_NAMESPACE, "payload": {"at": None}, "origin": "another-worker"
+    })
+    assert service._settled == {}